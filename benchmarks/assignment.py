@@ -0,0 +1,41 @@
+"""
+Бенчмарк распределения подопечных: от 2 до 1 000 000 участников.
+
+Запуск из корня проекта:
+    python -m benchmarks.assignment
+"""
+import time
+
+from logic.assignment import derangement, single_cycle
+
+SIZES = [2, 10, 100, 1_000, 10_000, 100_000, 1_000_000]
+
+
+def check(assignments: dict, participants: list):
+    assert len(assignments) == len(participants)
+    assert set(assignments.values()) == set(participants)
+    assert all(giver != receiver for giver, receiver in assignments.items())
+
+
+def measure(algorithm, participants: list, repeats: int) -> float:
+    best = float("inf")
+    for seed in range(repeats):
+        started = time.perf_counter()
+        assignments = algorithm(participants, seed=seed)
+        best = min(best, time.perf_counter() - started)
+        check(assignments, participants)
+    return best
+
+
+def main():
+    print(f"{'participants':>12} {'single_cycle, ms':>18} {'derangement, ms':>18} {'ns/participant':>16}")
+    for size in SIZES:
+        participants = list(range(10 ** 9, 10 ** 9 + size))
+        repeats = 5 if size <= 100_000 else 2
+        cycle = measure(single_cycle, participants, repeats)
+        general = measure(derangement, participants, repeats)
+        print(f"{size:>12} {cycle * 1000:>18.3f} {general * 1000:>18.3f} {general / size * 1e9:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
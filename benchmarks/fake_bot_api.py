@@ -0,0 +1,111 @@
+"""
+Заглушка Bot API и сервиса коротких ссылок для нагрузочных тестов.
+
+Отвечает на любые методы бота успешным результатом правдоподобной формы, считает
+вызовы по методам и может добавлять задержку, чтобы имитировать настоящий телеграм.
+Бот направляется сюда переменной TG_API_URL, сокращатель ссылок — SHORTENER_URL.
+
+Отдельный запуск (например, для нагрузки по HTTP на запущенный uvicorn):
+    python -m benchmarks.fake_bot_api --port 8081 --latency 30
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Тайный Санта", "username": "secret_s_a_n_t_a_bot"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0):
+        """
+        :param latency: задержка ответа на каждый вызов, в секундах
+        """
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.shortened = 0
+        self._message_ids = itertools.count(10_000)
+        self._runner: web.AppRunner | None = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle_method)
+        self.app.router.add_get("/shorten", self.handle_shorten)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+        self.shortened = 0
+
+    def _message(self, chat_id) -> dict:
+        chat_id = int(chat_id) if chat_id else 0
+        return {
+            "message_id": next(self._message_ids),
+            "from": BOT_USER,
+            "chat": {"id": chat_id, "type": "private"},
+            "date": int(time.time()),
+            "text": "ok",
+        }
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        name = method.lower()
+        if name == "getme":
+            result = BOT_USER
+        elif name.startswith(("send", "edit", "copy", "forward")):
+            result = self._message(params.get("chat_id"))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_shorten(self, request: web.Request) -> web.Response:
+        self.shortened += 1
+        url = request.query.get("url", "")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(text="https://clck.ru/" + hashlib.sha1(url.encode()).hexdigest()[:6])
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        """
+        Запускает сервер и возвращает его базовый адрес.
+        """
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(port: int, latency: float):
+    api = FakeBotAPI(latency)
+    url = await api.start(port=port)
+    print(f"Fake Bot API: TG_API_URL={url} SHORTENER_URL={url}/shorten")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"calls: {api.total_calls} {dict(api.calls)}, shortened: {api.shortened}")
+    finally:
+        await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0, help="задержка ответа, мс")
+    args = parser.parse_args()
+    asyncio.run(serve(args.port, args.latency / 1000))
@@ -0,0 +1,149 @@
+"""
+Количество запросов к redis на один апдейт: стандартный FSM aiogram против FSM
+с отложенной записью (tg/fsm.py) на последовательностях вызовов из хэндлеров анкеты,
+подарков и создания коробки.
+
+Запросом считается каждая отдельная команда и каждый пайплайн целиком. Скрипт
+завершается с кодом 1, если буферизованный FSM делает больше MAX_ROUND_TRIPS
+запросов на апдейт. Нужен доступный redis из настроек (используется ключ бота BOT_ID).
+
+Запуск из корня проекта:
+    python -m benchmarks.fsm_round_trips
+"""
+import asyncio
+import sys
+from types import SimpleNamespace
+
+from aiogram.dispatcher.middlewares.user_context import EVENT_CONTEXT_KEY, EventContext
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.storage.memory import DisabledEventIsolation
+from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.types import Chat, User
+
+from db.redis_client import redis_client
+from tg.fsm import FSMStorage, BufferedFSMContextMiddleware
+from tg.states import SurveyState, FillGiftsState, CreateBoxState
+
+BOT_ID = 1
+USER_ID = 777_000_001
+# Чтение состояния и данных + запись изменений
+MAX_ROUND_TRIPS = 2
+
+
+async def survey_answer(state):
+    data = await state.get_data()
+    answers = data.get("answers", {})
+    answers["free_time"] = "Катаюсь на велосипеде"
+    await state.update_data(question_index=data.get("question_index", 0) + 1, answers=answers)
+
+
+async def survey_finish(state):
+    data = await state.get_data()
+    answers = data.get("answers", {})
+    answers["gift_wishes"] = "Что-нибудь тёплое"
+    await state.set_state(SurveyState.finished)
+    await state.update_data(answers=answers)
+    await state.update_data(box_id=int(data.get("box_id", 1)))
+    await state.set_state(FillGiftsState.waiting_for_gift_url)
+
+
+async def fill_wishes(state):
+    await state.set_state(SurveyState.waiting_for_answer)
+    await state.update_data(question_index=0, answers={}, box_id=1)
+
+
+async def gift_url(state):
+    await state.update_data(gift_url="https://clck.ru/3Ex2Aa")
+    await state.set_state(FillGiftsState.waiting_for_gift_confirmation)
+
+
+async def box_name(state):
+    await state.update_data(name="Офис 2025")
+    await state.set_state(CreateBoxState.waiting_for_final_reg_date)
+
+
+SCENARIOS = {
+    "survey answer": survey_answer,
+    "survey last answer": survey_finish,
+    "fill_wishes": fill_wishes,
+    "gift url": gift_url,
+    "create box: name": box_name,
+}
+
+
+class RoundTrips:
+    """
+    Считает запросы, которые клиент redis отправляет серверу.
+    """
+
+    def __init__(self, redis):
+        self.count = 0
+        execute_command = redis.execute_command
+        pipeline = redis.pipeline
+
+        async def counted_execute_command(*args, **kwargs):
+            self.count += 1
+            return await execute_command(*args, **kwargs)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            async def counted_execute(*execute_args, **execute_kwargs):
+                self.count += 1
+                return await execute(*execute_args, **execute_kwargs)
+
+            pipe.execute = counted_execute
+            return pipe
+
+        redis.execute_command = counted_execute_command
+        redis.pipeline = counted_pipeline
+
+
+async def run_update(middleware, scenario) -> None:
+    async def handler(event, data):
+        await scenario(data["state"])
+
+    data = {
+        "bot": SimpleNamespace(id=BOT_ID),
+        EVENT_CONTEXT_KEY: EventContext(chat=Chat(id=USER_ID, type="private"),
+                                        user=User(id=USER_ID, is_bot=False, first_name="Санта")),
+    }
+    await middleware(handler, None, data)
+
+
+async def main() -> int:
+    storage = FSMStorage(redis=redis_client.redis)
+    counter = RoundTrips(redis_client.redis)
+    middlewares = {
+        "aiogram": FSMContextMiddleware(storage=RedisStorage(redis=redis_client.redis),
+                                        events_isolation=DisabledEventIsolation()),
+        "buffered": BufferedFSMContextMiddleware(storage=storage, events_isolation=DisabledEventIsolation()),
+    }
+
+    key = middlewares["buffered"].resolve_context(SimpleNamespace(id=BOT_ID), USER_ID, USER_ID).key
+    failed = False
+    print(f"{'update':<22}{'aiogram':>10}{'buffered':>10}")
+    try:
+        for name, scenario in SCENARIOS.items():
+            round_trips = {}
+            for kind, middleware in middlewares.items():
+                # Одинаковое исходное состояние для обоих вариантов
+                await storage.save(key, SurveyState.waiting_for_answer.state, {"question_index": 3, "box_id": 1})
+                counter.count = 0
+                await run_update(middleware, scenario)
+                round_trips[kind] = counter.count
+            print(f"{name:<22}{round_trips['aiogram']:>10}{round_trips['buffered']:>10}")
+            failed |= round_trips["buffered"] > MAX_ROUND_TRIPS
+        await storage.save(key, None, {})
+    finally:
+        await redis_client.close()
+
+    if failed:
+        print(f"\nBuffered FSM made more than {MAX_ROUND_TRIPS} Redis round trips for an update")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
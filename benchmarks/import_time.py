@@ -0,0 +1,93 @@
+"""
+Бюджет времени импорта точек входа: веб-приложения (main), celery и alembic (db/env.py).
+
+Каждая точка входа импортируется в отдельном процессе с python -X importtime, время
+считается как сумма cumulative по импортам верхнего уровня, из нескольких запусков
+берётся минимальное. Дополнительно проверяется, что celery и alembic не тянут aiogram,
+а импорт main не создаёт бота. Скрипт завершается с кодом 1, если бюджет превышен
+или проверка не прошла.
+
+Бюджеты в миллисекундах переопределяются переменными окружения IMPORT_BUDGET_MAIN,
+IMPORT_BUDGET_CELERY, IMPORT_BUDGET_ALEMBIC.
+
+Запуск из корня проекта:
+    python -m benchmarks.import_time
+"""
+import json
+import os
+import subprocess
+import sys
+
+RUNS = 3
+
+PROBE = """
+import json, sys
+loader = sys.modules.get("tg.loader")
+print("@@" + json.dumps({
+    "aiogram": "aiogram" in sys.modules,
+    "bot": bool(loader and loader._bot is not None),
+}))
+"""
+
+ALEMBIC = """
+import contextlib, io
+from alembic.config import main
+with contextlib.redirect_stdout(io.StringIO()):
+    main(["-c", "alembic.ini", "upgrade", "head", "--sql"])
+"""
+
+# имя: (код, бюджет по умолчанию в мс, переменная окружения, может ли импортировать aiogram)
+# Бюджет main — измеренные после ленивой инициализации 4.1-4.4 с (минимум из RUNS, почти всё
+# время — модели aiogram.types) плюс ~10%: заметная регрессия импорта должна ронять проверку
+TARGETS = {
+    "main": ("import main", 4800, "IMPORT_BUDGET_MAIN", True),
+    "celery_app.app": ("import celery_app.app", 500, "IMPORT_BUDGET_CELERY", False),
+    "db.env": (ALEMBIC, 2000, "IMPORT_BUDGET_ALEMBIC", False),
+}
+
+
+def measure(code: str) -> tuple[float, dict]:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code + PROBE],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Импорты верхнего уровня записываются без отступа
+        if name.startswith(" ") and not name.startswith("  "):
+            total += int(cumulative)
+    probe = next(line for line in result.stdout.splitlines() if line.startswith("@@"))
+    return total / 1000, json.loads(probe[2:])
+
+
+def main() -> int:
+    failed = []
+    for name, (code, default_budget, budget_env, allows_aiogram) in TARGETS.items():
+        budget = float(os.getenv(budget_env, default_budget))
+        runs = [measure(code) for _ in range(RUNS)]
+        elapsed = min(total for total, _ in runs)
+        probe = runs[0][1]
+
+        problems = []
+        if elapsed > budget:
+            problems.append(f"over budget of {budget:.0f} ms")
+        if probe["aiogram"] and not allows_aiogram:
+            problems.append("imports aiogram")
+        if probe["bot"]:
+            problems.append("creates a Bot at import time")
+        print(f"{name:<16} {elapsed:8.1f} ms  {'; '.join(problems) or 'ok'}")
+        if problems:
+            failed.append(name)
+
+    if failed:
+        print(f"\nImport budget check failed for: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Накладные расходы StripMiddleware на запрос: прежняя реализация на BaseHTTPMiddleware
+против текущей ASGI-реализации, на апдейтах телеграма реалистичного размера.
+
+Запуск из корня проекта:
+    python -m benchmarks.strip_middleware
+"""
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from benchmarks.asgi import request
+from benchmarks.updates import message_update, callback_update
+from main import StripMiddleware, strip_strings
+
+REQUESTS = 2000
+
+
+class LegacyStripMiddleware(BaseHTTPMiddleware):
+    """
+    Реализация до перехода на ASGI: буферизация, json.loads, полный обход и json.dumps для каждого POST.
+    """
+
+    async def dispatch(self, request, call_next):
+        try:
+            if request.method in ["POST", "PUT", "PATCH"] and not "/admin" in request.url.path:
+                body = await request.body()
+                if body:
+                    request._body = json.dumps(strip_strings(json.loads(body))).encode("utf-8")
+        except:
+            pass
+        return await call_next(request)
+
+
+def build_app(middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/bot/webhook")
+    async def webhook(update: dict):
+        return {"status": "ok"}
+
+    @app.post("/api/echo")
+    async def echo(data: dict):
+        return {"status": "ok"}
+
+    if middleware:
+        app.add_middleware(middleware)
+    return app
+
+
+async def measure(app, path: str, bodies: list[bytes]) -> float:
+    started = time.perf_counter()
+    for body in bodies:
+        status, _ = await request(app, "POST", path, body)
+        assert status == 200, status
+    return (time.perf_counter() - started) / len(bodies) * 1e6
+
+
+async def main():
+    payloads = {
+        "message (~0.5 KB)": message_update(123456789, "Люблю настолки и кофе"),
+        "callback (~3 KB)": callback_update(123456789, "select_box:42"),
+    }
+    apps = {
+        "no middleware": build_app(None),
+        "legacy BaseHTTPMiddleware": build_app(LegacyStripMiddleware),
+        "ASGI StripMiddleware": build_app(StripMiddleware),
+    }
+    print(f"{'payload':<20} {'path':<14} {'app':<28} {'µs/request':>10}")
+    for payload_name, payload in payloads.items():
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        for path in ("/bot/webhook", "/api/echo"):
+            for app_name, app in apps.items():
+                await measure(app, path, [body] * 100)
+                result = await measure(app, path, [body] * REQUESTS)
+                print(f"{payload_name:<20} {path:<14} {app_name:<28} {result:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+"""
+Реалистичные апдейты телеграма для бенчмарков.
+"""
+import itertools
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Иван", "last_name": "Петров",
+            "username": f"user{user_id}", "language_code": "ru"}
+
+
+def message_update(user_id: int, text: str) -> dict:
+    update = {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": 1000,
+            "from": _user(user_id),
+            "chat": {"id": user_id, "first_name": "Иван", "last_name": "Петров",
+                     "username": f"user{user_id}", "type": "private"},
+            "date": 1734000000,
+            "text": text,
+        },
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        update["message"]["entities"] = [{"offset": 0, "length": len(command), "type": "bot_command"}]
+    return update
+
+
+def callback_update(user_id: int, data: str, buttons: int = 6) -> dict:
+    keyboard = [[{"text": f"🎁Кнопка {i}", "callback_data": f"select_box:{i}"}] for i in range(buttons)]
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "message": {
+                "message_id": 1001,
+                "from": {"id": 1, "is_bot": True, "first_name": "Тайный Санта", "username": "secret_s_a_n_t_a_bot"},
+                "chat": {"id": user_id, "first_name": "Иван", "username": f"user{user_id}", "type": "private"},
+                "date": 1734000000,
+                "text": "ℹ️Информация о коробке Офис 2025:\n\n⌛️Окончание регистрации участников: 20.12.2025\n"
+                        "🤑Максимальная сумма подарка: 1500.0₽\n🎁Вручение: 27.12.2025" + "\n→ Участник ✅" * 30,
+                "reply_markup": {"inline_keyboard": keyboard},
+            },
+            "chat_instance": "-123456789",
+            "data": data,
+        },
+    }
@@ -0,0 +1,266 @@
+"""
+Нагрузочный тест вебхука на синтетическом потоке апдейтов.
+
+Сценарий на каждую коробку: администратор и участники вступают по /start <join_code>,
+проходят анкету из 9 вопросов, добавляют подарок по ссылке, открывают карточку коробки,
+после чего администратор проводит жеребьёвку. Апдейты одного пользователя идут строго
+по очереди (как их доставляет телеграм), разные пользователи — параллельно.
+
+Бот и сокращатель ссылок направляются на локальную заглушку (benchmarks/fake_bot_api.py).
+Нужны пустые Postgres (схема накатывается alembic) и Redis из настроек .env: тест создаёт
+пользователей с id от USER_ID_BASE и коробки с ними.
+
+В режиме по умолчанию main.app вызывается в том же процессе, жеребьёвка celery
+выполняется синхронно (task_always_eager). С --url апдейты отправляются по HTTP на уже
+запущенный сервер; в этом режиме сервер и celery-воркер должны быть запущены с
+TG_API_URL и SHORTENER_URL, указывающими на заглушку (--api-port), а число SQL-запросов
+не измеряется. С WEBHOOK_FAST_ACK задержка апдейта — это время до ответа вебхука, а
+общая длительность включает дообработку очереди. Чтобы мерить само приложение, а не
+ограничитель исходящих сообщений, поднимите TG_CHAT_RATE и TG_GLOBAL_RATE.
+
+Результат — задержки p50/p95/p99 по типам апдейтов, пропускная способность, SQL-запросы
+и вызовы Bot API на апдейт — печатается и сохраняется в JSON для сравнения прогонов.
+
+Запуск из корня проекта:
+    python -m benchmarks.webhook_load --boxes 10 --box-size 30 --concurrency 50
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from benchmarks.asgi import request
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.updates import message_update, callback_update
+
+USER_ID_BASE = 9_100_000_000
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+SURVEY_ANSWERS = [
+    "Катаюсь на велосипеде и собираю пазлы", "Горячая ванна и сериал", "Зелёный",
+    "Что-то полезное", "Сюрприз", "Нет", "Гарри Поттер, Queen", "Кофе и книги", "Что-нибудь тёплое",
+]
+GIFT_URLS = [
+    "https://www.ozon.ru/product/termokruzhka-{n}/",
+    "https://www.wildberries.ru/catalog/{n}/detail.aspx",
+    "https://market.yandex.ru/product--pled/{n}",
+]
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def at(q: float) -> float:
+        return round(values[min(len(values) - 1, math.ceil(q * len(values)) - 1)] * 1000, 2)
+
+    return {"count": len(values), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": at(1.0)}
+
+
+class InProcessSender:
+    def __init__(self, app):
+        self.app = app
+
+    async def send(self, body: bytes) -> int:
+        status, _ = await request(self.app, "POST", "/bot/webhook", body)
+        return status
+
+    async def close(self):
+        pass
+
+
+class HttpSender:
+    def __init__(self, url: str, concurrency: int):
+        self.url = url.rstrip("/") + "/bot/webhook"
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency))
+
+    async def send(self, body: bytes) -> int:
+        async with self.session.post(self.url, data=body, headers={"content-type": "application/json"}) as response:
+            await response.read()
+            return response.status
+
+    async def close(self):
+        await self.session.close()
+
+
+class LoadTest:
+    def __init__(self, sender, concurrency: int):
+        self.sender = sender
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors = 0
+
+    async def send(self, kind: str, update: dict):
+        body = json.dumps(update).encode()
+        started = time.perf_counter()
+        status = await self.sender.send(body)
+        self.latencies[kind].append(time.perf_counter() - started)
+        if status != 200:
+            self.errors += 1
+
+    async def run_user(self, script: list[tuple[str, dict]]):
+        async with self.semaphore:
+            for kind, update in script:
+                await self.send(kind, update)
+
+    @property
+    def updates(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+
+def participant_script(user_id: int, box_id: int, join_code: str) -> list[tuple[str, dict]]:
+    script = [("start", message_update(user_id, f"/start {join_code}"))]
+    script += [("survey", message_update(user_id, answer)) for answer in SURVEY_ANSWERS]
+    gift_url = random.choice(GIFT_URLS).format(n=random.randint(10_000, 99_999_999))
+    script += [
+        ("gift_url", message_update(user_id, gift_url)),
+        ("callback", callback_update(user_id, "gift_is_exact:1")),
+        ("callback", callback_update(user_id, "exit_gift_filling")),
+        ("box_card", callback_update(user_id, f"select_box:{box_id}")),
+    ]
+    return script
+
+
+async def seed_boxes(boxes: int, box_size: int) -> list[dict]:
+    """
+    Создаёт администраторов и коробки. Участники регистрируются сами через /start.
+    """
+    from db.db_config import sessionmanager
+    from db.models import User, Box
+
+    now = datetime.datetime.now()
+    seeded = []
+    async with sessionmanager.session() as db:
+        for number in range(boxes):
+            admin_id = USER_ID_BASE + number * (box_size + 1)
+            db.add(User(id=admin_id, username=f"user{admin_id}", full_name="Администратор"))
+            box = Box(name=f"Нагрузка {number}", join_code=f"load{admin_id}", admin_id=admin_id,
+                      final_reg_date=now + datetime.timedelta(days=7), max_gift_price=1500,
+                      gift_date=now + datetime.timedelta(days=14))
+            db.add(box)
+            await db.flush()
+            seeded.append({"id": box.id, "join_code": box.join_code, "admin_id": admin_id,
+                           "participants": [admin_id + i for i in range(1, box_size)]})
+        await db.commit()
+    return seeded
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    api_url = await api.start(port=args.api_port)
+    # Настройки читаются при импорте config, поэтому приложение импортируется после этого
+    os.environ["TG_API_URL"] = api_url
+    os.environ["SHORTENER_URL"] = api_url + "/shorten"
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    from celery_app.app import app as celery_app
+
+    db_queries = 0
+
+    def count_query(*_):
+        nonlocal db_queries
+        db_queries += 1
+
+    if args.url:
+        sender = HttpSender(args.url, args.concurrency)
+        lifespan = None
+    else:
+        from main import app
+        from tg.index import pipeline
+        celery_app.conf.task_always_eager = True
+        event.listen(Engine, "before_cursor_execute", count_query)
+        sender = InProcessSender(app)
+        lifespan = app.router.lifespan_context(app)
+
+    random.seed(args.seed)
+    try:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        boxes = await seed_boxes(args.boxes, args.box_size)
+        api.reset()
+        db_queries = 0
+        load = LoadTest(sender, args.concurrency)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            load.run_user(participant_script(user_id, box["id"], box["join_code"]))
+            for box in boxes for user_id in [box["admin_id"], *box["participants"]]
+        ))
+        await asyncio.gather(*(
+            load.run_user([("box_card", callback_update(box["admin_id"], f"select_box:{box['id']}")),
+                           ("draw", callback_update(box["admin_id"], f"shuffle_box:{box['id']}"))])
+            for box in boxes
+        ))
+        if lifespan is not None:
+            # В режиме WEBHOOK_FAST_ACK апдейты обрабатываются после ответа вебхука
+            await pipeline.join()
+        duration = time.perf_counter() - started
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+        await sender.close()
+        await api.stop()
+
+    all_latencies = [value for values in load.latencies.values() for value in values]
+    return {
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "mode": "http" if args.url else "in-process",
+        "params": {"boxes": args.boxes, "box_size": args.box_size, "concurrency": args.concurrency,
+                   "api_latency_ms": args.api_latency, "seed": args.seed},
+        "updates": load.updates,
+        "errors": load.errors,
+        "duration_s": round(duration, 3),
+        "throughput_ups": round(load.updates / duration, 2),
+        "latency_ms": {"all": percentiles(all_latencies),
+                       **{kind: percentiles(values) for kind, values in load.latencies.items()}},
+        "db_queries_per_update": None if args.url else round(db_queries / load.updates, 2),
+        "telegram_calls_per_update": round(api.total_calls / load.updates, 2),
+        "telegram_calls": dict(api.calls),
+        "shortener_calls": api.shortened,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест вебхука")
+    parser.add_argument("--boxes", type=int, default=5, help="количество коробок")
+    parser.add_argument("--box-size", type=int, default=20, help="участников в коробке, включая администратора")
+    parser.add_argument("--concurrency", type=int, default=50, help="пользователей одновременно")
+    parser.add_argument("--url", help="адрес запущенного сервера; по умолчанию main.app в этом процессе")
+    parser.add_argument("--api-port", type=int, default=8081, help="порт заглушки Bot API")
+    parser.add_argument("--api-latency", type=float, default=0, help="задержка ответа заглушки Bot API, мс")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="файл для результатов, по умолчанию benchmarks/results/")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    print(f"{result['updates']} updates in {result['duration_s']} s, {result['throughput_ups']} updates/s, "
+          f"errors: {result['errors']}")
+    print(f"{'type':<10}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  ms")
+    for kind, stats in result["latency_ms"].items():
+        print(f"{kind:<10}{stats['count']:>8}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+    print(f"SQL queries per update: {result['db_queries_per_update']}, "
+          f"Bot API calls per update: {result['telegram_calls_per_update']}")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"webhook_load_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print(f"Saved to {output}")
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
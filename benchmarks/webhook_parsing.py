@@ -0,0 +1,80 @@
+"""
+CPU-стоимость приёма апдейта вебхуком: прежний разбор (FastAPI -> dict, ручной поиск
+from.id, Update.model_validate) против текущего (сырые байты -> Update.model_validate_json).
+Обработка апдейта диспатчером заменена пустой функцией, чтобы измерять только приём.
+
+Запуск из корня проекта:
+    python -m benchmarks.webhook_parsing
+"""
+import asyncio
+import json
+import time
+
+from aiogram.types import Update
+from fastapi import FastAPI, Depends
+
+import tg.index
+from benchmarks.asgi import request
+from benchmarks.updates import message_update, callback_update
+from tg.loader import get_bot
+
+REQUESTS = 3000
+
+
+async def no_db():
+    yield None
+
+
+async def skip_processing(db, update, from_id):
+    pass
+
+
+async def skip_processing_in_session(update, from_id):
+    pass
+
+
+def build_legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/bot/webhook")
+    async def bot_webhook(update: dict, db=Depends(no_db)):
+        update_object = Update.model_validate(update, context={"bot": get_bot()})
+        from_id = (update.get("message", {}).get("from", {}).get("id", None)
+                   or update.get("callback_query", {}).get("from", {}).get("id", None))
+        await skip_processing(db, update_object, from_id)
+        return {"status": "ok"}
+
+    return app
+
+
+def build_current_app() -> FastAPI:
+    tg.index.process_update_in_session = skip_processing_in_session
+    app = FastAPI(default_response_class=tg.index.ORJSONResponse)
+    app.include_router(tg.index.bot_router)
+    return app
+
+
+async def measure(app, bodies: list[bytes]) -> float:
+    started = time.process_time()
+    for body in bodies:
+        status, _ = await request(app, "POST", "/bot/webhook", body)
+        assert status == 200, status
+    return (time.process_time() - started) / len(bodies) * 1e6
+
+
+async def main():
+    payloads = {
+        "message (~0.5 KB)": lambda: message_update(123456789, "/start abcdEFGH"),
+        "callback (~3 KB)": lambda: callback_update(123456789, "select_box:42"),
+    }
+    apps = {"legacy dict + model_validate": build_legacy_app(), "raw bytes + model_validate_json": build_current_app()}
+    print(f"{'payload':<20} {'endpoint':<34} {'CPU µs/update':>14}")
+    for payload_name, make_payload in payloads.items():
+        bodies = [json.dumps(make_payload(), ensure_ascii=False).encode() for _ in range(REQUESTS)]
+        for app_name, app in apps.items():
+            await measure(app, bodies[:200])
+            print(f"{payload_name:<20} {app_name:<34} {await measure(app, bodies):>14.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -11,6 +11,10 @@ app.conf.update(
     timezone="Asia/Novosibirsk",
     enable_utc=True,
     beat_schedule={
+        'sweep_fsm': {  # Очистка брошенных диалогов FSM в redis
+            'task': 'celery_app.tasks.sweep_fsm',
+            'schedule': crontab(minute=30),
+        },
         # 'subscription_autopay': {   # Автопродление за сутки до окончания подписки
         #     'task': 'celery_app.tasks_payment.subscription_autopay',
         #     'schedule': 60,
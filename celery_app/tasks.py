@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import time
+from dataclasses import asdict
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy import select, text, bindparam, BigInteger
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from celery_app.app import app
+from db.db_config import DatabaseSessionManager, config
+from db.models import User, UserRoom, BoxExclusion
+from db.redis_client import AsyncRedisClient
+from logic.matching import match, MatchingError
+from tg.fsm import FSMStorage
+from tg.loader import create_bot
+from tg.outbound import bulk_priority
+
+# Сколько уведомлений отправляется одновременно
+NOTIFY_CHUNK_SIZE = 25
+# Не чаще, чем раз в столько секунд обновляется сообщение с прогрессом
+PROGRESS_INTERVAL = 3
+# Время жизни блокировки жеребьёвки коробки
+DRAW_LOCK_TTL = 60 * 60
+# Сколько ключей FSM проверяется за один SCAN при очистке
+FSM_SWEEP_BATCH = 500
+# Сколько участников перечисляется в сообщении о невозможной жеребьёвке: остальные
+# считаются числом, чтобы сообщение уложилось в лимит телеграма в 4096 символов
+MATCHING_ERROR_NAMES = 10
+
+
+def draw_lock_key(box_id: int) -> str:
+    return f"draw_box:{box_id}"
+
+
+def back_to_box_kb(box_id: int) -> types.InlineKeyboardMarkup:
+    return types.InlineKeyboardMarkup(
+        inline_keyboard=[[types.InlineKeyboardButton(text="🔙 Вернуться к коробке", callback_data=f"select_box:{box_id}")]]
+    )
+
+
+class DrawProgress:
+    """
+    Обновляет сообщение администратора с прогрессом рассылки не чаще раза в PROGRESS_INTERVAL секунд.
+    """
+
+    def __init__(self, bot: Bot, chat_id: int, message_id: int, total: int = 0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.total = total
+        self._last_update = 0.0
+
+    async def edit(self, text: str, reply_markup: types.InlineKeyboardMarkup | None = None):
+        try:
+            await self.bot.edit_message_text(text=text, chat_id=self.chat_id, message_id=self.message_id,
+                                             reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            # Текст не изменился или сообщение удалено — прогресс не критичен
+            logging.warning(f"Failed to update draw progress: {e}")
+        self._last_update = time.monotonic()
+
+    async def report(self, sent: int):
+        if time.monotonic() - self._last_update < PROGRESS_INTERVAL:
+            return
+        await self.edit(f"📨 Жеребьёвка проведена, рассылаем уведомления: {sent}/{self.total}")
+
+
+# Одним запросом отмечает коробку проведённой и записывает всех подопечных.
+# Если коробка уже отмечена (параллельная жеребьёвка успела раньше), CTE claimed пуст
+# и не обновляется ни одна строка: конкурирующий запрос ждёт блокировку строки boxes
+# и после неё заново проверяет drawn_at IS NULL. Так же ничего не записывается, если
+# число участников коробки уже не совпадает с жеребьёвкой: кто-то вступил после чтения
+# состава и остался бы без санты и подопечного. Вышедших участников ловит проверка rowcount.
+SAVE_ASSIGNMENTS = text("""
+    WITH roster AS (
+        SELECT count(*) AS size FROM user_room WHERE box_id = :box_id
+    ), claimed AS (
+        UPDATE boxes SET drawn_at = now()
+        FROM roster
+        WHERE boxes.id = :box_id AND boxes.drawn_at IS NULL AND roster.size = cardinality(:givers)
+        RETURNING boxes.id
+    )
+    UPDATE user_room SET user_gift_to_id = assignment.receiver_id
+    FROM claimed, unnest(:givers, :receivers) AS assignment(giver_id, receiver_id)
+    WHERE user_room.box_id = claimed.id AND user_room.user_id = assignment.giver_id
+""").bindparams(
+    bindparam("givers", type_=ARRAY(BigInteger)),
+    bindparam("receivers", type_=ARRAY(BigInteger)),
+)
+
+
+async def save_assignments(db: AsyncSession, box_id: int, assignments: dict[int, int]) -> bool:
+    """
+    Записывает результат жеребьёвки одним запросом в одной транзакции.
+    :return: False, если коробка уже разыграна или состав участников изменился — транзакция откатывается
+    """
+    result = await db.execute(SAVE_ASSIGNMENTS, {
+        "box_id": box_id,
+        "givers": list(assignments.keys()),
+        "receivers": list(assignments.values()),
+    })
+    if result.rowcount != len(assignments):
+        await db.rollback()
+        return False
+    await db.commit()
+    return True
+
+
+async def assign_receivers(db: AsyncSession, box_id: int) -> list[int] | str:
+    """
+    Распределение подопечных коробки. Возвращает список участников для уведомления
+    или текст ошибки для администратора.
+    """
+    user_rooms = await UserRoom.get_by_kwargs(db, multiple=True, box_id=box_id)
+    if any(user_room.user_gift_to_id for user_room in user_rooms):
+        return "🎲 Жеребьевка в этой коробке уже проведена."
+    if len(user_rooms) < 2:
+        return "❌ Недостаточно участников для жеребьевки. Минимум 2 участника."
+    if any(user_room.profile == {} for user_room in user_rooms):
+        return "❌ Не все участники заполнили свои пожелания."
+
+    user_ids = [user_room.user_id for user_room in user_rooms]
+    exclusions = await BoxExclusion.get_by_kwargs(db, multiple=True, box_id=box_id)
+    try:
+        assignments = match(user_ids, [(exclusion.giver_id, exclusion.receiver_id) for exclusion in exclusions])
+    except MatchingError as e:
+        shown = e.givers[:MATCHING_ERROR_NAMES]
+        users = await db.execute(select(User).where(User.id.in_(shown)))
+        names = ", ".join(f"{user.full_name} (@{user.username})" for user in users.scalars().all())
+        if len(e.givers) > len(shown):
+            names += f" и ещё {len(e.givers) - len(shown)}"
+        return (f"❌ Жеребьёвку невозможно провести с текущими исключениями: участникам {names} "
+                f"не хватает допустимых подопечных ({len(e.receivers)} на {len(e.givers)} чел.). "
+                f"Уберите часть исключений и попробуйте снова.")
+
+    # Назначение подопечных (receiver) для каждого участника
+    if not await save_assignments(db, box_id, assignments):
+        return "🎲 Жеребьевка в этой коробке уже проведена или состав участников изменился, попробуйте снова."
+    return user_ids
+
+
+async def notify_participants(bot: Bot, box_id: int, user_ids: list[int], progress: DrawProgress) -> int:
+    """
+    Рассылка уведомлений участникам пачками. Возвращает количество недоставленных.
+    """
+    kb = types.InlineKeyboardMarkup(inline_keyboard=[[
+        types.InlineKeyboardButton(text="🧑‍🎄Мой подопечный", callback_data=f"receiver_card:{box_id}")
+    ]])
+    failed = 0
+    for start in range(0, len(user_ids), NOTIFY_CHUNK_SIZE):
+        chunk = user_ids[start:start + NOTIFY_CHUNK_SIZE]
+        results = await asyncio.gather(*[
+            bot.send_message(chat_id=user_id,
+                             text=f"🧑‍🎄Тебе назначен подопечный на Тайного Санту. Скорее открывай его профиль "
+                                  f"и готовься дарить подарок!",
+                             reply_markup=kb)
+            for user_id in chunk
+        ], return_exceptions=True)
+        for user_id, result in zip(chunk, results):
+            if isinstance(result, Exception):
+                failed += 1
+                logging.warning(f"Failed to notify {user_id} about draw in box {box_id}: {result}")
+        await progress.report(start + len(chunk))
+    return failed
+
+
+async def run_draw(box_id: int, chat_id: int, message_id: int):
+    sessionmanager = DatabaseSessionManager()
+    sessionmanager.init(config.DB_CONFIG)
+    redis_client = AsyncRedisClient()
+    bot = create_bot(redis_client)
+    try:
+        async with sessionmanager.session() as db:
+            result = await assign_receivers(db, box_id)
+        if isinstance(result, str):
+            # Жеребьёвка не состоялась — снимаем блокировку, чтобы её можно было повторить
+            await redis_client.delete(draw_lock_key(box_id))
+            return await DrawProgress(bot, chat_id, message_id).edit(result, reply_markup=back_to_box_kb(box_id))
+
+        progress = DrawProgress(bot, chat_id, message_id, total=len(result))
+        await progress.edit(f"📨 Жеребьёвка проведена, рассылаем уведомления: 0/{len(result)}")
+        with bulk_priority():
+            failed = await notify_participants(bot, box_id, result, progress)
+        text = "🎲 Жеребьевка завершена! Всем участникам назначены подопечные для вручения подарков."
+        if failed:
+            text += f"\n\n⚠️ Не удалось доставить уведомление {failed} участникам — возможно, они заблокировали бота."
+        await progress.edit(text, reply_markup=back_to_box_kb(box_id))
+    except Exception:
+        await redis_client.delete(draw_lock_key(box_id))
+        raise
+    finally:
+        await bot.session.close()
+        await redis_client.close()
+        await sessionmanager.close()
+
+
+@app.task(name="celery_app.tasks.draw_box", ignore_result=True)
+def draw_box(box_id: int, chat_id: int, message_id: int):
+    """
+    Жеребьёвка коробки и рассылка уведомлений участникам.
+    Запускается только через start_draw: повторный запуск для той же коробки блокируется.
+    """
+    asyncio.run(run_draw(box_id, chat_id, message_id))
+
+
+async def start_draw(redis_client: AsyncRedisClient, box_id: int, chat_id: int, message_id: int) -> bool:
+    """
+    Ставит жеребьёвку коробки в очередь. Возвращает False, если она уже запущена.
+    Если задачу не удалось поставить в очередь, блокировка снимается, а ошибка пробрасывается.
+    """
+    if not await redis_client.acquire(draw_lock_key(box_id), DRAW_LOCK_TTL):
+        return False
+    try:
+        await asyncio.to_thread(draw_box.delay, box_id, chat_id, message_id)
+    except Exception:
+        # Задача не поставлена (например, брокер недоступен) — иначе коробка была бы заблокирована на час
+        await redis_client.delete(draw_lock_key(box_id))
+        raise
+    return True
+
+
+async def run_fsm_sweep() -> dict:
+    redis_client = AsyncRedisClient()
+    try:
+        stats = await FSMStorage(redis=redis_client.redis).sweep(FSM_SWEEP_BATCH)
+    finally:
+        await redis_client.close()
+    logging.info(f"FSM sweep: scanned {stats.scanned} keys, deleted {stats.deleted}, "
+                 f"set TTL on {stats.expire_set}, reclaimed {stats.bytes_reclaimed} bytes "
+                 f"(used_memory {stats.used_memory_before} -> {stats.used_memory_after})")
+    return asdict(stats)
+
+
+@app.task(name="celery_app.tasks.sweep_fsm")
+def sweep_fsm() -> dict:
+    """
+    Очистка брошенных диалогов FSM в redis. Возвращает статистику, в том числе освобождённую память.
+    """
+    return asyncio.run(run_fsm_sweep())
@@ -15,9 +15,34 @@ DB_NAME = os.getenv("DB_NAME")
 REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PORT = os.getenv("REDIS_PORT")
 REDIS_DB = os.getenv("REDIS_DB")
+# Кодек значений кэшей в redis: orjson или msgpack (см. db/redis_client.py)
+REDIS_CODEC = os.getenv("REDIS_CODEC", "orjson")
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Адрес своего сервера Bot API (telegram-bot-api или тестовая заглушка), по умолчанию api.telegram.org
+TG_API_URL = os.getenv("TG_API_URL")
 ADMIN_CHAT_ID = int(os.getenv("ADMIN_CHAT_ID"))
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
 THREAD_ID = int(os.getenv("THREAD_ID"))
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Быстрый ответ вебхука: апдейты обрабатываются в фоне пулом воркеров (см. tg/pipeline.py)
+WEBHOOK_FAST_ACK = os.getenv("WEBHOOK_FAST_ACK", "0") == "1"
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 16))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+SHORTENER_URL = os.getenv("SHORTENER_URL", "https://clck.ru/--")
+
+# Максимум SQL-запросов на один апдейт. В строгом режиме превышение прерывает обработку
+DB_QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET", 15))
+DB_QUERY_BUDGET_STRICT = os.getenv("DB_QUERY_BUDGET_STRICT", "0") == "1"
+
+# Ограничения исходящих запросов к Bot API (см. tg/outbound.py)
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", 30))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", 1))
+TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", 3))
+TG_CONCURRENCY = int(os.getenv("TG_CONCURRENCY", 20))
+# Сколько сообщений в секунду из общего лимита рассылки оставляют интерактивным ответам
+TG_BULK_RESERVE = float(os.getenv("TG_BULK_RESERVE", 10))
+
+# Логирование: уровень и доля апдейтов, которые пишутся в лог целиком
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0.01))
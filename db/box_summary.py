@@ -0,0 +1,98 @@
+"""
+Сводка по коробке для экрана select_box_root.
+
+Данные коробки, участие пользователя, число его подарков и список участников
+(только для администратора) собираются одним SQL-запросом: участие — через
+LEFT JOIN, подарки и участники — агрегатами в скалярных подзапросах.
+"""
+import datetime
+from dataclasses import dataclass, field
+
+from sqlalchemy import select, func, case, cast, and_, JSON
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from db.models import Box, UserRoom, Gift, User
+
+
+@dataclass(slots=True)
+class ParticipantSummary:
+    full_name: str
+    username: str | None
+    wishes_filled: bool
+
+
+@dataclass(slots=True)
+class BoxSummary:
+    id: int
+    name: str
+    final_reg_date: datetime.datetime
+    max_gift_price: float
+    gift_date: datetime.datetime
+    admin_id: int
+    # Участие пользователя, для которого строилась сводка
+    is_member: bool
+    wishes_filled: bool
+    receiver_id: int | None
+    gifts_count: int
+    # Заполняется только если пользователь — администратор коробки
+    participants: list[ParticipantSummary] = field(default_factory=list)
+
+    @property
+    def shuffled(self) -> bool:
+        return self.receiver_id is not None
+
+
+def _wishes_filled(room):
+    # profile хранится как json, у которого нет оператора сравнения, поэтому сравниваем как jsonb
+    return func.coalesce(cast(room.profile, JSONB) != func.jsonb_build_object(), False)
+
+
+async def get_box_summary(db: AsyncSession, box_id: int, user_id: int) -> BoxSummary | None:
+    """
+    Сводка по коробке глазами пользователя user_id.
+    :return: BoxSummary или None, если коробки нет
+    """
+    me = aliased(UserRoom)
+    member = aliased(UserRoom)
+
+    gifts_count = (
+        select(func.count(Gift.id))
+        .where(Gift.box_id == Box.id, Gift.user_id == user_id)
+        .scalar_subquery()
+    )
+    roster = (
+        select(func.json_agg(
+            func.json_build_object(
+                "full_name", User.full_name,
+                "username", User.username,
+                "wishes_filled", _wishes_filled(member),
+            ),
+            type_=JSON,
+        ))
+        .select_from(member)
+        .join(User, User.id == member.user_id)
+        .where(member.box_id == Box.id)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(
+            Box.id, Box.name, Box.final_reg_date, Box.max_gift_price, Box.gift_date, Box.admin_id,
+            me.user_id.is_not(None).label("is_member"),
+            _wishes_filled(me).label("wishes_filled"),
+            me.user_gift_to_id.label("receiver_id"),
+            gifts_count.label("gifts_count"),
+            # Подзапрос со списком участников выполняется только для администратора
+            case((Box.admin_id == user_id, roster)).label("participants"),
+        )
+        .outerjoin(me, and_(me.box_id == Box.id, me.user_id == user_id))
+        .where(Box.id == box_id)
+    )
+    row = (await db.execute(stmt)).mappings().first()
+    if row is None:
+        return None
+
+    data = dict(row)
+    data["participants"] = [ParticipantSummary(**participant) for participant in data["participants"] or ()]
+    return BoxSummary(**data)
@@ -1,9 +1,11 @@
 import contextlib
 import os
-from typing import AsyncIterator
+import time
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import event, exc
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     create_async_engine,
@@ -11,7 +13,10 @@ from sqlalchemy.ext.asyncio import (
     AsyncConnection,
     AsyncSession,
 )
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from db.slow_queries import SlowQueryLog
 
 load_dotenv()
 
@@ -24,29 +29,164 @@ class Config:
         DB_PORT=os.getenv("DB_PORT", "5432"),
         DB_NAME=os.getenv("DB_NAME", "postgres"),
     )
-    DB_SYNC_CONFIG = "postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}".format(
-        DB_USER=os.getenv("DB_USER", "postgres"),
-        DB_PASSWORD=os.getenv("DB_PASS", "postgres"),
-        DB_HOST=os.getenv("DB_HOST", "127.0.0.1"),
-        DB_PORT=os.getenv("DB_PORT", "5432"),
-        DB_NAME=os.getenv("DB_NAME", "postgres"),
-    )
-
+    # Пул соединений: на каждый процесс (uvicorn-воркер, celery-воркер) свой пул
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+    # Кэш подготовленных выражений asyncpg. За pgbouncer в режиме transaction нужно выставить 0
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+    # Журнал медленных запросов: порог и автоматический EXPLAIN ANALYZE для тяжёлых SELECT
+    DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 100))
+    DB_SLOW_QUERY_EXPLAIN = os.getenv("DB_SLOW_QUERY_EXPLAIN", "1") == "1"
 
 config = Config
 
 Base = declarative_base()
 
 
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    """
+    Счётчик SQL-запросов в рамках одного апдейта. Запрос засчитывается и всем
+    внешним счётчикам (parent), поэтому блоки track_queries можно вкладывать.
+    """
+
+    def __init__(self, budget: int | None = None, strict: bool = False, parent: "QueryStats | None" = None):
+        self.count = 0
+        self.budget = budget
+        self.strict = strict
+        self.parent = parent
+
+    @property
+    def exceeded(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+
+_query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+@contextlib.contextmanager
+def track_queries(budget: int | None = None, strict: bool = False) -> Iterator[QueryStats]:
+    """
+    Считает SQL-запросы, выполненные внутри блока (в том числе во вложенных корутинах).
+    В строгом режиме запрос сверх бюджета завершается исключением QueryBudgetExceeded.
+    """
+    stats = QueryStats(budget, strict, parent=_query_stats.get())
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    stats = _query_stats.get()
+    while stats is not None:
+        stats.count += 1
+        if stats.strict and stats.exceeded:
+            raise QueryBudgetExceeded(f"SQL query budget of {stats.budget} exceeded: {statement}")
+        stats = stats.parent
+
+
+class PoolStats:
+    """
+    Статистика выдачи соединений из пула процесса.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        # Выдачи, которым пришлось ждать освобождения соединения (пул исчерпан)
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def as_dict(self, pool: "InstrumentedPool | None" = None) -> dict:
+        stats = {
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "wait_time": round(self.wait_time, 4),
+            "max_wait": round(self.max_wait, 4),
+            "timeouts": self.timeouts,
+        }
+        if pool is not None:
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=max(pool.overflow(), 0),
+                         saturation=round(pool.checkedout() / capacity, 3) if capacity else 0.0)
+        return stats
+
+
+pool_stats = PoolStats()
+slow_queries = SlowQueryLog(config.DB_SLOW_QUERY_MS, explain=config.DB_SLOW_QUERY_EXPLAIN)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул, который измеряет время ожидания соединения. Ожиданием считается выдача,
+    начатая при полностью занятом пуле (все соединения выданы, overflow исчерпан).
+    """
+
+    def _do_get(self):
+        saturated = self.checkedout() >= self.size() + max(self._max_overflow, 0)
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        pool_stats.checkouts += 1
+        if saturated:
+            waited = time.perf_counter() - started
+            pool_stats.waits += 1
+            pool_stats.wait_time += waited
+            pool_stats.max_wait = max(pool_stats.max_wait, waited)
+        return connection
+
+
 class DatabaseSessionManager:
     def __init__(self):
         self._engine: AsyncEngine | None = None
         self._sessionmaker: async_sessionmaker | None = None
 
-    def init(self, host: str):
-        self._engine = create_async_engine(host, echo=False)
+    def init(self, host: str | None = None):
+        """
+        Создаёт движок процесса. Повторный вызов ничего не делает, поэтому его безопасно
+        вызывать и при старте приложения, и лениво при первом обращении к базе.
+        """
+        if self._engine is not None:
+            return
+        self._engine = create_async_engine(
+            host or config.DB_CONFIG,
+            echo=False,
+            poolclass=InstrumentedPool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+            connect_args={"prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE},
+        )
+        event.listen(self._engine.sync_engine, "before_cursor_execute", _count_query)
+        slow_queries.attach(self._engine)
         self._sessionmaker = async_sessionmaker(autocommit=False, bind=self._engine, expire_on_commit=False)
 
+    async def open(self, host: str | None = None):
+        """
+        Создаёт движок и сразу открывает одно соединение, чтобы ошибка подключения
+        проявилась при старте, а не на первом апдейте.
+        """
+        self.init(host)
+        async with self._engine.connect():
+            pass
+
+    def pool_stats(self) -> dict:
+        return pool_stats.as_dict(self._engine.pool if self._engine is not None else None)
+
     async def close(self):
         if self._engine is None:
             raise Exception("DatabaseSessionManager is not initialized")
@@ -56,8 +196,7 @@ class DatabaseSessionManager:
 
     @contextlib.asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
-        if self._engine is None:
-            raise Exception("DatabaseSessionManager is not initialized")
+        self.init()
 
         async with self._engine.begin() as connection:
             try:
@@ -68,9 +207,7 @@ class DatabaseSessionManager:
 
     @contextlib.asynccontextmanager
     async def session(self) -> AsyncIterator[AsyncSession]:
-        if self._sessionmaker is None:
-            raise Exception("DatabaseSessionManager is not initialized")
-
+        self.init()
         session = self._sessionmaker()
         try:
             yield session
@@ -90,13 +227,7 @@ class DatabaseSessionManager:
 
 sessionmanager = DatabaseSessionManager()
 
-engine = create_async_engine(config.DB_CONFIG)
-
 
 async def get_db():
     async with sessionmanager.session() as session:
         yield session
-
-
-sync_engine = create_engine(Config.DB_SYNC_CONFIG)
-SyncSession = sessionmaker(bind=sync_engine)
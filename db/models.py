@@ -1,8 +1,8 @@
 from datetime import datetime
 
 from sqlalchemy import Integer, BigInteger, String, DateTime, Float, JSON, ForeignKey, \
-    Boolean, func
-from sqlalchemy.orm import relationship, Mapped, mapped_column
+    Boolean, func, Index
+from sqlalchemy.orm import relationship, Mapped, mapped_column, selectinload, joinedload
 
 from db.db_config import Base
 from logic.base import BaseModel
@@ -22,12 +22,12 @@ class User(Base, BaseModel):
         "Box",
         secondary="user_room",
         back_populates="participants",
-        lazy="immediate",
+        lazy="raise_on_sql",
         primaryjoin="User.id == UserRoom.user_id",
         secondaryjoin="Box.id == UserRoom.box_id"
     )
     # Связь с подарками
-    gifts: Mapped[list["Gift"]] = relationship("Gift", back_populates="user", lazy="immediate")
+    gifts: Mapped[list["Gift"]] = relationship("Gift", back_populates="user", lazy="raise_on_sql")
 
 
 # Модель для комнат (Коробок)
@@ -41,28 +41,36 @@ class Box(Base, BaseModel):
     final_reg_date: Mapped[datetime] = mapped_column(DateTime)
     max_gift_price: Mapped[Float] = mapped_column(Float)
     gift_date: Mapped[datetime] = mapped_column(DateTime)
+    # Момент жеребьёвки. Выставляется тем же запросом, что записывает подопечных,
+    # и не даёт провести жеребьёвку дважды
+    drawn_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
 
     # Связь с пользователем-админом
     admin_id: Mapped[BigInteger] = mapped_column(BigInteger, ForeignKey('users.id'))
-    admin: Mapped["User"] = relationship("User", backref="admin_of_boxes", lazy="immediate")
+    admin: Mapped["User"] = relationship("User", backref="admin_of_boxes", lazy="raise_on_sql")
 
     # Связь с участниками через таблицу user_room
     participants: Mapped[list[User]] = relationship(
         "User",
         secondary="user_room",
         back_populates="rooms",
-        lazy="immediate",
+        lazy="raise_on_sql",
         primaryjoin="Box.id == UserRoom.box_id",
         secondaryjoin="User.id == UserRoom.user_id"
     )
 
     # Связь с подарками
-    gifts: Mapped[list["Gift"]] = relationship("Gift", back_populates="box", lazy="immediate")
+    gifts: Mapped[list["Gift"]] = relationship("Gift", back_populates="box", lazy="raise_on_sql")
 
 
 # Таблица связи между пользователями и комнатами (многие ко многим)
 class UserRoom(Base, BaseModel):
     __tablename__ = 'user_room'
+    # Поиск по (user_id, box_id) покрывает первичный ключ, выборки по box_id
+    # и по (box_id, user_gift_to_id) — этот индекс
+    __table_args__ = (
+        Index('ix_user_room_box_id_user_gift_to_id', 'box_id', 'user_gift_to_id'),
+    )
 
     user_id: Mapped[BigInteger] = mapped_column(BigInteger, ForeignKey('users.id'), primary_key=True)
     box_id: Mapped[int] = mapped_column(Integer, ForeignKey('boxes.id'), primary_key=True)
@@ -70,12 +78,16 @@ class UserRoom(Base, BaseModel):
     user_gift_to_id: Mapped[BigInteger] = mapped_column(BigInteger, ForeignKey('users.id'), nullable=True)
 
     # Отношение для удобства
-    user: Mapped["User"] = relationship("User", foreign_keys=[user_id], lazy="immediate")
-    receiver: Mapped["User"] = relationship("User", foreign_keys=[user_gift_to_id], lazy="immediate")
+    user: Mapped["User"] = relationship("User", foreign_keys=[user_id], lazy="raise_on_sql")
+    receiver: Mapped["User"] = relationship("User", foreign_keys=[user_gift_to_id], lazy="raise_on_sql")
 
 # Модель для подарков
 class Gift(Base, BaseModel):
     __tablename__ = 'gifts'
+    # Подарки пользователя в коробке и все подарки пользователя (User.gifts)
+    __table_args__ = (
+        Index('ix_gifts_user_id_box_id', 'user_id', 'box_id'),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     box_id: Mapped[int] = mapped_column(Integer, ForeignKey('boxes.id'), nullable=False)
@@ -86,5 +98,34 @@ class Gift(Base, BaseModel):
     is_exact: Mapped[bool] = mapped_column(Boolean, nullable=False)
 
     # Связь с комнатой и пользователем
-    box: Mapped["Box"] = relationship("Box", back_populates="gifts", lazy="immediate")
-    user: Mapped["User"] = relationship("User", back_populates="gifts", lazy="immediate")
\ No newline at end of file
+    box: Mapped["Box"] = relationship("Box", back_populates="gifts", lazy="raise_on_sql")
+    user: Mapped["User"] = relationship("User", back_populates="gifts", lazy="raise_on_sql")
+
+
+# Исключения для жеребьёвки: giver не может получить receiver в подопечные
+# (пары, коллеги за одним столом, прошлогодние пары). Первичный ключ начинается
+# с box_id, поэтому выборка исключений коробки идёт по индексу.
+class BoxExclusion(Base, BaseModel):
+    __tablename__ = 'box_exclusions'
+
+    box_id: Mapped[int] = mapped_column(Integer, ForeignKey('boxes.id'), primary_key=True)
+    giver_id: Mapped[BigInteger] = mapped_column(BigInteger, ForeignKey('users.id'), primary_key=True)
+    receiver_id: Mapped[BigInteger] = mapped_column(BigInteger, ForeignKey('users.id'), primary_key=True)
+    reason: Mapped[str] = mapped_column(String(255), nullable=True)
+
+
+# Именованные профили загрузки связей. По умолчанию связи не загружаются вовсе
+# (lazy="raise_on_sql"), хэндлер явно выбирает профиль под свой экран:
+# await UserRoom.get_by_kwargs(db, profile="box_card", box_id=box_id)
+User.__loading_profiles__ = {
+    # Главное меню и список коробок пользователя
+    "menu": (selectinload(User.rooms),),
+}
+UserRoom.__loading_profiles__ = {
+    # Карточка коробки: список участников с именами
+    "box_card": (joinedload(UserRoom.user),),
+    # Переписка с подопечным: только сам подопечный
+    "receiver": (joinedload(UserRoom.receiver),),
+    # Профиль подопечного вместе с его подарками
+    "receiver_dossier": (joinedload(UserRoom.receiver).selectinload(User.gifts),),
+}
@@ -1,37 +1,204 @@
-import json
+"""
+Клиент redis для кэшей приложения.
+
+Каждое значение хранится в хэше: поле "v" — данные, закодированные кодеком, поле "c" —
+время записи. Время записи читается без декодирования данных, TTL ставится на весь хэш.
+Запись (DEL + HSET + EXPIRE) и пакетные операции уходят одним пайплайном.
+Команды, отправленные внутри блока track_commands, подсчитываются (см. tg/metrics.py).
+"""
+import contextlib
 import time
+from contextvars import ContextVar
+from typing import Any, Iterable, Iterator, Protocol
 
+import msgpack
+import orjson
 from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+
+from config import REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_CODEC
+
+VALUE_FIELD = "v"
+CREATED_FIELD = "c"
+
+
+class Codec(Protocol):
+    def encode(self, value: Any) -> bytes: ...
+
+    def decode(self, data: bytes) -> Any: ...
+
+
+class OrjsonCodec:
+    def encode(self, value: Any) -> bytes:
+        return orjson.dumps(value)
+
+    def decode(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data)
+
+
+CODECS = {
+    "orjson": OrjsonCodec,
+    "msgpack": MsgpackCodec,
+}
+
+
+def get_codec(name: str) -> Codec:
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown redis codec '{name}', expected one of: {', '.join(CODECS)}")
+
+
+class CommandStats:
+    """
+    Счётчик команд redis в рамках одного апдейта. Блоки track_commands можно вкладывать.
+    """
+
+    def __init__(self, parent: "CommandStats | None" = None):
+        self.count = 0
+        self.parent = parent
+
+
+_command_stats: ContextVar[CommandStats | None] = ContextVar("redis_command_stats", default=None)
 
-from config import REDIS_HOST, REDIS_PORT, REDIS_DB
+
+@contextlib.contextmanager
+def track_commands() -> Iterator[CommandStats]:
+    """
+    Считает команды redis, отправленные внутри блока (в том числе во вложенных корутинах).
+    Команды пайплайна считаются по отдельности.
+    """
+    stats = CommandStats(parent=_command_stats.get())
+    token = _command_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _command_stats.reset(token)
+
+
+def _count_commands(count: int):
+    stats = _command_stats.get()
+    while stats is not None:
+        stats.count += count
+        stats = stats.parent
+
+
+class CountingPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        _count_commands(len(self.command_stack))
+        return await super().execute(raise_on_error)
+
+
+class CountingRedis(aioredis.Redis):
+    """
+    Клиент redis, который засчитывает отправленные команды в track_commands.
+    """
+
+    async def execute_command(self, *args, **options):
+        _count_commands(1)
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> CountingPipeline:
+        return CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
 
 
 class AsyncRedisClient:
-    def __init__(self):
-        self.redis = aioredis.from_url(f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}")
-
-    async def set(self, key: str, value: dict | list, expire: int = None):
-        data = {"value": value, "created_at": time.time()}
-        await self.redis.set(key, json.dumps(data), expire)
-
-    async def get(self, key: str) -> dict | list | None:
-        value = await self.redis.get(key)
-        if value:
-            data = json.loads(value)
-            return data["value"]
-        return None
+    def __init__(self, pool: aioredis.ConnectionPool | None = None, codec: Codec | None = None):
+        """
+        :param pool: пул соединений; если не передан, создаётся новый по настройкам из config
+        :param codec: кодек значений, по умолчанию — REDIS_CODEC из config
+        """
+        if pool is None:
+            pool = aioredis.ConnectionPool.from_url(f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}")
+        self.pool = pool
+        self.redis = CountingRedis(connection_pool=pool)
+        self.codec = codec or get_codec(REDIS_CODEC)
 
-    async def delete(self, key: str):
-        await self.redis.delete(key)
+    def _queue_set(self, pipe, key: str, value: Any, expire: int | None, created_at: float):
+        # DEL нужен, чтобы перезаписать ключ, оставшийся от старого формата (строка вместо хэша)
+        pipe.delete(key)
+        pipe.hset(key, mapping={VALUE_FIELD: self.codec.encode(value), CREATED_FIELD: created_at})
+        if expire:
+            pipe.expire(key, expire)
+
+    def _decode(self, data: bytes | Exception | None) -> Any:
+        # Ошибка WRONGTYPE — ключ старого формата, считаем его промахом
+        if data is None or isinstance(data, ResponseError):
+            return None
+        return self.codec.decode(data)
+
+    async def set(self, key: str, value: dict | list | str, expire: int = None):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._queue_set(pipe, key, value, expire, time.time())
+            await pipe.execute()
+
+    async def get(self, key: str) -> dict | list | str | None:
+        try:
+            return self._decode(await self.redis.hget(key, VALUE_FIELD))
+        except ResponseError:
+            return None
+
+    async def mset(self, values: dict[str, Any], expire: int = None):
+        """
+        Записывает несколько значений за один запрос к redis.
+        """
+        if not values:
+            return
+        created_at = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for key, value in values.items():
+                self._queue_set(pipe, key, value, expire, created_at)
+            await pipe.execute()
+
+    async def mget(self, keys: Iterable[str]) -> list[Any]:
+        """
+        Читает несколько значений за один запрос к redis. Для отсутствующих ключей — None.
+        """
+        keys = list(keys)
+        if not keys:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hget(key, VALUE_FIELD)
+            results = await pipe.execute(raise_on_error=False)
+        return [self._decode(data) for data in results]
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.redis.delete(*keys)
+
+    async def acquire(self, key: str, expire: int) -> bool:
+        """
+        Атомарно занимает ключ-блокировку. Возвращает False, если ключ уже занят.
+        """
+        return bool(await self.redis.set(key, time.time(), ex=expire, nx=True))
 
     async def ttl(self, key: str) -> int:
         return await self.redis.ttl(key)
 
     async def lifetime(self, key: str) -> int | None:
-        value = await self.redis.get(key)
-        if value:
-            data = json.loads(value)
-            created_at = data.get("created_at", 0)
-            if created_at:
-                return int(time.time() - created_at)
+        """
+        Сколько секунд назад было записано значение. Данные при этом не читаются.
+        """
+        try:
+            created_at = await self.redis.hget(key, CREATED_FIELD)
+        except ResponseError:
+            return None
+        if created_at:
+            return int(time.time() - float(created_at))
         return None
+
+    async def close(self):
+        await self.redis.aclose(close_connection_pool=True)
+
+
+redis_client = AsyncRedisClient()
@@ -0,0 +1,217 @@
+"""
+Журнал медленных SQL-запросов процесса.
+
+Каждый запрос движка засекается событиями before/after_cursor_execute. Запросы дольше
+порога группируются по нормализованному тексту (литералы и параметры заменены на ?),
+для группы хранятся число, время, форма параметров (типы, без значений) и хэндлеры,
+из которых запрос выполнялся (см. query_source).
+
+Для самых тяжёлых по суммарному времени SELECT в фоне снимается
+EXPLAIN (ANALYZE, BUFFERS) с теми же параметрами: в отдельной транзакции,
+которая откатывается, и с ограничением statement_timeout. Отчёт — команда
+администратора /slow_queries (см. tg/handlers/admin.py).
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+_query_source: ContextVar[str | None] = ContextVar("query_source", default=None)
+# Запросы самого EXPLAIN в журнал не попадают
+_explaining: ContextVar[bool] = ContextVar("slow_query_explaining", default=False)
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER = re.compile(r"\$\d+(::[\w\[\]]+(\(\d+\))?)?")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(\s*,\s*\?)+\s*\)")
+_READ = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_WRITE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+
+
+def normalize(statement: str) -> str:
+    """
+    Текст запроса без параметров и литералов, чтобы одинаковые запросы попадали в одну группу.
+    """
+    statement = _PLACEHOLDER.sub("?", statement)
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("(...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def parameters_shape(parameters, executemany: bool) -> str:
+    """
+    Типы параметров без значений: "(int, str, None)" или "500 x (int, int)" для executemany.
+    """
+    if executemany:
+        rows = list(parameters or [])
+        return f"{len(rows)} x {parameters_shape(rows[0], False)}" if rows else "0 x ()"
+    if isinstance(parameters, dict):
+        parameters = parameters.values()
+    types = ["None" if value is None else type(value).__name__ for value in parameters or ()]
+    return f"({', '.join(types)})"
+
+
+@contextlib.contextmanager
+def query_source(label: str) -> Iterator[None]:
+    """
+    Запросы внутри блока записываются в журнал с меткой label (обычно имя хэндлера).
+    """
+    token = _query_source.set(label)
+    try:
+        yield
+    finally:
+        _query_source.reset(token)
+
+
+@dataclass
+class SlowQuery:
+    sql: str
+    count: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    parameters: str = ""
+    sources: Counter = field(default_factory=Counter)
+    # Исходный текст и параметры самого медленного выполнения — для EXPLAIN
+    statement: str = ""
+    statement_parameters: tuple | None = None
+    explainable: bool = False
+    plan: str | None = None
+    explained_at: float = 0.0
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = 100, explain: bool = True, explain_top: int = 10,
+                 explain_interval: float = 600, explain_timeout_ms: int = 5000, max_queries: int = 200):
+        """
+        :param threshold_ms: запросы дольше порога попадают в журнал
+        :param explain: снимать ли EXPLAIN (ANALYZE, BUFFERS) для тяжёлых SELECT
+        :param explain_top: EXPLAIN снимается только для стольких групп с наибольшим суммарным временем
+        :param explain_interval: не чаще раза в столько секунд для одной группы
+        :param explain_timeout_ms: statement_timeout для EXPLAIN ANALYZE
+        :param max_queries: сколько групп хранить в памяти
+        """
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.explain_top = explain_top
+        self.explain_interval = explain_interval
+        self.explain_timeout_ms = explain_timeout_ms
+        self.max_queries = max_queries
+        self.queries: dict[str, SlowQuery] = {}
+        self.dropped = 0
+        self.started_at = time.time()
+        self._engine: AsyncEngine | None = None
+        self._explain_task: asyncio.Task | None = None
+
+    def attach(self, engine: AsyncEngine):
+        self._engine = engine
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_execute)
+
+    def reset(self):
+        self.queries = {}
+        self.dropped = 0
+        self.started_at = time.time()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._slow_query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_started", None)
+        if started is None or _explaining.get():
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed >= self.threshold:
+            self.record(statement, parameters, executemany, elapsed)
+
+    def record(self, statement: str, parameters, executemany: bool, elapsed: float):
+        sql = normalize(statement)
+        query = self.queries.get(sql)
+        if query is None:
+            if len(self.queries) >= self.max_queries:
+                self.dropped += 1
+                return
+            query = self.queries[sql] = SlowQuery(sql=sql)
+        query.count += 1
+        query.total_time += elapsed
+        query.sources[_query_source.get() or "-"] += 1
+        if elapsed >= query.max_time:
+            query.max_time = elapsed
+            query.parameters = parameters_shape(parameters, executemany)
+            # ANALYZE выполняет запрос, поэтому только чтение
+            query.explainable = not executemany and bool(_READ.match(statement)) and not _WRITE.search(statement)
+            if query.explainable:
+                query.statement = statement
+                query.statement_parameters = tuple(parameters.values()) if isinstance(parameters, dict) \
+                    else tuple(parameters or ())
+        self._maybe_explain(query)
+
+    def top(self, limit: int | None = None) -> list[SlowQuery]:
+        return sorted(self.queries.values(), key=lambda query: query.total_time, reverse=True)[:limit]
+
+    def _maybe_explain(self, query: SlowQuery):
+        if not (self.explain and query.explainable and self._engine is not None):
+            return
+        if time.time() - query.explained_at < self.explain_interval:
+            return
+        if self._explain_task is not None and not self._explain_task.done():
+            return
+        if query.sql not in {top.sql for top in self.top(self.explain_top)}:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        query.explained_at = time.time()
+        # Чистый контекст: EXPLAIN не относится к апдейту и не должен расходовать его бюджет запросов
+        self._explain_task = loop.create_task(self._explain(query), context=contextvars.Context())
+
+    async def _explain(self, query: SlowQuery):
+        _explaining.set(True)
+        try:
+            async with self._engine.connect() as connection:
+                transaction = await connection.begin()
+                try:
+                    await connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}")
+                    result = await connection.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + query.statement,
+                                                              query.statement_parameters)
+                    query.plan = "\n".join(row[0] for row in result)
+                finally:
+                    await transaction.rollback()
+        except Exception as e:
+            logging.warning(f"Failed to EXPLAIN slow query: {e}")
+            query.plan = f"EXPLAIN failed: {e}"
+
+    def report(self) -> str:
+        lines = [f"Медленные запросы (дольше {self.threshold * 1000:.0f} мс) с "
+                 f"{time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(self.started_at))}: {len(self.queries)} групп"]
+        if self.dropped:
+            lines.append(f"Не учтено из-за лимита групп: {self.dropped}")
+        for query in self.top():
+            lines += [
+                "",
+                "=" * 80,
+                f"Выполнений: {query.count}, всего {query.total_time * 1000:.0f} мс, "
+                f"в среднем {query.total_time / query.count * 1000:.0f} мс, максимум {query.max_time * 1000:.0f} мс",
+                f"Параметры: {query.parameters}",
+                "Хэндлеры: " + ", ".join(f"{source} ({count})" for source, count in query.sources.most_common(5)),
+                "",
+                query.sql,
+            ]
+            if query.plan:
+                lines += ["", query.plan]
+        return "\n".join(lines)
+
+    def summary(self, limit: int = 5) -> str:
+        return "\n".join(f"{query.total_time * 1000:.0f} мс / {query.count}: {query.sql[:80]}"
+                         for query in self.top(limit))
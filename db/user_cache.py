@@ -0,0 +1,177 @@
+"""
+Кэш пользователя и списка его коробок для обработки апдейтов.
+
+Чтение идёт через два уровня: LRU в памяти процесса и Redis. Все места, где меняются
+пользователь или его участие в коробках, вызывают invalidate явно: ключи удаляются из Redis,
+а через pub/sub инвалидация рассылается всем процессам, и каждый чистит свой LRU.
+Локальный уровень работает только пока процесс подписан на канал (см. start): без подписки
+или после её потери чтение идёт сразу в Redis, чтобы не отдавать устаревший список коробок.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import User
+from db.redis_client import AsyncRedisClient, redis_client
+
+REDIS_TTL = 60
+LOCAL_TTL = 10
+LOCAL_MAXSIZE = 10_000
+INVALIDATE_CHANNEL = "user_cache:invalidate"
+RECONNECT_DELAY = 1
+
+
+@dataclass
+class CachedUser:
+    id: int
+    username: str | None
+    full_name: str
+    # Коробки пользователя: [(id, название), ...]
+    rooms: list[tuple[int, str]] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "username": self.username, "full_name": self.full_name, "rooms": self.rooms}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CachedUser":
+        return cls(id=data["id"], username=data["username"], full_name=data["full_name"],
+                   rooms=[(box_id, name) for box_id, name in data["rooms"]])
+
+
+class UserCache:
+    def __init__(self, redis_client: AsyncRedisClient):
+        self.redis_client = redis_client
+        self._local: OrderedDict[int, tuple[float, CachedUser]] = OrderedDict()
+        self._task: asyncio.Task | None = None
+        self._subscribed = False
+        # Растёт с каждой полученной инвалидацией: данные, прочитанные до неё, в LRU не попадают
+        self._generation = 0
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"user:{user_id}"
+
+    def _get_local(self, user_id: int) -> CachedUser | None:
+        if not self._subscribed:
+            return None
+        entry = self._local.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._local[user_id]
+            return None
+        self._local.move_to_end(user_id)
+        return user
+
+    def _set_local(self, user: CachedUser, generation: int):
+        if not self._subscribed or generation != self._generation:
+            return
+        self._local[user.id] = (time.monotonic() + LOCAL_TTL, user)
+        self._local.move_to_end(user.id)
+        while len(self._local) > LOCAL_MAXSIZE:
+            self._local.popitem(last=False)
+
+    def _drop_local(self, *user_ids: int):
+        self._generation += 1
+        for user_id in user_ids:
+            self._local.pop(user_id, None)
+
+    async def get(self, db: AsyncSession, user_id: int) -> CachedUser | None:
+        """
+        Пользователь из кэша, при промахе — из базы. Отсутствующие пользователи не кэшируются,
+        чтобы регистрация в /start была видна сразу.
+        """
+        if user := self._get_local(user_id):
+            return user
+        generation = self._generation
+        if data := await self.redis_client.get(self._key(user_id)):
+            user = CachedUser.from_dict(data)
+            self._set_local(user, generation)
+            return user
+
+        record = await User.get_by_kwargs(db, id=user_id, profile="menu")
+        if record is None:
+            return None
+        user = CachedUser(id=record.id, username=record.username, full_name=record.full_name,
+                          rooms=[(box.id, box.name) for box in record.rooms])
+        await self.redis_client.set(self._key(user_id), user.to_dict(), REDIS_TTL)
+        self._set_local(user, generation)
+        return user
+
+    async def invalidate(self, *user_ids: int):
+        """
+        Удаляет пользователей из кэша во всех процессах. Удаление из Redis и рассылка
+        уходят одним пайплайном.
+        """
+        if not user_ids:
+            return
+        self._drop_local(*user_ids)
+        async with self.redis_client.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(*(self._key(user_id) for user_id in user_ids))
+            pipe.publish(INVALIDATE_CHANNEL, orjson.dumps(user_ids))
+            await pipe.execute()
+
+    def start(self):
+        """
+        Подписывает процесс на инвалидации и включает локальный уровень кэша.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.redis_client.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(INVALIDATE_CHANNEL)
+                    # Пока подписки не было, инвалидации могли пройти мимо
+                    self._local.clear()
+                    self._drop_local()
+                    self._subscribed = True
+                    async for message in pubsub.listen():
+                        self._drop_local(*orjson.loads(message["data"]))
+            except Exception:
+                logging.exception("User cache invalidation listener failed, reconnecting")
+            finally:
+                self._subscribed = False
+                self._local.clear()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+user_cache = UserCache(redis_client)
+
+
+class LazyUser:
+    """
+    Пользователь, который передаётся в хэндлеры. id известен сразу из апдейта,
+    данные из кэша/базы загружаются только при первом вызове get().
+    """
+
+    def __init__(self, user_id: int, db: AsyncSession):
+        self.id = user_id
+        self._db = db
+        self._user: CachedUser | None = None
+        self._loaded = False
+
+    async def get(self) -> CachedUser | None:
+        if not self._loaded:
+            self._user = await user_cache.get(self._db, self.id)
+            self._loaded = True
+        return self._user
+
+    async def invalidate(self):
+        await user_cache.invalidate(self.id)
+        self._loaded = False
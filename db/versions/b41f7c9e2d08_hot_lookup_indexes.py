@@ -0,0 +1,37 @@
+"""hot lookup indexes
+
+Revision ID: b41f7c9e2d08
+Revises: 9c2d4e7a1b35
+Create Date: 2026-10-18 14:40:51.208337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41f7c9e2d08'
+down_revision: Union[str, None] = '9c2d4e7a1b35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# CREATE INDEX CONCURRENTLY не работает внутри транзакции, поэтому индексы
+# создаются в autocommit-блоке и не блокируют запись в таблицы на живой базе.
+# Если построение прервалось, невалидный индекс нужно удалить вручную перед повтором.
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_room_box_id_user_gift_to_id', 'user_room', ['box_id', 'user_gift_to_id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_gifts_user_id_box_id', 'gifts', ['user_id', 'box_id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_gifts_user_id_box_id', table_name='gifts',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_user_room_box_id_user_gift_to_id', table_name='user_room',
+                      postgresql_concurrently=True, if_exists=True)
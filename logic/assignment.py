@@ -0,0 +1,78 @@
+"""
+Распределение подопечных в коробке.
+
+Оба алгоритма работают за O(n) и не используют перебор с повторными попытками:
+- single_cycle — равномерно случайный единый цикл (A → B → C → ... → A);
+- derangement — равномерно случайная перестановка без неподвижных точек
+  (алгоритм Martínez, Panholzer, Prodinger, 2008).
+"""
+import random
+from typing import Hashable, Sequence, TypeVar
+
+T = TypeVar("T", bound=Hashable)
+
+
+def _rng(seed: int | None) -> random.Random:
+    return random.Random(seed)
+
+
+def single_cycle(participants: Sequence[T], seed: int | None = None) -> dict[T, T]:
+    """
+    Распределение одним циклом: каждый дарит следующему в случайном порядке.
+    :param participants: идентификаторы участников (без повторов)
+    :param seed: зерно генератора для воспроизводимости
+    :return: словарь {даритель: подопечный}
+    """
+    if len(participants) < 2:
+        raise ValueError("At least 2 participants are required")
+    order = list(participants)
+    _rng(seed).shuffle(order)
+    return {giver: order[(i + 1) % len(order)] for i, giver in enumerate(order)}
+
+
+def _mark_probabilities(n: int) -> list[float]:
+    """
+    Вероятности (u - 1) * D(u - 2) / D(u) для u = 0..n, где D — числа беспорядков.
+    Считаются через отношения a(u) = D(u) / D(u - 1), чтобы не работать с огромными целыми.
+    """
+    probabilities = [0.0] * (n + 1)
+    if n >= 2:
+        probabilities[2] = 1.0
+    ratio = 2.0  # a(3) = D(3) / D(2)
+    for u in range(4, n + 1):
+        previous = ratio
+        ratio = (u - 1) * (1 + 1 / previous)
+        probabilities[u] = (u - 1) / (ratio * previous)
+    return probabilities
+
+
+def derangement(participants: Sequence[T], seed: int | None = None) -> dict[T, T]:
+    """
+    Распределение произвольной перестановкой без «подарка самому себе».
+    Допускает несколько независимых циклов, например пары A ⇄ B.
+    :param participants: идентификаторы участников (без повторов)
+    :param seed: зерно генератора для воспроизводимости
+    :return: словарь {даритель: подопечный}
+    """
+    n = len(participants)
+    if n < 2:
+        raise ValueError("At least 2 participants are required")
+    rng = _rng(seed)
+    probabilities = _mark_probabilities(n)
+    permutation = list(range(n))
+    marked = [False] * n
+
+    i, unmarked = n - 1, n
+    while unmarked >= 2:
+        if not marked[i]:
+            j = rng.randrange(i)
+            while marked[j]:
+                j = rng.randrange(i)
+            permutation[i], permutation[j] = permutation[j], permutation[i]
+            if rng.random() < probabilities[unmarked]:
+                marked[j] = True
+                unmarked -= 1
+            unmarked -= 1
+        i -= 1
+
+    return {participants[giver]: participants[receiver] for giver, receiver in enumerate(permutation)}
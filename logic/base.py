@@ -1,7 +1,8 @@
 from datetime import datetime
 from typing import TypeVar, Union, List, Type, Tuple, Sequence
 
-from sqlalchemy import select, func
+from sqlalchemy import select, func, insert, literal_column, Row, update as update_stmt, delete as delete_stmt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -9,6 +10,20 @@ T = TypeVar("T", bound="BaseModel")
 
 
 class BaseModel:
+    # Именованные профили загрузки связей: {"имя": (опции загрузки, ...)}
+    __loading_profiles__: dict[str, tuple] = {}
+
+    @classmethod
+    def loading_profile(cls, name: str) -> tuple:
+        """
+        Опции загрузки связей для именованного профиля модели.
+        :param name: имя профиля, например "menu" или "box_card"
+        :return: кортеж опций для select(...).options()
+        """
+        try:
+            return cls.__loading_profiles__[name]
+        except KeyError:
+            raise ValueError(f"{cls.__name__} has no loading profile '{name}'")
 
     @classmethod
     async def create(cls: Type[T], session: AsyncSession, **kwargs) -> T:
@@ -98,12 +113,16 @@ class BaseModel:
             session: AsyncSession,
             multiple: bool = False,
             order_by: str = None,
+            profile: str = None,
             **kwargs,
     ) -> Union[List[T], T, None]:
         """
         Получение записи из базы данных по заданным параметрам.
+        Связи загружаются только если передан profile (см. __loading_profiles__).
         """
         stmt = select(cls).filter_by(**kwargs)
+        if profile:
+            stmt = stmt.options(*cls.loading_profile(profile)).execution_options(populate_existing=True)
         if order_by:
             stmt = stmt.order_by(order_by)
         result = await session.execute(stmt)
@@ -125,6 +144,107 @@ class BaseModel:
             record = await cls.create(session, **kwargs)
             return record, True
 
+    @classmethod
+    async def bulk_create(cls, session: AsyncSession, rows: Sequence[dict], commit: bool = True) -> int:
+        """
+        Вставка множества записей одним запросом (executemany драйвера), без создания объектов модели.
+        :param session:
+        :param rows: значения колонок для каждой записи, набор ключей у всех записей одинаковый
+        :param commit: зафиксировать транзакцию
+        :return: количество вставленных записей
+        """
+        rows = list(rows)
+        if rows:
+            await session.execute(insert(cls.__table__), rows)
+        if commit:
+            await session.commit()
+        return len(rows)
+
+    @classmethod
+    async def upsert(
+            cls,
+            session: AsyncSession,
+            values: dict | Sequence[dict],
+            conflict: Sequence[str] | None = None,
+            update: Sequence[str] | None = None,
+            commit: bool = True,
+    ) -> Row | None | list[Row]:
+        """
+        INSERT ... ON CONFLICT ... RETURNING одним запросом, без объектов модели в сессии.
+        Строки результата содержат все колонки таблицы и признак inserted: была ли запись создана.
+        :param session:
+        :param values: значения колонок одной записи или список записей (ключи в одном запросе не должны повторяться)
+        :param conflict: колонки уникального ограничения, по умолчанию первичный ключ
+        :param update: колонки, которые обновляются при конфликте, по умолчанию все переданные кроме conflict.
+            Пустой список — ON CONFLICT DO NOTHING: существующие записи не меняются и не возвращаются
+        :param commit: зафиксировать транзакцию
+        :return: строка для одной записи (None, если она уже существовала и update пуст) или список строк
+        """
+        single = isinstance(values, dict)
+        rows = [values] if single else list(values)
+        if not rows:
+            return []
+        table = cls.__table__
+        conflict = list(conflict or (column.name for column in table.primary_key))
+        if update is None:
+            update = [name for name in rows[0] if name not in conflict]
+
+        stmt = pg_insert(table).values(rows)
+        if update:
+            stmt = stmt.on_conflict_do_update(index_elements=conflict,
+                                              set_={name: stmt.excluded[name] for name in update})
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=conflict)
+        # xmax = 0 только у только что вставленной версии строки
+        stmt = stmt.returning(*table.c, literal_column("xmax = 0").label("inserted"))
+
+        result = (await session.execute(stmt)).all()
+        if commit:
+            await session.commit()
+        if single:
+            return result[0] if result else None
+        return result
+
+    @classmethod
+    async def update_where(cls, session: AsyncSession, values: dict, *where, commit: bool = True,
+                           **filters) -> Sequence[Row]:
+        """
+        UPDATE ... WHERE ... RETURNING одним запросом, без загрузки записей.
+        Уже загруженные в сессию объекты модели не обновляются.
+        :param session:
+        :param values: новые значения колонок
+        :param where: условия в виде выражений SQLAlchemy
+        :param commit: зафиксировать транзакцию
+        :param filters: условия равенства колонок, как в filter_by
+        :return: обновлённые записи
+        """
+        if not (where or filters):
+            raise ValueError(f"{cls.__name__}.update_where requires at least one condition")
+        stmt = update_stmt(cls.__table__).where(*where).filter_by(**filters).values(**values) \
+            .returning(*cls.__table__.c)
+        result = (await session.execute(stmt)).all()
+        if commit:
+            await session.commit()
+        return result
+
+    @classmethod
+    async def delete_where(cls, session: AsyncSession, *where, commit: bool = True, **filters) -> Sequence[Row]:
+        """
+        DELETE ... WHERE ... RETURNING одним запросом, без загрузки записей.
+        :param session:
+        :param where: условия в виде выражений SQLAlchemy
+        :param commit: зафиксировать транзакцию
+        :param filters: условия равенства колонок, как в filter_by
+        :return: удалённые записи
+        """
+        if not (where or filters):
+            raise ValueError(f"{cls.__name__}.delete_where requires at least one condition")
+        stmt = delete_stmt(cls.__table__).where(*where).filter_by(**filters).returning(*cls.__table__.c)
+        result = (await session.execute(stmt)).all()
+        if commit:
+            await session.commit()
+        return result
+
     @classmethod
     async def get_all_count_by_period(
             cls: Type[T],
@@ -0,0 +1,153 @@
+"""
+Распределение подопечных с учётом исключений (пары, коллеги, прошлогодние пары).
+
+Исключение (giver, receiver) запрещает giver дарить подарок receiver. Подарок самому себе
+запрещён всегда. Алгоритм:
+1. быстрые проверки очевидной невозможности (участник исключён для всех);
+2. случайная перестановка без неподвижных точек и исправление конфликтов обменом
+   подопечными со случайным участником — при разреженных исключениях это O(n + k);
+3. если после обменов конфликты остались — точный поиск увеличивающих путей
+   в двудольном графе разрешённых пар. Он либо достраивает распределение,
+   либо доказывает, что его не существует, и возвращает мешающую группу участников.
+"""
+import random
+from collections import deque
+from typing import Hashable, Iterable, Sequence, TypeVar
+
+from logic.assignment import derangement, single_cycle
+
+T = TypeVar("T", bound=Hashable)
+
+# Сколько случайных кандидатов перебирать для обмена при исправлении одного конфликта
+SWAP_ATTEMPTS = 64
+
+
+class MatchingError(Exception):
+    """
+    Распределение с заданными исключениями невозможно.
+    givers — группа дарителей, которым не хватает допустимых подопечных,
+    receivers — все подопечные, доступные этой группе (их меньше, чем дарителей).
+    """
+
+    def __init__(self, message: str, givers: list, receivers: list):
+        super().__init__(message)
+        self.givers = givers
+        self.receivers = receivers
+
+
+def _forbidden_map(participants: Sequence[T], exclusions: Iterable[tuple[T, T]]) -> dict[T, set[T]]:
+    members = set(participants)
+    if len(members) != len(participants):
+        raise ValueError("Participants must be unique")
+    forbidden = {participant: {participant} for participant in participants}
+    for giver, receiver in exclusions:
+        if giver in members and receiver in members:
+            forbidden[giver].add(receiver)
+    return forbidden
+
+
+def _check_trivial(participants: Sequence[T], forbidden: dict[T, set[T]]):
+    n = len(participants)
+    excluded_by = dict.fromkeys(participants, 0)
+    for giver, receivers in forbidden.items():
+        if len(receivers) == n:
+            raise MatchingError(f"Participant {giver} is excluded from every receiver",
+                                givers=[giver], receivers=[])
+        for receiver in receivers:
+            excluded_by[receiver] += 1
+    for receiver, count in excluded_by.items():
+        if count == n:
+            raise MatchingError(f"Participant {receiver} is excluded for every giver",
+                                givers=list(participants), receivers=[r for r in participants if r != receiver])
+
+
+def _repair(participants: Sequence[T], forbidden: dict[T, set[T]],
+            assignments: dict[T, T], rng: random.Random) -> list[T]:
+    """
+    Исправляет конфликты обменом подопечными. Возвращает дарителей, которых исправить не удалось.
+    """
+    unresolved = []
+    for giver in [g for g in participants if assignments[g] in forbidden[g]]:
+        receiver = assignments[giver]
+        if receiver not in forbidden[giver]:
+            # Уже исправлен обменом с другим конфликтным дарителем
+            continue
+        for _ in range(SWAP_ATTEMPTS):
+            other = participants[rng.randrange(len(participants))]
+            other_receiver = assignments[other]
+            if other_receiver not in forbidden[giver] and receiver not in forbidden[other]:
+                assignments[giver], assignments[other] = other_receiver, receiver
+                break
+        else:
+            unresolved.append(giver)
+    return unresolved
+
+
+def _augment(participants: Sequence[T], forbidden: dict[T, set[T]],
+             assignments: dict[T, T], free_givers: list[T]):
+    """
+    Точное достраивание паросочетания поиском увеличивающих путей (BFS по дополнению
+    графа исключений). Каждый поиск стоит O(n + k). При отсутствии пути бросает MatchingError.
+    """
+    for giver in free_givers:
+        del assignments[giver]
+    owner = {receiver: giver for giver, receiver in assignments.items()}
+
+    for start in free_givers:
+        unvisited = set(participants)
+        parent: dict[T, T] = {}
+        reached = [start]
+        queue = deque([start])
+        found = None
+        while queue and found is None:
+            giver = queue.popleft()
+            for receiver in list(unvisited):
+                if receiver in forbidden[giver]:
+                    continue
+                unvisited.discard(receiver)
+                parent[receiver] = giver
+                if receiver not in owner:
+                    found = receiver
+                    break
+                reached.append(owner[receiver])
+                queue.append(owner[receiver])
+
+        if found is None:
+            raise MatchingError(f"{len(reached)} participants can only give to {len(parent)} receivers",
+                                givers=reached, receivers=list(parent))
+
+        receiver = found
+        while True:
+            giver = parent[receiver]
+            previous = assignments.get(giver)
+            assignments[giver] = receiver
+            owner[receiver] = giver
+            if giver == start:
+                break
+            receiver = previous
+
+
+def match(participants: Sequence[T], exclusions: Iterable[tuple[T, T]] = (),
+          seed: int | None = None) -> dict[T, T]:
+    """
+    Распределение подопечных с учётом исключений.
+    Без исключений участники распределяются одним циклом (см. logic.assignment.single_cycle).
+    :param participants: идентификаторы участников (без повторов)
+    :param exclusions: пары (даритель, подопечный), которые нельзя назначать
+    :param seed: зерно генератора для воспроизводимости
+    :return: словарь {даритель: подопечный}
+    :raises MatchingError: если допустимого распределения не существует
+    """
+    if len(participants) < 2:
+        raise ValueError("At least 2 participants are required")
+    forbidden = _forbidden_map(participants, exclusions)
+    if all(len(receivers) == 1 for receivers in forbidden.values()):
+        return single_cycle(participants, seed=seed)
+
+    _check_trivial(participants, forbidden)
+    rng = random.Random(seed)
+    assignments = derangement(participants, seed=rng.getrandbits(64))
+    unresolved = _repair(participants, forbidden, assignments, rng)
+    if unresolved:
+        _augment(participants, forbidden, assignments, unresolved)
+    return assignments
@@ -0,0 +1,103 @@
+"""
+Сокращение ссылок на подарки через clck.ru.
+
+Запросы идут через общий aiohttp-клиент с пулом соединений и таймаутами, результат
+кэшируется в Redis по нормализованной ссылке. Сервису уходит исходная ссылка:
+нормализация нужна только для ключа кэша и не должна менять адрес подарка.
+Одновременные запросы одной и той же ссылки объединяются в один поход к сервису.
+"""
+import asyncio
+import hashlib
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import aiohttp
+
+from config import SHORTENER_URL
+from db.redis_client import AsyncRedisClient, redis_client
+
+# Ссылки маркетплейсов не меняются, поэтому результат можно хранить долго
+CACHE_TTL = 60 * 60 * 24 * 30
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=5, connect=2)
+POOL_SIZE = 20
+
+
+class ShortenerError(Exception):
+    pass
+
+
+def normalize_url(url: str) -> str:
+    """
+    Приводит ссылку к каноническому виду: схема и хост в нижнем регистре, без якоря
+    и utm-меток, параметры отсортированы.
+    """
+    parts = urlsplit(url.strip())
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith("utm_"))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ""))
+
+
+class LinkShortener:
+    def __init__(self, redis_client: AsyncRedisClient, service_url: str = SHORTENER_URL):
+        self.redis_client = redis_client
+        self.service_url = service_url
+        self._session: aiohttp.ClientSession | None = None
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=REQUEST_TIMEOUT,
+                connector=aiohttp.TCPConnector(limit=POOL_SIZE, ttl_dns_cache=300),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def shorten(self, url: str) -> str | None:
+        """
+        Короткая ссылка или None, если сервис отказался её сокращать.
+        :raises ShortenerError: сервис недоступен или ответил ошибкой 5xx
+        """
+        normalized = normalize_url(url)
+        key = "short_url:" + hashlib.sha1(normalized.encode()).hexdigest()
+        cached = await self.redis_client.get(key)
+        if cached:
+            return cached
+
+        if normalized in self._in_flight:
+            return await asyncio.shield(self._in_flight[normalized])
+
+        future = asyncio.ensure_future(self._request(url, key))
+        self._in_flight[normalized] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._in_flight.pop(normalized, None)
+            else:
+                future.add_done_callback(lambda _: self._in_flight.pop(normalized, None))
+
+    async def _request(self, url: str, key: str) -> str | None:
+        try:
+            async with self._get_session().get(self.service_url, params={"url": url}) as response:
+                if response.status >= 500:
+                    logging.warning(f"Link shortener responded with {response.status}")
+                    raise ShortenerError(f"Link shortener responded with {response.status}")
+                if response.status != 200:
+                    return None
+                link = (await response.text()).strip()
+            if not link:
+                return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"Link shortener is unavailable: {e!r}")
+            raise ShortenerError(str(e)) from e
+
+        await self.redis_client.set(key, link, CACHE_TTL)
+        return link
+
+
+shortener = LinkShortener(redis_client)
@@ -1,82 +1,140 @@
 import json
-import logging
 import os
 from contextlib import asynccontextmanager
-from typing import Callable, Any, Union
+from typing import Union, Sequence
 
 from aiogram.types import BotCommand
 from fastapi import FastAPI
-from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.openapi.docs import (
     get_redoc_html,
     get_swagger_ui_html,
     get_swagger_ui_oauth2_redirect_html,
 )
 from pydantic import BaseModel, Field
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
 
-from config import FAST_API_VERSION, WEBHOOK_URL
-from tg.loader import bot
-from db.db_config import engine, sessionmanager, config
-from tg.index import bot_router
+from config import FAST_API_VERSION, WEBHOOK_URL, WEBHOOK_FAST_ACK, LOG_LEVEL
+from tg.loader import get_bot, close_bot
+from db.db_config import sessionmanager
+from db.redis_client import redis_client
+from db.user_cache import user_cache
+from tg.index import bot_router, pipeline, error_reporter
+from logic.shortener import shortener
+from tg.logs import setup_logging, stop_logging
+from tg.metrics import render as render_metrics
 
-logging.basicConfig(level=logging.INFO)
-
-sessionmanager.init(config.DB_CONFIG)
+setup_logging(LOG_LEVEL)
 
 
 def strip_strings(data: Union[dict, list, str]) -> Union[dict, list, str]:
     """
     Функция удаляет из строковых параметров тела запроса пробелы и переносы строк.
+    Если изменять нечего, возвращается тот же самый объект — так вызывающий код
+    понимает, что тело можно не сериализовать заново.
     :param data: тело запроса
     :return: модифицироварнное тело запроса
     """
     if isinstance(data, dict):
-        return {k: strip_strings(v) for k, v in data.items()}
+        result = None
+        for key, value in data.items():
+            stripped = strip_strings(value)
+            if stripped is not value:
+                if result is None:
+                    result = dict(data)
+                result[key] = stripped
+        return data if result is None else result
     elif isinstance(data, list):
-        return [strip_strings(item) for item in data]
+        result = None
+        for index, item in enumerate(data):
+            stripped = strip_strings(item)
+            if stripped is not item:
+                if result is None:
+                    result = list(data)
+                result[index] = stripped
+        return data if result is None else result
     elif isinstance(data, str):
-        return data.strip(" \t\n\r")
+        stripped = data.strip(" \t\n\r")
+        return data if len(stripped) == len(data) else stripped
     return data
 
 
-class StripMiddleware(BaseHTTPMiddleware):
+class StripMiddleware:
     """
-    Middleware, который обрабатывает JSON поля входящих POST, PUT, PATCH запросов, с целью
+    ASGI middleware, который обрабатывает JSON поля входящих POST, PUT, PATCH запросов, с целью
     исключить пробельные символы по бокам строковых параметров.
+    Обрабатываются только пути из include_paths, кроме exclude_paths (по префиксу).
+    Вебхук телеграма исключён: апдейты не нуждаются в очистке и разбираются самим эндпоинтом.
     """
 
-    async def dispatch(self, request: Request, call_next: Callable[[Request], Any]):
-        async def parse_json(body: bytes) -> dict:
-            json_body = json.loads(body)
-            return strip_strings(json_body)
-
-        try:
-            if (
-                    request.method in ["POST", "PUT", "PATCH"]
-                    and not "/admin" in request.url.path
-            ):
-                body = await request.body()
-                if body:
-                    modified_body = await parse_json(body)
-                    request._body = json.dumps(modified_body).encode("utf-8")
-        except:
-            pass
-        response = await call_next(request)
-        return response
+    methods = {"POST", "PUT", "PATCH"}
+
+    def __init__(self, app: ASGIApp,
+                 include_paths: Sequence[str] = ("/",),
+                 exclude_paths: Sequence[str] = ("/admin", "/bot/webhook")):
+        self.app = app
+        self.include_paths = tuple(include_paths)
+        self.exclude_paths = tuple(exclude_paths)
+
+    def _applies(self, scope: Scope) -> bool:
+        if scope["type"] != "http" or scope["method"] not in self.methods:
+            return False
+        path = scope["path"]
+        if not path.startswith(self.include_paths) or path.startswith(self.exclude_paths):
+            return False
+        content_type = dict(scope["headers"]).get(b"content-type", b"")
+        return b"json" in content_type
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self._applies(scope):
+            return await self.app(scope, receive, send)
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                # Клиент отключился, не дочитав тело — отдаём как есть
+                return await self.app(scope, receive, send)
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        if body:
+            try:
+                data = json.loads(body)
+                stripped = strip_strings(data)
+                if stripped is not data:
+                    body = json.dumps(stripped).encode("utf-8")
+                    scope = dict(scope)
+                    scope["headers"] = [(name, value) for name, value in scope["headers"] if name != b"content-length"]
+                    scope["headers"].append((b"content-length", str(len(body)).encode()))
+            except ValueError:
+                pass
+
+        body_sent = False
+
+        async def replay() -> Message:
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(scope, replay, send)
 
 
 def init_app(init_db=True):
     lifespan = None
 
     if init_db:
-        sessionmanager.init(config.DB_CONFIG)
-
         @asynccontextmanager
         async def lifespan(app: FastAPI):
+            await sessionmanager.open()
+            bot = get_bot()
             if WEBHOOK_URL:
                 try:
                     #await bot.set_webhook(WEBHOOK_URL, drop_pending_updates=True)
@@ -88,9 +146,21 @@ def init_app(init_db=True):
                 except:
                     pass
                 #print("webhook is set!")
+            error_reporter.start(bot)
+            user_cache.start()
+            if WEBHOOK_FAST_ACK:
+                await pipeline.start()
             yield
-            if sessionmanager._engine is not None:
-                await sessionmanager.close()
+            if WEBHOOK_FAST_ACK:
+                await pipeline.stop()
+            await error_reporter.stop()
+            await user_cache.stop()
+            await shortener.close()
+            await sessionmanager.close()
+            # Хранилище FSM и redis_client делят один пул соединений
+            await redis_client.close()
+            await close_bot()
+            stop_logging()
 
     # Создать папку static, files, если они не существуют
     folders_to_create = ["static", "files"]
@@ -102,6 +172,7 @@ def init_app(init_db=True):
         title="SecretSanta Backend",
         lifespan=lifespan,
         version=FAST_API_VERSION,
+        default_response_class=ORJSONResponse,
         docs_url=None,
         redoc_url=None,
         description="Тут пока нет описания, но оно когда-нибудь будет",
@@ -145,6 +216,43 @@ async def health_check():
     return {"status": "ok"}
 
 
+class PoolStatsResponse(BaseModel):
+    checkouts: int = Field(..., description="Выдано соединений с запуска процесса")
+    waits: int = Field(..., description="Сколько выдач ждали освобождения соединения")
+    wait_time: float = Field(..., description="Суммарное время ожидания, с")
+    max_wait: float = Field(..., description="Максимальное время ожидания, с")
+    timeouts: int = Field(..., description="Сколько выдач завершились таймаутом")
+    size: int | None = Field(None, description="Размер пула")
+    checked_out: int | None = Field(None, description="Соединений выдано сейчас")
+    overflow: int | None = Field(None, description="Текущий overflow пула")
+    saturation: float | None = Field(None, description="Доля занятых соединений от size + max_overflow")
+
+
+@app.get(
+    "/stats/db_pool",
+    description="Возвращает статистику пула соединений с базой данных текущего процесса.",
+    summary=" - Пул соединений с базой",
+    responses={200: {"model": PoolStatsResponse, "description": "Статистика пула"}},
+    response_description="Статистика пула",
+    tags=["Статистика"],
+)
+async def db_pool_stats():
+    return sessionmanager.pool_stats()
+
+
+@app.get(
+    "/metrics",
+    description="Метрики хэндлеров бота в формате Prometheus: время обработки, SQL-запросы, "
+                "команды redis и вызовы Bot API.",
+    summary=" - Метрики Prometheus",
+    response_class=Response,
+    tags=["Статистика"],
+)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
 # @app.get("/docs", include_in_schema=False)
 # async def custom_swagger_ui_html():
 #     return get_swagger_ui_html(
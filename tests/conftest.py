@@ -0,0 +1,52 @@
+"""
+Общие фикстуры тестов.
+
+Тесты не ходят во внешние сервисы: redis заменяется fakeredis, Bot API и сокращатель
+ссылок — локальными заглушками. Тесты, которым нужен настоящий Postgres, пропускаются,
+если не задан TEST_DATABASE_URL (пустая база, схема в ней пересоздаётся).
+
+Запуск из корня проекта:
+    pip install -r requirements-dev.txt
+    python -m pytest
+"""
+import os
+
+# config читает обязательные настройки при импорте; к redis по ним никто не подключается
+for name, value in {"ADMIN_CHAT_ID": "1", "ADMIN_ID": "1", "THREAD_ID": "1", "BOT_TOKEN": "1:test",
+                    "REDIS_HOST": "localhost", "REDIS_PORT": "6379", "REDIS_DB": "0"}.items():
+    os.environ.setdefault(name, value)
+
+import fakeredis
+import pytest
+from fakeredis.aioredis import FakeConnection
+from redis import asyncio as aioredis
+
+from db.db_config import DatabaseSessionManager
+from db.redis_client import AsyncRedisClient
+
+
+@pytest.fixture
+async def redis_client():
+    """
+    AsyncRedisClient поверх fakeredis, у каждого теста своя пустая база.
+    """
+    pool = aioredis.ConnectionPool(connection_class=FakeConnection, server=fakeredis.FakeServer())
+    client = AsyncRedisClient(pool)
+    yield client
+    await client.close()
+
+
+@pytest.fixture
+async def sessionmanager():
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    manager = DatabaseSessionManager()
+    manager.init(url)
+    async with manager.connect() as connection:
+        await manager.drop_all(connection)
+        await manager.create_all(connection)
+    yield manager
+    async with manager.connect() as connection:
+        await manager.drop_all(connection)
+    await manager.close()
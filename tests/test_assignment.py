@@ -0,0 +1,66 @@
+import itertools
+from collections import Counter
+
+import pytest
+
+from logic.assignment import derangement, single_cycle
+
+SAMPLES = 9000
+# Квантиль 0.999 распределения хи-квадрат: 8 и 5 степеней свободы
+CHI2_CRITICAL = {8: 26.12, 5: 20.52}
+
+
+def chi_square(counts: Counter, outcomes: int) -> float:
+    expected = SAMPLES / outcomes
+    assert len(counts) == outcomes
+    return sum((count - expected) ** 2 / expected for count in counts.values())
+
+
+def cycle_length(assignments: dict, start) -> int:
+    length, current = 1, assignments[start]
+    while current != start:
+        length, current = length + 1, assignments[current]
+    return length
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 7, 50])
+def test_derangement_has_no_fixed_points(n):
+    participants = [f"user{i}" for i in range(n)]
+    for seed in range(200):
+        assignments = derangement(participants, seed=seed)
+        assert sorted(assignments.values()) == sorted(participants)
+        assert all(giver != receiver for giver, receiver in assignments.items())
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 7, 50])
+def test_single_cycle_visits_everyone(n):
+    participants = list(range(n))
+    for seed in range(200):
+        assignments = single_cycle(participants, seed=seed)
+        assert sorted(assignments.values()) == participants
+        assert cycle_length(assignments, participants[0]) == n
+
+
+def test_derangements_of_four_are_uniform():
+    participants = [0, 1, 2, 3]
+    all_derangements = [permutation for permutation in itertools.permutations(participants)
+                        if all(giver != receiver for giver, receiver in enumerate(permutation))]
+    counts = Counter(tuple(derangement(participants, seed=seed).values()) for seed in range(SAMPLES))
+
+    assert set(counts) == set(all_derangements)
+    assert chi_square(counts, len(all_derangements)) < CHI2_CRITICAL[len(all_derangements) - 1]
+
+
+def test_single_cycles_of_four_are_uniform():
+    participants = [0, 1, 2, 3]
+    counts = Counter(tuple(single_cycle(participants, seed=seed)[giver] for giver in participants)
+                     for seed in range(SAMPLES))
+
+    # Циклов длины 4 на четырёх участниках (4 - 1)! = 6
+    assert chi_square(counts, 6) < CHI2_CRITICAL[5]
+
+
+def test_too_few_participants():
+    for function in (derangement, single_cycle):
+        with pytest.raises(ValueError):
+            function([1])
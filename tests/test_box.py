@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from tg.handlers import box as box_handlers
+
+ADMIN_ID = 5
+CARD_TEXT = "<b>Коробка</b>"
+CARD_KB = object()
+
+
+def shuffle_call():
+    events = []
+    message = SimpleNamespace(chat=SimpleNamespace(id=ADMIN_ID), message_id=100, html_text=CARD_TEXT,
+                              reply_markup=CARD_KB)
+    message.edit_text = AsyncMock(side_effect=lambda text, **kwargs: events.append(("edit", text)))
+    call = SimpleNamespace(data="shuffle_box:7", from_user=SimpleNamespace(id=ADMIN_ID), message=message,
+                           answer=AsyncMock(side_effect=lambda text: events.append(("answer", text))))
+    return call, events
+
+
+@pytest.fixture(autouse=True)
+def box(monkeypatch):
+    monkeypatch.setattr(box_handlers.Box, "get", AsyncMock(return_value=SimpleNamespace(admin_id=ADMIN_ID)))
+
+
+async def test_message_is_edited_before_draw_is_queued(monkeypatch):
+    call, events = shuffle_call()
+
+    async def start_draw(*args):
+        events.append(("start_draw", None))
+        return True
+
+    monkeypatch.setattr(box_handlers, "start_draw", start_draw)
+    await box_handlers.shuffle_box_handler(call, db=None)
+
+    assert [event for event, _ in events] == ["edit", "start_draw"]
+    assert events[0][1].startswith("⏳ Жеребьёвка запущена")
+
+
+async def test_card_is_restored_when_draw_is_already_running(monkeypatch):
+    call, events = shuffle_call()
+    monkeypatch.setattr(box_handlers, "start_draw", AsyncMock(return_value=False))
+
+    await box_handlers.shuffle_box_handler(call, db=None)
+
+    assert events[1] == ("edit", CARD_TEXT)
+    assert call.message.edit_text.call_args.kwargs["reply_markup"] is CARD_KB
+    assert events[2][0] == "answer"
+
+
+async def test_card_is_restored_when_queueing_fails(monkeypatch):
+    call, events = shuffle_call()
+    monkeypatch.setattr(box_handlers, "start_draw", AsyncMock(side_effect=ConnectionError))
+
+    with pytest.raises(ConnectionError):
+        await box_handlers.shuffle_box_handler(call, db=None)
+
+    assert events[-1] == ("edit", CARD_TEXT)
@@ -0,0 +1,98 @@
+import datetime
+
+import pytest
+from kombu.exceptions import OperationalError
+from sqlalchemy import select
+
+from celery_app import tasks
+from db.models import User, Box, UserRoom, BoxExclusion
+
+PROFILE = {"hobby": "Пазлы"}
+
+
+async def seed_box(sessionmanager, members: int) -> int:
+    now = datetime.datetime.now()
+    async with sessionmanager.session() as db:
+        await User.bulk_create(db, [dict(id=user_id, username=f"user{user_id}", full_name=f"User {user_id}")
+                                    for user_id in range(1, members + 2)], commit=False)
+        box = Box(name="Тест", join_code="test", admin_id=1, final_reg_date=now, max_gift_price=1000, gift_date=now)
+        db.add(box)
+        await db.flush()
+        await UserRoom.bulk_create(db, [dict(user_id=user_id, box_id=box.id, profile=PROFILE)
+                                        for user_id in range(1, members + 1)], commit=False)
+        await db.commit()
+        return box.id
+
+
+async def test_draw_saves_assignments(sessionmanager):
+    box_id = await seed_box(sessionmanager, 3)
+
+    async with sessionmanager.session() as db:
+        result = await tasks.assign_receivers(db, box_id)
+
+    assert sorted(result) == [1, 2, 3]
+    async with sessionmanager.session() as db:
+        rooms = await UserRoom.get_by_kwargs(db, multiple=True, box_id=box_id)
+        box = await Box.get_by_kwargs(db, id=box_id)
+    assert sorted(room.user_gift_to_id for room in rooms) == [1, 2, 3]
+    assert box.drawn_at is not None
+
+
+async def test_draw_refuses_when_user_joins_during_draw(sessionmanager, monkeypatch):
+    box_id = await seed_box(sessionmanager, 3)
+    save_assignments = tasks.save_assignments
+
+    async def join_and_save(db, box_id, assignments):
+        # Участник вступает после чтения состава, но до записи результата
+        async with sessionmanager.session() as other:
+            await UserRoom.upsert(other, dict(user_id=4, box_id=box_id, profile=PROFILE), update=[])
+        return await save_assignments(db, box_id, assignments)
+
+    monkeypatch.setattr(tasks, "save_assignments", join_and_save)
+    async with sessionmanager.session() as db:
+        result = await tasks.assign_receivers(db, box_id)
+
+    assert isinstance(result, str)
+    async with sessionmanager.session() as db:
+        rooms = await db.execute(select(UserRoom.user_id, UserRoom.user_gift_to_id).filter_by(box_id=box_id))
+        box = await Box.get_by_kwargs(db, id=box_id)
+    assert dict(rooms.all()) == {1: None, 2: None, 3: None, 4: None}
+    assert box.drawn_at is None
+
+
+async def test_impossible_draw_lists_at_most_ten_names(sessionmanager):
+    box_id = await seed_box(sessionmanager, 30)
+    async with sessionmanager.session() as db:
+        # Никто не может дарить участнику 1
+        await BoxExclusion.bulk_create(db, [dict(box_id=box_id, giver_id=user_id, receiver_id=1)
+                                            for user_id in range(2, 31)])
+
+    async with sessionmanager.session() as db:
+        result = await tasks.assign_receivers(db, box_id)
+
+    assert isinstance(result, str)
+    assert result.count("(@user") == tasks.MATCHING_ERROR_NAMES
+    assert "и ещё 20" in result
+
+
+async def test_start_draw_holds_lock(redis_client, monkeypatch):
+    queued = []
+    monkeypatch.setattr(tasks.draw_box, "delay", lambda *args: queued.append(args))
+
+    assert await tasks.start_draw(redis_client, 7, 1, 100)
+    assert not await tasks.start_draw(redis_client, 7, 1, 101)
+
+    assert queued == [(7, 1, 100)]
+    assert await redis_client.ttl(tasks.draw_lock_key(7)) > 0
+
+
+async def test_start_draw_releases_lock_when_broker_is_down(redis_client, monkeypatch):
+    def delay(*args):
+        raise OperationalError("Connection refused")
+
+    monkeypatch.setattr(tasks.draw_box, "delay", delay)
+
+    with pytest.raises(OperationalError):
+        await tasks.start_draw(redis_client, 7, 1, 100)
+
+    assert await redis_client.ttl(tasks.draw_lock_key(7)) == -2
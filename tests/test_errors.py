@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import SendDocument
+
+from tg.errors import ErrorReporter
+
+
+def error(message: str) -> Exception:
+    try:
+        raise ValueError(message)
+    except ValueError as e:
+        return e
+
+
+def other_error() -> Exception:
+    try:
+        raise KeyError("box_id")
+    except KeyError as e:
+        return e
+
+
+class FakeBot:
+    def __init__(self, on_send=None):
+        self.documents = []
+        self.on_send = on_send
+
+    async def send_document(self, chat_id, document, caption):
+        if self.on_send is not None:
+            await self.on_send(len(self.documents))
+        self.documents.append(document.data.decode())
+
+
+@pytest.fixture
+def reporter(tmp_path):
+    return ErrorReporter(admin_id=1, interval=100, min_interval=0.01, reports_dir=str(tmp_path))
+
+
+async def test_groups_survive_failed_send(reporter):
+    attempts = []
+
+    async def fail_once(sent):
+        attempts.append(sent)
+        if len(attempts) == 1:
+            # Пока сводка отправляется, та же ошибка повторяется
+            reporter.capture(error("boom"), {"step": 2})
+            raise TelegramNetworkError(method=SendDocument(chat_id=1, document="x"), message="timeout")
+
+    reporter._bot = FakeBot(fail_once)
+    reporter.capture(error("boom"), {"step": 1})
+    reporter.capture(error("boom"), {"step": 1})
+
+    with pytest.raises(TelegramNetworkError):
+        await reporter.flush()
+    [group] = reporter._groups.values()
+    assert group.count == 3
+    assert list(group.samples) == ["{'step': 1}", "{'step': 1}", "{'step': 2}"]
+
+    await reporter.flush()
+    assert "Ошибок: 3, групп: 1" in reporter._bot.documents[0]
+    assert reporter._groups == {}
+
+
+async def test_group_captured_during_flush_is_sent_without_waiting_interval(reporter):
+    async def capture_while_sending(sent):
+        if not sent:
+            reporter.capture(other_error())
+            await asyncio.sleep(0.01)
+
+    bot = FakeBot(capture_while_sending)
+    reporter.capture(error("boom"))
+    reporter.start(bot)
+    try:
+        for _ in range(100):
+            if len(bot.documents) == 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await reporter.stop()
+
+    assert len(bot.documents) == 2
+    assert "KeyError" in bot.documents[1]
@@ -0,0 +1,258 @@
+from types import SimpleNamespace
+
+import pytest
+from aiogram.dispatcher.middlewares.user_context import EVENT_CONTEXT_KEY, EventContext
+from aiogram.fsm.storage.memory import DisabledEventIsolation
+from aiogram.types import Chat, User
+
+from db.redis_client import CountingRedis, CountingPipeline
+from tg.fsm import FSMStorage, BufferedFSMContextMiddleware, STATE_TTLS
+from tg.states import SurveyState, FillGiftsState
+
+BOT_ID = 1
+USER_ID = 777_000_001
+INITIAL_DATA = {"question_index": 3, "box_id": 1, "answers": {"hobby": "Пазлы"}}
+
+
+class RecordingStorage(FSMStorage):
+    """
+    FSMStorage, который считает пайплайны чтения и записи.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loads = 0
+        self.saves = 0
+
+    async def load(self, key):
+        self.loads += 1
+        return await super().load(key)
+
+    async def save(self, key, state, data):
+        self.saves += 1
+        await super().save(key, state, data)
+
+
+@pytest.fixture
+async def storage(redis_client):
+    storage = RecordingStorage(redis=redis_client.redis)
+    await storage.save(key(storage), SurveyState.waiting_for_answer.state, INITIAL_DATA)
+    storage.saves = 0
+    return storage
+
+
+def key(storage: FSMStorage):
+    middleware = BufferedFSMContextMiddleware(storage=storage, events_isolation=DisabledEventIsolation())
+    return middleware.resolve_context(SimpleNamespace(id=BOT_ID), USER_ID, USER_ID).key
+
+
+class RoundTrips:
+    """
+    Считает обращения к серверу redis: каждую отдельную команду и каждый пайплайн целиком.
+    """
+
+    def __init__(self, monkeypatch):
+        self.count = 0
+        execute_command, execute = CountingRedis.execute_command, CountingPipeline.execute
+
+        async def counted_execute_command(client, *args, **options):
+            self.count += 1
+            return await execute_command(client, *args, **options)
+
+        async def counted_execute(pipe, raise_on_error: bool = True):
+            self.count += 1
+            return await execute(pipe, raise_on_error)
+
+        monkeypatch.setattr(CountingRedis, "execute_command", counted_execute_command)
+        monkeypatch.setattr(CountingPipeline, "execute", counted_execute)
+
+
+@pytest.fixture
+def round_trips(monkeypatch):
+    return RoundTrips(monkeypatch)
+
+
+async def run_update(storage: FSMStorage, handler, round_trips: RoundTrips) -> int:
+    """
+    Прогоняет апдейт через middleware и возвращает число обращений к redis.
+    """
+    middleware = BufferedFSMContextMiddleware(storage=storage, events_isolation=DisabledEventIsolation())
+
+    async def call_handler(event, data):
+        await handler(data["state"])
+
+    data = {
+        "bot": SimpleNamespace(id=BOT_ID),
+        EVENT_CONTEXT_KEY: EventContext(chat=Chat(id=USER_ID, type="private"),
+                                        user=User(id=USER_ID, is_bot=False, first_name="Санта")),
+    }
+    round_trips.count = 0
+    await middleware(call_handler, None, data)
+    return round_trips.count
+
+
+async def read_only(state):
+    await state.get_state()
+    data = await state.get_data()
+    await state.get_value("box_id")
+    # Изменение копии не меняет данные контекста
+    data["answers"]["hobby"] = "Шахматы"
+
+
+async def survey_answer(state):
+    data = await state.get_data()
+    answers = data.get("answers", {})
+    answers["free_time"] = "Катаюсь на велосипеде"
+    await state.update_data(question_index=data.get("question_index", 0) + 1, answers=answers)
+
+
+async def survey_finish(state):
+    data = await state.get_data()
+    await state.set_state(SurveyState.finished)
+    await state.update_data(answers=data["answers"])
+    await state.update_data(box_id=int(data["box_id"]))
+    await state.set_state(FillGiftsState.waiting_for_gift_url)
+
+
+async def clear(state):
+    await state.clear()
+
+
+async def no_fsm(state):
+    pass
+
+
+@pytest.mark.parametrize("handler", [survey_answer, survey_finish, clear])
+async def test_one_load_and_one_save(storage, round_trips, handler):
+    assert await run_update(storage, handler, round_trips) == 2
+    assert storage.loads == 1
+    assert storage.saves == 1
+
+
+@pytest.mark.parametrize("handler", [read_only, no_fsm])
+async def test_unchanged_state_is_not_written(storage, round_trips, handler):
+    assert await run_update(storage, handler, round_trips) == 1
+    assert storage.saves == 0
+    assert await storage.load(key(storage)) == (SurveyState.waiting_for_answer.state, INITIAL_DATA)
+
+
+async def test_set_state_and_update_data_saved_in_one_write(storage, redis_client, round_trips):
+    async def handler(state):
+        await state.set_state(FillGiftsState.waiting_for_gift_url)
+        await state.update_data(gift_url="https://clck.ru/3Ex2Aa")
+
+    assert await run_update(storage, handler, round_trips) == 2
+
+    assert storage.loads == 1
+    assert storage.saves == 1
+    state, data = await storage.load(key(storage))
+    assert state == FillGiftsState.waiting_for_gift_url.state
+    assert data == {**INITIAL_DATA, "gift_url": "https://clck.ru/3Ex2Aa"}
+    # Оба ключа получают TTL нового шага
+    ttl = STATE_TTLS[FillGiftsState.waiting_for_gift_url]
+    for part in ("state", "data"):
+        assert ttl - 5 <= await redis_client.redis.ttl(storage.key_builder.build(key(storage), part)) <= ttl
+
+
+async def test_changes_are_saved_when_handler_fails(storage, round_trips):
+    async def handler(state):
+        await state.update_data(question_index=4)
+        raise RuntimeError("handler failed")
+
+    with pytest.raises(RuntimeError):
+        await run_update(storage, handler, round_trips)
+
+    assert storage.saves == 1
+    _, data = await storage.load(key(storage))
+    assert data["question_index"] == 4
+
+
+class LruRedis:
+    """
+    Заглушка redis для sweep: у ключей есть время простоя, которое GET сбрасывает,
+    а SCAN отдаёт ключи заданными пакетами. fakeredis не поддерживает OBJECT и MEMORY.
+    """
+
+    def __init__(self, keys: dict[str, tuple[str, int, int]], batches: list[list[str]]):
+        # ключ -> (значение, TTL, простой)
+        self.keys = {key: list(value) for key, value in keys.items()}
+        self.batches = batches
+
+    async def info(self, section):
+        return {"used_memory": 0}
+
+    async def scan(self, cursor, match, count):
+        return (cursor + 1) % len(self.batches), self.batches[cursor]
+
+    def pipeline(self, transaction=True):
+        return LruPipeline(self)
+
+
+class LruPipeline:
+    def __init__(self, redis: LruRedis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    async def execute(self, raise_on_error=True):
+        keys = self.redis.keys
+        results = []
+        for name, args in self.commands:
+            key = args[-1] if name == "object" else args[0]
+            if name == "ttl":
+                results.append(keys[key][1] if key in keys else -2)
+            elif name == "object":
+                results.append(keys[key][2] if key in keys else None)
+            elif name == "memory_usage":
+                results.append(100 if key in keys else None)
+            elif name == "get":
+                if key in keys:
+                    keys[key][2] = 0
+                results.append(keys[key][0].encode() if key in keys else None)
+            elif name == "unlink":
+                results.append(int(keys.pop(key, None) is not None))
+            elif name == "expire":
+                keys[key][1] = args[1]
+                results.append(1)
+        return results
+
+
+def dialog_keys(storage: FSMStorage, user_id: int) -> tuple[str, str]:
+    key = storage.key_builder.build
+    storage_key = BufferedFSMContextMiddleware(storage=storage, events_isolation=DisabledEventIsolation()) \
+        .resolve_context(SimpleNamespace(id=BOT_ID), user_id, user_id).key
+    return key(storage_key, "state"), key(storage_key, "data")
+
+
+async def test_sweep_judges_legacy_dialog_as_a_whole():
+    storage = FSMStorage(redis=None)
+    abandoned_state, abandoned_data = dialog_keys(storage, 1)
+    active_state, active_data = dialog_keys(storage, 2)
+    _, orphan_data = dialog_keys(storage, 3)
+    month, ttl = 30 * 24 * 60 * 60, STATE_TTLS[SurveyState.finished]
+    storage.redis = LruRedis(
+        {
+            abandoned_state: (SurveyState.finished.state, -1, month),
+            abandoned_data: ("{}", -1, month),
+            active_state: (SurveyState.finished.state, -1, 100),
+            active_data: ("{}", -1, 100),
+            orphan_data: ("{}", -1, 5),
+        },
+        # Данные встречаются раньше своего состояния
+        batches=[[abandoned_data, active_data, orphan_data], [abandoned_state, active_state]],
+    )
+
+    stats = await storage.sweep()
+
+    assert set(storage.redis.keys) == {active_state, active_data}
+    assert storage.redis.keys[active_state][1] == ttl - 100
+    assert storage.redis.keys[active_data][1] == ttl - 100
+    assert (stats.scanned, stats.deleted, stats.expire_set) == (5, 3, 2)
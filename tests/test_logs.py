@@ -0,0 +1,50 @@
+import logging
+import threading
+
+import orjson
+import pytest
+
+from tg import logs
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers, root.level
+    yield root
+    logs.stop_logging()
+    root.handlers, root.level = handlers, level
+
+
+def records(capsys) -> list[dict]:
+    return [orjson.loads(line) for line in capsys.readouterr().err.splitlines()]
+
+
+def test_exception_is_formatted_by_listener(root_logger, capsys, monkeypatch):
+    threads = []
+    format_record = logs.JsonFormatter.format
+
+    def record_thread(self, record):
+        threads.append(threading.get_ident())
+        return format_record(self, record)
+
+    monkeypatch.setattr(logs.JsonFormatter, "format", record_thread)
+    logs.setup_logging()
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logging.getLogger("test").exception("Failed to handle %s", "update")
+    logs.stop_logging()
+
+    [record] = records(capsys)
+    assert record["message"] == "Failed to handle update"
+    assert "ValueError: boom" in record["exception"]
+    assert threads and threading.get_ident() not in threads
+
+
+def test_records_after_stop_are_written(root_logger, capsys):
+    logs.setup_logging()
+    logs.stop_logging()
+    logging.getLogger("test").warning("after shutdown")
+
+    assert [record["message"] for record in records(capsys)] == ["after shutdown"]
@@ -0,0 +1,113 @@
+import itertools
+import random
+
+import pytest
+
+from logic.matching import match, MatchingError
+
+
+def random_exclusions(participants: list[int], density: float, rng: random.Random) -> list[tuple[int, int]]:
+    return [(giver, receiver) for giver in participants for receiver in participants
+            if giver != receiver and rng.random() < density]
+
+
+def assert_valid(participants, exclusions, assignments):
+    forbidden = set(exclusions)
+    assert sorted(assignments) == sorted(participants)
+    assert sorted(assignments.values()) == sorted(participants)
+    for giver, receiver in assignments.items():
+        assert giver != receiver
+        assert (giver, receiver) not in forbidden
+
+
+def assert_certificate(participants, exclusions, error: MatchingError):
+    """
+    Группа из ошибки доказывает невозможность: подопечных, доступных ей, меньше, чем дарителей.
+    """
+    forbidden = set(exclusions)
+    assert len(set(error.receivers)) < len(set(error.givers))
+    for giver in error.givers:
+        allowed = {receiver for receiver in participants if receiver != giver and (giver, receiver) not in forbidden}
+        assert allowed <= set(error.receivers)
+
+
+def feasible(participants, exclusions) -> bool:
+    forbidden = set(exclusions)
+    return any(all(giver != receiver and (giver, receiver) not in forbidden
+                   for giver, receiver in zip(participants, permutation))
+               for permutation in itertools.permutations(participants))
+
+
+@pytest.mark.parametrize("n", [2, 3, 10, 100, 1000])
+@pytest.mark.parametrize("density", [0, 0.05, 0.3])
+def test_assignment_is_valid(n, density):
+    rng = random.Random(n)
+    participants = list(range(1, n + 1))
+    exclusions = random_exclusions(participants, density if n > 3 else 0, rng)
+
+    for seed in range(5):
+        assert_valid(participants, exclusions, match(participants, exclusions, seed=seed))
+
+
+def test_agrees_with_brute_force():
+    rng = random.Random(2025)
+    for _ in range(300):
+        participants = list(range(rng.randint(2, 6)))
+        exclusions = random_exclusions(participants, rng.choice([0.2, 0.4, 0.6]), rng)
+        try:
+            assignments = match(participants, exclusions, seed=rng.getrandbits(32))
+        except MatchingError as e:
+            assert not feasible(participants, exclusions)
+            assert_certificate(participants, exclusions, e)
+        else:
+            assert_valid(participants, exclusions, assignments)
+
+
+def test_giver_excluded_from_everyone():
+    participants = [1, 2, 3, 4]
+    exclusions = [(1, 2), (1, 3), (1, 4)]
+
+    with pytest.raises(MatchingError) as error:
+        match(participants, exclusions)
+
+    assert error.value.givers == [1]
+    assert error.value.receivers == []
+
+
+def test_receiver_excluded_for_every_giver():
+    participants = [1, 2, 3, 4]
+    exclusions = [(2, 1), (3, 1), (4, 1)]
+
+    with pytest.raises(MatchingError) as error:
+        match(participants, exclusions)
+
+    assert sorted(error.value.givers) == participants
+    assert sorted(error.value.receivers) == [2, 3, 4]
+
+
+def test_group_with_too_few_receivers():
+    # Участники 1, 2 и 3 могут дарить только 4
+    participants = [1, 2, 3, 4, 5]
+    exclusions = [(giver, receiver) for giver in (1, 2, 3) for receiver in (1, 2, 3, 5) if giver != receiver]
+
+    with pytest.raises(MatchingError) as error:
+        match(participants, exclusions, seed=1)
+
+    assert set(error.value.givers) <= {1, 2, 3} and len(error.value.givers) >= 2
+    assert error.value.receivers == [4]
+    assert_certificate(participants, exclusions, error.value)
+
+
+@pytest.mark.parametrize("exclusions", [[], [(1, 2), (3, 4), (5, 6), (7, 1)]])
+def test_seeded_run_is_deterministic(exclusions):
+    participants = list(range(1, 21))
+
+    first = match(participants, exclusions, seed=42)
+
+    assert match(participants, exclusions, seed=42) == first
+    assert any(match(participants, exclusions, seed=seed) != first for seed in range(43, 53))
+
+
+def test_duplicate_participants_are_rejected():
+    with pytest.raises(ValueError):
+        match([1, 2, 2], [(1, 2)])
@@ -0,0 +1,121 @@
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from tg.loader import create_bot
+from tg.metrics import render
+from tg.outbound import RedisRateLimiter, OutboundScheduler, Priority, bulk_priority
+
+
+def sample(name: str, labels: str = "") -> float:
+    body = render()[0].decode()
+    prefix = f"{name}{labels} "
+    return sum(float(line[len(prefix):]) for line in body.splitlines() if line.startswith(prefix))
+
+
+async def test_processes_share_global_budget(redis_client):
+    # Два процесса с одной корзиной на 5 сообщений
+    first = RedisRateLimiter(redis_client, global_rate=5, chat_rate=1, chat_burst=3)
+    second = RedisRateLimiter(redis_client, global_rate=5, chat_rate=1, chat_burst=3)
+
+    granted = [await limiter.acquire(chat_id, Priority.INTERACTIVE)
+               for chat_id, limiter in enumerate([first, second] * 3)]
+
+    assert [delay for delay, _ in granted[:5]] == [0] * 5
+    delay, chat_limited = granted[5]
+    assert 0 < delay <= 0.2
+    assert not chat_limited
+
+
+async def test_processes_share_chat_budget(redis_client):
+    first = RedisRateLimiter(redis_client, global_rate=30, chat_rate=1, chat_burst=3)
+    second = RedisRateLimiter(redis_client, global_rate=30, chat_rate=1, chat_burst=3)
+
+    for limiter in (first, second, first):
+        assert await limiter.acquire(42, Priority.INTERACTIVE) == (0, False)
+    delay, chat_limited = await second.acquire(42, Priority.INTERACTIVE)
+
+    assert chat_limited
+    assert 0 < delay <= 1
+    assert await second.acquire(43, Priority.INTERACTIVE) == (0, False)
+
+
+async def test_bulk_backs_off_while_interactive_traffic_is_present(redis_client):
+    web = RedisRateLimiter(redis_client, global_rate=5, bulk_reserve=3)
+    worker = RedisRateLimiter(redis_client, global_rate=5, bulk_reserve=3)
+
+    assert await web.acquire(1, Priority.INTERACTIVE) == (0, False)
+    # Из оставшихся 4 токенов рассылке доступен только 1, остальные — резерв
+    assert await worker.acquire(2, Priority.BULK) == (0, False)
+    delay, chat_limited = await worker.acquire(3, Priority.BULK)
+    assert delay > 0 and not chat_limited
+    # Интерактивный ответ резерв использует
+    assert await web.acquire(4, Priority.INTERACTIVE) == (0, False)
+
+
+async def test_bulk_uses_whole_budget_without_interactive_traffic(redis_client):
+    worker = RedisRateLimiter(redis_client, global_rate=5, bulk_reserve=3)
+
+    for chat_id in range(5):
+        assert await worker.acquire(chat_id, Priority.BULK) == (0, False)
+
+
+async def test_retry_after_blocks_chat_everywhere(redis_client):
+    first = RedisRateLimiter(redis_client)
+    second = RedisRateLimiter(redis_client)
+
+    await first.block(42, 2)
+    delay, chat_limited = await second.acquire(42, Priority.INTERACTIVE)
+
+    assert chat_limited
+    assert 1.5 < delay <= 2
+
+
+async def test_scheduler_serves_interactive_before_bulk(redis_client):
+    scheduler = OutboundScheduler(RedisRateLimiter(redis_client, global_rate=2, chat_rate=10, chat_burst=10))
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(method.text)
+        return "ok"
+
+    async def send(text, bulk=False):
+        if bulk:
+            with bulk_priority():
+                return await scheduler(make_request, None, SendMessage(chat_id=len(text), text=text))
+        return await scheduler(make_request, None, SendMessage(chat_id=len(text), text=text))
+
+    # Корзина на 2 сообщения: рассылка занимает её, интерактивный ответ встаёт в очередь раньше остальных
+    tasks = [asyncio.create_task(send(f"bulk{i}", bulk=True)) for i in range(4)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(send("reply")))
+    await asyncio.gather(*tasks)
+
+    assert sent.index("reply") <= 2
+
+
+async def test_scheduler_state_is_exported(redis_client):
+    bot = create_bot(redis_client)
+    method = SendMessage(chat_id=42, text="Привет")
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(method)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+        return "ok"
+
+    rate_limited, retries, sent = (sample("bot_outbound_rate_limited_total"), sample("bot_outbound_retries_total"),
+                                   sample("bot_outbound_sent_total"))
+    try:
+        assert await bot.outbound(make_request, bot, method) == "ok"
+    finally:
+        await bot.session.close()
+
+    assert len(calls) == 2
+    assert sample("bot_outbound_rate_limited_total") == rate_limited + 1
+    assert sample("bot_outbound_retries_total") == retries + 1
+    assert sample("bot_outbound_sent_total") == sent + 1
+    assert sample("bot_outbound_in_flight") == 0
+    assert sample("bot_outbound_queue_depth", '{priority="interactive"}') == 0
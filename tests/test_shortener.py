@@ -0,0 +1,107 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from logic import shortener as shortener_module
+from logic.shortener import LinkShortener, ShortenerError, CACHE_TTL
+
+URL = "https://www.ozon.ru/product/termokruzhka-123/?utm_source=tg&b=2&a=1#reviews"
+
+
+class StubShortener:
+    """
+    Локальная заглушка clck.ru: запоминает запрошенные ссылки, умеет отвечать
+    с задержкой или ошибкой.
+    """
+
+    def __init__(self):
+        self.requests: list[str] = []
+        self.status = 200
+        self.delay = 0.0
+        self.app = web.Application()
+        self.app.router.add_get("/--", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests.append(request.query["url"])
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return web.Response(status=self.status, text=f"https://clck.ru/{len(self.requests)}")
+
+
+@pytest.fixture
+async def stub():
+    stub = StubShortener()
+    server = TestServer(stub.app)
+    await server.start_server()
+    stub.url = str(server.make_url("/--"))
+    yield stub
+    await server.close()
+
+
+@pytest.fixture
+async def shortener(stub, redis_client):
+    shortener = LinkShortener(redis_client, service_url=stub.url)
+    yield shortener
+    await shortener.close()
+
+
+async def test_shorten_sends_original_url(shortener, stub):
+    assert await shortener.shorten(URL) == "https://clck.ru/1"
+    assert stub.requests == [URL]
+
+
+async def test_cache_hit_makes_no_request(shortener, stub):
+    await shortener.shorten(URL)
+    # Та же ссылка в другом написании попадает в тот же ключ кэша
+    same = "HTTPS://WWW.OZON.RU/product/termokruzhka-123/?a=1&b=2&utm_campaign=santa"
+
+    assert await shortener.shorten(same) == "https://clck.ru/1"
+    assert len(stub.requests) == 1
+
+
+async def test_concurrent_calls_make_one_request(shortener, stub):
+    stub.delay = 0.1
+
+    links = await asyncio.gather(*(shortener.shorten(URL) for _ in range(20)))
+
+    assert links == ["https://clck.ru/1"] * 20
+    assert len(stub.requests) == 1
+
+
+async def test_cached_link_lives_30_days(shortener, redis_client):
+    await shortener.shorten(URL)
+
+    keys = await redis_client.redis.keys("short_url:*")
+    assert len(keys) == 1
+    assert CACHE_TTL == 60 * 60 * 24 * 30
+    assert CACHE_TTL - 5 <= await redis_client.ttl(keys[0]) <= CACHE_TTL
+
+
+async def test_timeout_raises(stub, redis_client, monkeypatch):
+    monkeypatch.setattr(shortener_module, "REQUEST_TIMEOUT", aiohttp.ClientTimeout(total=0.1))
+    stub.delay = 1
+    shortener = LinkShortener(redis_client, service_url=stub.url)
+    try:
+        with pytest.raises(ShortenerError):
+            await shortener.shorten(URL)
+    finally:
+        await shortener.close()
+    assert await redis_client.redis.keys("short_url:*") == []
+
+
+@pytest.mark.parametrize("status", [500, 502, 503])
+async def test_server_error_raises(shortener, stub, redis_client, status):
+    stub.status = status
+
+    with pytest.raises(ShortenerError):
+        await shortener.shorten(URL)
+    assert await redis_client.redis.keys("short_url:*") == []
+
+
+async def test_rejected_url_returns_none(shortener, stub):
+    stub.status = 400
+
+    assert await shortener.shorten(URL) is None
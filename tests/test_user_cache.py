@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from db import user_cache as user_cache_module
+from db.user_cache import UserCache
+
+USER_ID = 42
+
+
+class Database:
+    """
+    Заглушка User.get_by_kwargs: считает запросы и отдаёт текущий список коробок.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.rooms = [SimpleNamespace(id=1, name="Офис")]
+
+    async def get_by_kwargs(self, db, id, profile):
+        self.queries += 1
+        return SimpleNamespace(id=id, username="santa", full_name="Санта", rooms=list(self.rooms))
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = Database()
+    monkeypatch.setattr(user_cache_module.User, "get_by_kwargs", database.get_by_kwargs)
+    return database
+
+
+async def started(cache: UserCache) -> UserCache:
+    cache.start()
+    async with asyncio.timeout(1):
+        while not cache._subscribed:
+            await asyncio.sleep(0.01)
+    return cache
+
+
+@pytest.fixture
+async def workers(redis_client):
+    caches = [await started(UserCache(redis_client)) for _ in range(2)]
+    yield caches
+    for cache in caches:
+        await cache.stop()
+
+
+async def test_invalidation_reaches_other_workers(workers, database):
+    first, second = workers
+    assert (await second.get(None, USER_ID)).rooms == [(1, "Офис")]
+    # Второе чтение — из памяти процесса
+    await second.get(None, USER_ID)
+    assert database.queries == 1
+
+    # Пользователь вступил в коробку через первый процесс
+    database.rooms.append(SimpleNamespace(id=2, name="Семья"))
+    await first.invalidate(USER_ID)
+    async with asyncio.timeout(1):
+        while second._get_local(USER_ID):
+            await asyncio.sleep(0.01)
+
+    assert (await second.get(None, USER_ID)).rooms == [(1, "Офис"), (2, "Семья")]
+    assert database.queries == 2
+
+
+async def test_local_layer_is_off_without_subscription(redis_client, database):
+    cache = UserCache(redis_client)
+
+    await cache.get(None, USER_ID)
+    await cache.get(None, USER_ID)
+
+    assert cache._local == {}
+    assert database.queries == 1
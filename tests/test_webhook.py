@@ -0,0 +1,47 @@
+import orjson
+import pytest
+from fastapi import FastAPI
+
+import tg.index
+from benchmarks.asgi import request
+from benchmarks.updates import message_update
+
+
+@pytest.fixture
+def app():
+    app = FastAPI(default_response_class=tg.index.ORJSONResponse)
+    app.include_router(tg.index.bot_router)
+    return app
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    opened = []
+
+    def session():
+        opened.append(True)
+        raise AssertionError("session must not be opened")
+
+    monkeypatch.setattr(tg.index.sessionmanager, "session", session)
+    return opened
+
+
+async def test_invalid_update_is_acknowledged(app, sessions):
+    # Телеграм повторяет ответы не из 2xx, поэтому битый апдейт подтверждается
+    status, body = await request(app, "POST", "/bot/webhook", b'{"update_id": "not a number"}')
+
+    assert status == 200
+    assert orjson.loads(body) == {"status": "invalid update"}
+    assert sessions == []
+
+
+async def test_fast_ack_does_not_open_session(app, sessions, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(tg.index, "WEBHOOK_FAST_ACK", True)
+    monkeypatch.setattr(tg.index.pipeline, "submit", lambda update, from_id: submitted.append(from_id) or True)
+
+    status, _ = await request(app, "POST", "/bot/webhook", orjson.dumps(message_update(123, "/start")))
+
+    assert status == 200
+    assert submitted == [123]
+    assert sessions == []
@@ -0,0 +1,169 @@
+"""
+Сбор ошибок хэндлеров и отправка сводок администратору.
+
+Исключения группируются по отпечатку трейсбека (тип исключения + цепочка функций),
+хранятся в памяти и отправляются одной сводкой не чаще раза в min_interval секунд:
+сразу после появления новой группы или раз в interval секунд, если группы копятся.
+Копия каждой сводки сохраняется на диск в отдельном потоке.
+"""
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import logging
+import os
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+
+@dataclass
+class ErrorGroup:
+    fingerprint: str
+    title: str
+    traceback: str
+    count: int = 0
+    first_seen: float = field(default_factory=time.time)
+    last_seen: float = field(default_factory=time.time)
+    # Несколько последних примеров данных FSM для воспроизведения
+    samples: deque = field(default_factory=lambda: deque(maxlen=3))
+
+
+def fingerprint(exception: BaseException) -> str:
+    frames = traceback.extract_tb(exception.__traceback__)
+    key = type(exception).__qualname__ + "|" + "|".join(f"{frame.filename}:{frame.name}:{frame.lineno}"
+                                                        for frame in frames)
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%d.%m.%Y %H:%M:%S")
+
+
+class ErrorReporter:
+    def __init__(self, admin_id: int, interval: float = 300, min_interval: float = 60,
+                 max_groups: int = 200, reports_dir: str = "files/errors"):
+        self.admin_id = admin_id
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_groups = max_groups
+        self.reports_dir = reports_dir
+        self._groups: dict[str, ErrorGroup] = {}
+        self._dropped = 0
+        self._new_group = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._bot: Bot | None = None
+
+    def capture(self, exception: BaseException, fsm_data: dict | None = None):
+        """
+        Учитывает исключение в памяти. Не делает ввода-вывода и не блокирует event loop.
+        """
+        key = fingerprint(exception)
+        group = self._groups.get(key)
+        if group is None:
+            if len(self._groups) >= self.max_groups:
+                self._dropped += 1
+                return
+            group = self._groups[key] = ErrorGroup(
+                fingerprint=key,
+                title=f"{type(exception).__name__}: {exception}"[:200],
+                traceback="".join(traceback.format_exception(exception)),
+            )
+            self._new_group.set()
+        group.count += 1
+        group.last_seen = time.time()
+        group.samples.append(str(fsm_data)[:1000])
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._new_group.wait(), self.interval)
+            # Сбрасываем до отправки: группа, появившаяся во время отправки, уйдёт следующей сводкой
+            self._new_group.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception("Failed to send error digest")
+            await asyncio.sleep(self.min_interval)
+
+    def _build_digest(self, groups: list[ErrorGroup], dropped: int) -> str:
+        total = sum(group.count for group in groups)
+        lines = [f"Ошибок: {total}, групп: {len(groups)}"]
+        if dropped:
+            lines.append(f"Не учтено из-за лимита групп: {dropped}")
+        for group in sorted(groups, key=lambda g: g.count, reverse=True):
+            lines += [
+                "",
+                "=" * 80,
+                f"[{group.fingerprint}] {group.title}",
+                f"Количество: {group.count}",
+                f"Впервые: {_format_time(group.first_seen)}, последний раз: {_format_time(group.last_seen)}",
+                "Данные FSM (последние):",
+                *(f"  {sample}" for sample in group.samples),
+                "",
+                group.traceback,
+            ]
+        return "\n".join(lines)
+
+    def _write(self, text: str) -> str:
+        os.makedirs(self.reports_dir, exist_ok=True)
+        path = os.path.join(self.reports_dir, datetime.datetime.now().strftime("errors_%Y%m%d_%H%M%S.txt"))
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text)
+        return path
+
+    async def flush(self):
+        """
+        Отправляет сводку по накопленным ошибкам и очищает их.
+        Если отправить не удалось, ошибки возвращаются в следующую сводку.
+        """
+        if not self._groups or self._bot is None:
+            return
+        groups, dropped = list(self._groups.values()), self._dropped
+        # Ошибки, пойманные во время отправки, копятся уже для следующей сводки
+        self._groups, self._dropped = {}, 0
+
+        try:
+            text = self._build_digest(groups, dropped)
+            await asyncio.to_thread(self._write, text)
+            await self._bot.send_document(
+                chat_id=self.admin_id,
+                document=BufferedInputFile(text.encode("utf-8"), "errors.txt"),
+                caption=f"Мне очень стыдно, но произошли ошибки: {sum(group.count for group in groups)} "
+                        f"в {len(groups)} группах, подробности в файле.",
+            )
+        except BaseException:
+            self._restore(groups, dropped)
+            raise
+
+    def _restore(self, groups: list[ErrorGroup], dropped: int):
+        """
+        Возвращает неотправленные группы, объединяя их с пойманными за время отправки.
+        """
+        for group in groups:
+            current = self._groups.get(group.fingerprint)
+            if current is None:
+                self._groups[group.fingerprint] = group
+                continue
+            current.count += group.count
+            current.first_seen = min(current.first_seen, group.first_seen)
+            # Более свежие примеры — у пойманной во время отправки группы
+            current.samples = deque([*group.samples, *current.samples], maxlen=current.samples.maxlen)
+        self._dropped += dropped
@@ -0,0 +1,328 @@
+"""
+FSM с отложенной записью.
+
+Состояние и данные FSM читаются из redis один раз за апдейт (один пайплайн на оба ключа),
+все изменения копятся в памяти и записываются одной транзакцией MULTI после того, как
+хэндлер отработал. Хэндлеры продолжают работать с обычным интерфейсом FSMContext.
+
+Ключи FSM живут не дольше TTL текущего шага диалога, брошенные диалоги, оставшиеся
+без TTL, периодически убирает задача celery sweep_fsm (см. FSMStorage.sweep).
+"""
+import copy
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import DEFAULT_DESTINY, StateType, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+
+from config import REDIS_CODEC
+from db.redis_client import Codec, get_codec
+from tg.states import CreateBoxState, FillGiftsState, SurveyState, SendAnonymousMessageFromSanta, \
+    SendAnonymousMessageFromReceiver
+
+
+# Сколько живёт брошенный на этом шаге диалог. Отсчёт идёт от последней записи
+STATE_TTLS: dict[State, int] = {
+    CreateBoxState.waiting_for_name: 24 * 60 * 60,
+    CreateBoxState.waiting_for_final_reg_date: 24 * 60 * 60,
+    CreateBoxState.waiting_for_max_gift_price: 24 * 60 * 60,
+    CreateBoxState.waiting_for_gift_date: 24 * 60 * 60,
+    SurveyState.waiting_for_answer: 14 * 24 * 60 * 60,
+    SurveyState.finished: 24 * 60 * 60,
+    FillGiftsState.waiting_for_gift_url: 7 * 24 * 60 * 60,
+    FillGiftsState.waiting_for_gift_confirmation: 24 * 60 * 60,
+    SendAnonymousMessageFromSanta.waiting_for_message: 60 * 60,
+    SendAnonymousMessageFromReceiver.waiting_for_message: 60 * 60,
+}
+# Для состояний не из списка и для данных без состояния
+DEFAULT_TTL = 3 * 24 * 60 * 60
+
+
+@dataclass
+class SweepStats:
+    scanned: int = 0
+    deleted: int = 0
+    expire_set: int = 0
+    # Сумма MEMORY USAGE удалённых ключей
+    bytes_reclaimed: int = 0
+    used_memory_before: int = 0
+    used_memory_after: int = 0
+
+
+class FSMStorage(RedisStorage):
+    """
+    RedisStorage с чтением и записью состояния и данных за один запрос к redis,
+    TTL в зависимости от шага диалога и данными, закодированными кодеком redis_client
+    (по умолчанию orjson, см. REDIS_CODEC). Данные, записанные в JSON прежним
+    RedisStorage, по-прежнему читаются.
+    """
+
+    def __init__(self, redis, codec: Codec | None = None, state_ttls: dict[State, int] | None = None,
+                 default_ttl: int = DEFAULT_TTL, **kwargs):
+        super().__init__(redis, **kwargs)
+        self.codec = codec or get_codec(REDIS_CODEC)
+        self.state_ttls = {state.state: ttl for state, ttl in (STATE_TTLS if state_ttls is None else state_ttls).items()}
+        self.default_ttl = default_ttl
+
+    def ttl_for(self, state: Optional[str]) -> int:
+        return self.state_ttls.get(state, self.default_ttl)
+
+    def _encode(self, data: Dict[str, Any]) -> bytes:
+        return self.codec.encode(data)
+
+    def _decode(self, value: bytes | str | None) -> Dict[str, Any]:
+        if value is None:
+            return {}
+        try:
+            return self.codec.decode(value)
+        except Exception:
+            # Данные в формате прежнего RedisStorage
+            return self.json_loads(value)
+
+    @staticmethod
+    def _decode_state(state: bytes | str | None) -> Optional[str]:
+        return state.decode("utf-8") if isinstance(state, bytes) else state
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._decode_state(await self.redis.get(self.key_builder.build(key, "state")))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return self._decode(await self.redis.get(self.key_builder.build(key, "data")))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.save(key, state.state if isinstance(state, State) else state, await self.get_data(key))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.save(key, await self.get_state(key), data)
+
+    async def load(self, key: StorageKey) -> tuple[Optional[str], Dict[str, Any]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(self.key_builder.build(key, "state"))
+            pipe.get(self.key_builder.build(key, "data"))
+            state, data = await pipe.execute()
+        return self._decode_state(state), self._decode(data)
+
+    async def save(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        """
+        Записывает состояние и данные одной транзакцией. TTL обоих ключей выбирается
+        по состоянию и отсчитывается заново при каждой записи.
+        """
+        ttl = self.ttl_for(state)
+        state_key = self.key_builder.build(key, "state")
+        data_key = self.key_builder.build(key, "data")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if state is None:
+                pipe.delete(state_key)
+            else:
+                pipe.set(state_key, state, ex=ttl)
+            if not data:
+                pipe.delete(data_key)
+            else:
+                pipe.set(data_key, self._encode(data), ex=ttl)
+            await pipe.execute()
+
+    async def sweep(self, batch_size: int = 500) -> SweepStats:
+        """
+        Обходит ключи FSM через SCAN и убирает брошенные диалоги:
+        данные без состояния удаляются, ключам без TTL (записанным до введения TTL)
+        TTL выставляется с учётом времени простоя, а давно простаивающие удаляются сразу.
+        Ключи state и data одного диалога оцениваются вместе, в том пакете, где встретился
+        первый из них.
+        """
+        stats = SweepStats(used_memory_before=(await self.redis.info("memory"))["used_memory"])
+        pattern = self.key_builder.separator.join([self.key_builder.prefix, "*"])
+        # Диалоги, уже оценённые в предыдущих пакетах
+        seen: set[str] = set()
+        async for batch in self._scan_batches(pattern, batch_size):
+            stats.scanned += len(batch)
+            await self._sweep_batch(batch, stats, seen)
+        stats.used_memory_after = (await self.redis.info("memory"))["used_memory"]
+        return stats
+
+    async def _scan_batches(self, pattern: str, batch_size: int):
+        cursor = 0
+        while True:
+            cursor, keys = await self.redis.scan(cursor, match=pattern, count=batch_size)
+            keys = [key.decode("utf-8") if isinstance(key, bytes) else key for key in keys]
+            # Блокировки событий (RedisEventIsolation) и прочие ключи не трогаем
+            keys = [key for key in keys if key.endswith(("state", "data"))]
+            if keys:
+                yield keys
+            if cursor == 0:
+                break
+
+    async def _sweep_batch(self, keys: list[str], stats: SweepStats, seen: set[str]):
+        separator = self.key_builder.separator
+        dialogs = []
+        for key in keys:
+            dialog = key.rsplit(separator, 1)[0]
+            if dialog not in seen:
+                seen.add(dialog)
+                dialogs.append((dialog + separator + "state", dialog + separator + "data"))
+        if not dialogs:
+            return
+
+        # TTL, OBJECT и MEMORY USAGE не обновляют время последнего обращения, а GET обновляет,
+        # поэтому состояние читается последним, после того как простой обоих ключей уже снят
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for pair in dialogs:
+                for key in pair:
+                    pipe.ttl(key)
+                    pipe.object("idletime", key)
+                    pipe.memory_usage(key)
+                pipe.get(pair[0])
+            results = await pipe.execute(raise_on_error=False)
+
+        to_delete, to_expire = [], []
+        for index, pair in enumerate(dialogs):
+            state = results[index * 7 + 6]
+            state = None if isinstance(state, Exception) else self._decode_state(state)
+            # Ключ уже исчез между SCAN и проверкой (или его пары не было)
+            pair_keys = [(key, *results[index * 7 + offset:index * 7 + offset + 3])
+                         for key, offset in zip(pair, (0, 3))]
+            pair_keys = [(key, ttl, idle, size) for key, ttl, idle, size in pair_keys
+                         if ttl != -2 and not isinstance(ttl, Exception)]
+            if state is None:
+                # Данные без состояния
+                to_delete += [(key, size) for key, _, _, size in pair_keys if key == pair[1]]
+                continue
+            # Простой диалога — время с последнего обращения к любому из его ключей.
+            # OBJECT IDLETIME недоступен при политике вытеснения LFU — считаем ключ свежим
+            idle = min((0 if isinstance(idle, Exception) or idle is None else idle for _, _, idle, _ in pair_keys),
+                       default=0)
+            target = self.ttl_for(state)
+            for key, ttl, _, size in pair_keys:
+                if ttl != -1:
+                    continue
+                if idle >= target:
+                    to_delete.append((key, size))
+                else:
+                    to_expire.append((key, target - idle))
+
+        if not (to_delete or to_expire):
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, _ in to_delete:
+                pipe.unlink(key)
+            for key, ttl in to_expire:
+                pipe.expire(key, ttl)
+            await pipe.execute()
+        stats.deleted += len(to_delete)
+        stats.expire_set += len(to_expire)
+        stats.bytes_reclaimed += sum(size for _, size in to_delete if isinstance(size, int))
+
+
+class BufferedFSMContext(FSMContext):
+    """
+    FSMContext, который читает хранилище один раз и откладывает запись до flush().
+    После flush() контекст пишет изменения сразу — так работают обработчики ошибок,
+    которые вызываются уже после выхода из хэндлера.
+    """
+    storage: FSMStorage
+
+    def __init__(self, storage: FSMStorage, key: StorageKey):
+        super().__init__(storage, key)
+        self._loaded = False
+        self._state: Optional[str] = None
+        self._data: Dict[str, Any] = {}
+        self._state_changed = False
+        self._data_changed = False
+        self._buffered = True
+
+    async def _load(self):
+        if self._loaded:
+            return
+        state, data = await self.storage.load(self.key)
+        # Уже сделанные, но не записанные изменения важнее прочитанного
+        if not self._state_changed:
+            self._state = state
+        if not self._data_changed:
+            self._data = data
+        self._loaded = True
+
+    async def _changed(self):
+        if not self._buffered:
+            await self.flush()
+
+    async def get_state(self) -> Optional[str]:
+        await self._load()
+        return self._state
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_changed = True
+        await self._changed()
+
+    async def get_data(self) -> Dict[str, Any]:
+        await self._load()
+        return copy.deepcopy(self._data)
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self._data = copy.deepcopy(data)
+        self._data_changed = True
+        await self._changed()
+
+    async def get_value(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        await self._load()
+        return copy.deepcopy(self._data.get(key, default))
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        await self._load()
+        self._data.update(copy.deepcopy(kwargs))
+        self._data_changed = True
+        await self._changed()
+        return copy.deepcopy(self._data)
+
+    async def flush(self):
+        """
+        Записывает накопленные изменения одной транзакцией и переключает контекст на немедленную запись.
+        """
+        self._buffered = False
+        if not (self._state_changed or self._data_changed):
+            return
+        # Состояние и данные пишутся вместе, чтобы у них был общий TTL
+        await self._load()
+        await self.storage.save(self.key, self._state, self._data)
+        self._state_changed = self._data_changed = False
+
+
+class BufferedFSMContextMiddleware(FSMContextMiddleware):
+    """
+    Замена FSMContextMiddleware диспатчера: выдаёт хэндлерам BufferedFSMContext
+    и записывает изменения после обработки апдейта, в том числе завершившейся ошибкой.
+    """
+    storage: FSMStorage
+
+    async def __call__(self, handler, event, data):
+        bot: Bot = data["bot"]
+        context = self.resolve_event_context(bot, data)
+        data["fsm_storage"] = self.storage
+        if context is None:
+            return await handler(event, data)
+        async with self.events_isolation.lock(key=context.key):
+            data.update({"state": context, "raw_state": await context.get_state()})
+            try:
+                return await handler(event, data)
+            finally:
+                await context.flush()
+
+    def get_context(self, bot: Bot, chat_id: int, user_id: int, thread_id: Optional[int] = None,
+                    business_connection_id: Optional[str] = None,
+                    destiny: str = DEFAULT_DESTINY) -> BufferedFSMContext:
+        return BufferedFSMContext(
+            storage=self.storage,
+            key=StorageKey(
+                user_id=user_id,
+                chat_id=chat_id,
+                bot_id=bot.id,
+                thread_id=thread_id,
+                business_connection_id=business_connection_id,
+                destiny=destiny,
+            ),
+        )
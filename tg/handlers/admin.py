@@ -0,0 +1,96 @@
+import asyncio
+import contextvars
+import datetime
+import logging
+import os
+
+from aiogram import Bot, Router, types, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile
+
+from config import ADMIN_ID
+from db.db_config import slow_queries
+from tg.profiler import profile_cpu, profile_memory
+
+admin_router = Router(name="Роутер администратора")
+admin_router.message.filter(F.from_user.id == ADMIN_ID)
+
+PROFILE_MODES = ("cpu", "memory")
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+PROFILES_DIR = "files/profiles"
+
+# Замер, который сейчас идёт в этом процессе
+_profile_task: asyncio.Task | None = None
+
+
+def _write_profile(report: str, filename: str):
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    with open(os.path.join(PROFILES_DIR, filename), "w", encoding="utf-8") as file:
+        file.write(report)
+
+
+async def run_profile(bot: Bot, router: Router, mode: str, seconds: int):
+    """
+    Снимает профиль и отправляет его администратору документом, копия сохраняется в PROFILES_DIR.
+    """
+    try:
+        if mode == "cpu":
+            report, summary = await profile_cpu(router, seconds)
+            extension = "folded.txt"
+        else:
+            report, summary = await profile_memory(seconds)
+            extension = "txt"
+        filename = f"{mode}_{os.getpid()}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        await asyncio.to_thread(_write_profile, report, filename)
+        await bot.send_document(
+            chat_id=ADMIN_ID,
+            document=BufferedInputFile(report.encode("utf-8"), filename),
+            caption=f"Профиль {mode} процесса {os.getpid()}\n{summary}"[:1000],
+        )
+    except Exception:
+        logging.exception(f"Failed to profile process ({mode}, {seconds} s)")
+        await bot.send_message(chat_id=ADMIN_ID, text=f"Не удалось снять профиль {mode}, подробности в логе.")
+
+
+@admin_router.message(Command("profile"))
+async def profile_command(message: types.Message, command: CommandObject, bot: Bot, event_router: Router):
+    """
+    /profile [секунды] [cpu|memory] — профиль процесса, который получил команду.
+    При нескольких воркерах uvicorn профилируется один из них.
+    """
+    global _profile_task
+    args = (command.args or "").split()
+    seconds = int(args[0]) if args and args[0].isdigit() else PROFILE_DEFAULT_SECONDS
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    mode = args[1] if len(args) > 1 else "cpu"
+    if mode not in PROFILE_MODES:
+        await message.reply(f"Использование: /profile [секунды] [{'|'.join(PROFILE_MODES)}]")
+        return
+    if _profile_task is not None and not _profile_task.done():
+        await message.reply("Профиль этого процесса уже снимается, дождитесь результата.")
+        return
+
+    # Отдельный контекст: замер переживёт апдейт и не должен попадать в его метрики
+    _profile_task = asyncio.create_task(run_profile(bot, event_router, mode, seconds), context=contextvars.Context())
+    await message.reply(f"Снимаю профиль {mode} процесса {os.getpid()} в течение {seconds} с, "
+                        f"результат пришлю файлом.")
+
+
+@admin_router.message(Command("slow_queries"))
+async def slow_queries_command(message: types.Message, command: CommandObject):
+    """
+    /slow_queries [reset] — отчёт журнала медленных запросов этого процесса.
+    """
+    if (command.args or "").strip() == "reset":
+        slow_queries.reset()
+        await message.reply("Журнал медленных запросов очищен.")
+        return
+    if not slow_queries.queries:
+        await message.reply(f"Медленных запросов в процессе {os.getpid()} не было.")
+        return
+    report = slow_queries.report()
+    await message.reply_document(
+        BufferedInputFile(report.encode("utf-8"), f"slow_queries_{os.getpid()}.txt"),
+        caption=f"Медленные запросы процесса {os.getpid()}\n{slow_queries.summary()}"[:1000],
+    )
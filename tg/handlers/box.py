@@ -2,16 +2,19 @@ import datetime
 import random
 import secrets
 
-import requests
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select, delete
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.models import Box, User, UserRoom, Gift
+from celery_app.tasks import start_draw
+from db.box_summary import get_box_summary
+from db.models import Box, UserRoom, Gift, BoxExclusion
+from db.redis_client import redis_client
+from db.user_cache import LazyUser, user_cache
+from logic.shortener import shortener, ShortenerError
 from tg.handlers.survey import QUESTIONS
-from tg.loader import bot
 from tg.states import CreateBoxState, FillGiftsState, SurveyState
 
 box_router = Router(name="Роутер для управления коробками")
@@ -67,7 +70,7 @@ async def set_max_gift_price(message: types.Message, state: FSMContext):
 
 
 @box_router.message(CreateBoxState.waiting_for_gift_date)
-async def set_gift_date(message: types.Message, state: FSMContext, db: AsyncSession, user: User):
+async def set_gift_date(message: types.Message, state: FSMContext, db: AsyncSession, user: LazyUser):
     """
     Сохранение даты вручения подарков и создание коробки.
     """
@@ -105,12 +108,13 @@ async def set_gift_date(message: types.Message, state: FSMContext, db: AsyncSess
 
 
 @box_router.callback_query(F.data == "my_boxes")
-async def my_boxes_root(call: types.CallbackQuery, db: AsyncSession, user: User):
+async def my_boxes_root(call: types.CallbackQuery, db: AsyncSession, user: LazyUser):
+    cached_user = await user.get()
     text = f"👇Выберите одну из ваших коробок:"
     kb = []
-    for box in user.rooms:
+    for box_id, box_name in cached_user.rooms:
         kb.append([
-            types.InlineKeyboardButton(text=f"{box.name}", callback_data=f"select_box:{box.id}")
+            types.InlineKeyboardButton(text=f"{box_name}", callback_data=f"select_box:{box_id}")
         ])
     kb.append([
         types.InlineKeyboardButton(text="🔙Назад в меню", callback_data="main_menu")
@@ -120,21 +124,20 @@ async def my_boxes_root(call: types.CallbackQuery, db: AsyncSession, user: User)
 
 
 @box_router.callback_query(F.data.startswith("select_box:"))
-async def select_box_root(call: types.CallbackQuery, db: AsyncSession, user: User):
-    box = await db.execute(select(Box).filter_by(id=int(call.data.split(':')[1])))
-    box = box.scalars().first()
+async def select_box_root(call: types.CallbackQuery, db: AsyncSession, user: LazyUser):
+    box = await get_box_summary(db, int(call.data.split(':')[1]), user.id)
+    if box is None or not box.is_member:
+        return await call.answer("Вы не участвуете в этой коробке", show_alert=True)
+
     box_text = (f"ℹ️Информация о коробке {box.name}:\n\n"
                 f"⌛️<b>Окончание регистрации участников:</b> {datetime.datetime.strftime(box.final_reg_date, "%d.%m.%Y")}\n"
                 f"🤑<b>Максимальная сумма подарка:</b> {box.max_gift_price}₽\n"
                 f"🎁<b>Вручение:</b> {datetime.datetime.strftime(box.gift_date, "%d.%m.%Y")}")
 
-    user_room = await db.execute(select(UserRoom).filter_by(user_id=user.id, box_id=box.id))
-    user_room = user_room.scalars().first()
     kb = []
-    if not user_room.receiver:
+    if not box.shuffled:
         box_text += "\n\n🕰️Вам еще не назначен подопечный для вручения подарка, ожидайте распределения."
-        shuffled = False
-        if user_room.profile == {}:
+        if not box.wishes_filled:
             kb.append([
                 types.InlineKeyboardButton(text="✨Заполнить пожелания", callback_data=f"fill_wishes:{box.id}")
             ])
@@ -143,9 +146,7 @@ async def select_box_root(call: types.CallbackQuery, db: AsyncSession, user: Use
                 types.InlineKeyboardButton(text="✨Изменить пожелания", callback_data=f"fill_wishes:{box.id}")
             ])
 
-        user_box_gifts = await db.execute(select(Gift).filter_by(box_id=box.id, user_id=user_room.user_id))
-        user_box_gifts = user_box_gifts.scalars().all()
-        if len(user_box_gifts) == 0:
+        if box.gifts_count == 0:
             kb.append([
                 types.InlineKeyboardButton(text="🎁Заполнить подарки", callback_data=f"fill_gifts:{box.id}")
             ])
@@ -162,22 +163,16 @@ async def select_box_root(call: types.CallbackQuery, db: AsyncSession, user: Use
         kb.append([
             types.InlineKeyboardButton(text="✉️Написать моему Санте", callback_data=f"send_to_santa:{box.id}")
         ])
-        shuffled = True
 
     if box.admin_id == call.from_user.id:
         box_text += ("\n\n👑Информация для администратора:\n"
                      "👥Участники:\n")
-        user_rooms = await db.execute(select(UserRoom).filter_by(box_id=box.id))
-        user_rooms = user_rooms.scalars().all()
-        for user in user_rooms:
-            if user.profile == {}:
-                emoji_status = "❌"
-            else:
-                emoji_status = "✅"
-            box_text += f"\n→ {user.user.full_name} (@{user.user.username}) {emoji_status}"
+        for participant in box.participants:
+            emoji_status = "✅" if participant.wishes_filled else "❌"
+            box_text += f"\n→ {participant.full_name} (@{participant.username}) {emoji_status}"
         box_text += "\n✅Заполнил пожелания, ❌Не заполнил пожелания"
 
-        if not shuffled:
+        if not box.shuffled:
             kb.append([
                 types.InlineKeyboardButton(text="🎲Провести жеребьёвку", callback_data=f"shuffle_box:{box.id}")
             ])
@@ -204,73 +199,29 @@ async def fill_wishes(call: types.CallbackQuery, state: FSMContext):
 
 
 @box_router.callback_query(F.data.startswith("shuffle_box:"))
-async def shuffle_box_handler(call: types.CallbackQuery, db: AsyncSession, user: User):
+async def shuffle_box_handler(call: types.CallbackQuery, db: AsyncSession):
     """
-    Хэндлер для выполнения шафла участников комнаты.
+    Хэндлер для запуска жеребьёвки участников комнаты.
+    Сама жеребьёвка и рассылка уведомлений выполняются в фоне (celery_app.tasks.draw_box).
     """
     box_id = int(call.data.split(':')[1])
-
-    # Получение всех записей UserRoom для указанной комнаты
-    user_rooms_query = await db.execute(
-        select(UserRoom).filter_by(box_id=box_id)
-    )
-    user_rooms = user_rooms_query.scalars().all()
-
-    if len(user_rooms) < 2:
-        await call.message.edit_text(
-            "❌ Недостаточно участников для жеребьевки. Минимум 2 участника.",
-            reply_markup=types.InlineKeyboardMarkup(
-                inline_keyboard=[[types.InlineKeyboardButton(text="🔙 Назад", callback_data=f"select_box:{box_id}")]]
-            ),
-        )
-        return
-    for user in user_rooms:
-        if user.profile == {}:
-            await call.message.edit_text(
-                "❌ Не все участники заполнили свои пожелания.",
-                reply_markup=types.InlineKeyboardMarkup(
-                    inline_keyboard=[[types.InlineKeyboardButton(text="🔙 Назад", callback_data=f"select_box:{box_id}")]]
-                ),
-            )
-            return
-
-    # Перемешиваем участников случайным образом
-    user_ids = [user_room.user_id for user_room in user_rooms]
-
-    # Обеспечиваем, что никто не дарит подарок сам себе
-    is_valid_shuffle = False
-    while not is_valid_shuffle:
-        random.shuffle(user_ids)
-        is_valid_shuffle = all(
-            user_room.user_id != user_ids[(i + 1) % len(user_ids)]  # Проверка на "не сам себе"
-            for i, user_room in enumerate(user_rooms)
-        )
-
-    # Назначение подопечных (receiver) для каждого участника
-    for i, user_room in enumerate(user_rooms):
-        user_room.user_gift_to_id = user_ids[(i + 1) % len(user_ids)]  # Следующий участник в списке
-
-    # Сохранение изменений в базе данных
-    await db.commit()
-
-    kb = []
-    kb.append([
-        types.InlineKeyboardButton(text="🧑‍🎄Мой подопечный", callback_data=f"receiver_card:{box_id}")
-    ])
-
-    for user in user_ids:
-        await bot.send_message(chat_id=user,
-                               text=f"🧑‍🎄Тебе назначен подопечный на Тайного Санту. Скорее открывай его профиль "
-                                    f"и готовься дарить подарок!",
-                               reply_markup=types.InlineKeyboardMarkup(inline_keyboard=kb))
-
-    # Уведомление об успешной жеребьевке
-    await call.message.edit_text(
-        "🎲 Жеребьевка завершена! Всем участникам назначены подопечные для вручения подарков.",
-        reply_markup=types.InlineKeyboardMarkup(
-            inline_keyboard=[[types.InlineKeyboardButton(text="🔙 Вернуться к коробке", callback_data=f"select_box:{box_id}")]]
-        ),
-    )
+    box = await Box.get(db, box_id)
+    if not box or box.admin_id != call.from_user.id:
+        return await call.answer(f"⛔️Провести жеребьёвку может только администратор коробки!")
+
+    # Сообщение меняется до постановки задачи: дальше его редактирует только воркер,
+    # иначе быстрый воркер успел бы показать результат раньше, чем эта правка его затрёт
+    card_text, card_kb = call.message.html_text, call.message.reply_markup
+    await call.message.edit_text("⏳ Жеребьёвка запущена. Как только всем участникам будут назначены подопечные, "
+                                 "это сообщение обновится.")
+    try:
+        started = await start_draw(redis_client, box_id, call.message.chat.id, call.message.message_id)
+    except Exception:
+        await call.message.edit_text(card_text, reply_markup=card_kb)
+        raise
+    if not started:
+        await call.message.edit_text(card_text, reply_markup=card_kb)
+        return await call.answer(f"⏳Жеребьёвка в этой коробке уже запущена.")
 
 
 @box_router.callback_query(F.data.startswith("fill_gifts:"))
@@ -298,12 +249,11 @@ async def set_gift_url(message: types.Message, state: FSMContext):
     Сохранение ссылки на подарок и переход к подтверждению.
     """
     gift_url = message.text
-    response = requests.get(f'https://clck.ru/--',
-                            params={
-                                'url': f'{gift_url}'})
-    if response.status_code == 200:
-        link = response.text
-    else:
+    try:
+        link = await shortener.shorten(gift_url)
+    except ShortenerError:
+        return await message.answer(f"Не получилось обработать ссылку, попробуйте отправить её ещё раз чуть позже.")
+    if not link:
         return await message.answer(f"Кажется вы отправили недействительную ссылку.")
 
     await state.update_data(gift_url=link)
@@ -320,7 +270,7 @@ async def set_gift_url(message: types.Message, state: FSMContext):
 
 
 @box_router.callback_query(F.data.startswith("gift_is_exact:"))
-async def set_gift_confirmation(call: types.CallbackQuery, state: FSMContext, db: AsyncSession, user: User):
+async def set_gift_confirmation(call: types.CallbackQuery, state: FSMContext, db: AsyncSession, user: LazyUser):
     """
     Сохранение подтверждения, добавление подарка в базу данных и запрос на новый подарок.
     """
@@ -328,14 +278,12 @@ async def set_gift_confirmation(call: types.CallbackQuery, state: FSMContext, db
     data = await state.get_data()
 
     # Создание подарка в базе данных
-    new_gift = Gift(
+    await Gift.bulk_create(db, [dict(
         box_id=data["box_id"],
         user_id=user.id,
         gift_url=data["gift_url"],
         is_exact=is_exact,
-    )
-    db.add(new_gift)
-    await db.commit()
+    )])
 
     # Запрос следующего действия
     kb = types.InlineKeyboardMarkup(inline_keyboard=[
@@ -371,7 +319,7 @@ async def exit_gift_filling(call: types.CallbackQuery, state: FSMContext):
 
 
 @box_router.callback_query(F.data.startswith("list_gifts:"))
-async def list_gifts(call: types.CallbackQuery, db: AsyncSession, user: User):
+async def list_gifts(call: types.CallbackQuery, db: AsyncSession, user: LazyUser):
     box_id = int(call.data.split(':')[1])
     stmt = await db.execute(select(Gift).filter_by(box_id=box_id, user_id=call.from_user.id))
     gifts = stmt.scalars().all()
@@ -395,12 +343,10 @@ async def list_gifts(call: types.CallbackQuery, db: AsyncSession, user: User):
 @box_router.callback_query(F.data.startswith("delete_gift:"))
 async def delete_gift(call: types.CallbackQuery, db: AsyncSession):
     gift_id = int(call.data.split(':')[1])
-    stmt = await db.execute(select(Gift).filter_by(id=gift_id))
-    gift = stmt.scalars().first()
-    box_id = gift.box_id
-    if gift.user_id == call.from_user.id:
-        await db.execute(delete(Gift).filter_by(id=gift.id))
-        await db.commit()
+    # Удаляется только свой подарок
+    deleted = await Gift.delete_where(db, id=gift_id, user_id=call.from_user.id)
+    if deleted:
+        box_id = deleted[0].box_id
         kb = [[
             types.InlineKeyboardButton(text="🔙Назад в список подарков", callback_data=f"list_gifts:{box_id}")
         ]]
@@ -428,10 +374,11 @@ async def delete_box_root(call: types.CallbackQuery, db: AsyncSession):
 @box_router.callback_query(F.data.startswith("delete_box_confirm:"))
 async def delete_box_confirm(call: types.CallbackQuery, db: AsyncSession):
     box_id = int(call.data.split(':')[1])
-    await db.execute(delete(UserRoom).filter_by(box_id=box_id))
-    await db.execute(delete(Gift).filter_by(box_id=box_id))
-    await db.execute(delete(Box).filter_by(id=box_id))
-    await db.commit()
+    await BoxExclusion.delete_where(db, box_id=box_id, commit=False)
+    participants = await UserRoom.delete_where(db, box_id=box_id, commit=False)
+    await Gift.delete_where(db, box_id=box_id, commit=False)
+    await Box.delete_where(db, id=box_id)
+    await user_cache.invalidate(*(participant.user_id for participant in participants))
     kb = [[
         types.InlineKeyboardButton(text="🔙Назад в меню", callback_data="main_menu")
     ]]
@@ -2,8 +2,7 @@ import datetime
 import random
 import secrets
 
-import requests
-from aiogram import Router, types, F
+from aiogram import Bot, Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
@@ -11,7 +10,6 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import Box, User, UserRoom, Gift
 from tg.handlers.survey import QUESTIONS
-from tg.loader import bot
 from tg.states import CreateBoxState, FillGiftsState, SurveyState, SendAnonymousMessageFromSanta, \
     SendAnonymousMessageFromReceiver
 
@@ -24,7 +22,7 @@ async def send_santa_message(call: types.CallbackQuery, state: FSMContext, db: A
     box = await db.execute(select(UserRoom).filter_by(box_id=int(call.data.split(':')[1]), user_id=call.from_user.id))
     box = box.scalars().first()
 
-    await state.update_data(send_to=box.receiver.id, box_id=box.box_id)
+    await state.update_data(send_to=box.user_gift_to_id, box_id=box.box_id)
     await call.message.edit_text(f"📤Напиши сообщение своему подопечному, а я перешлю его анонимно. "
                                  f"Старайся не выдать себя при общении, чтобы не испортить сюрприз!\n"
                                  f"Если передумал писать, напиши /stop.")
@@ -32,7 +30,7 @@ async def send_santa_message(call: types.CallbackQuery, state: FSMContext, db: A
 
 
 @messages_router.message(SendAnonymousMessageFromSanta.waiting_for_message)
-async def send_message_to_receiver(message: types.Message, state: FSMContext, db: AsyncSession):
+async def send_message_to_receiver(message: types.Message, state: FSMContext, db: AsyncSession, bot: Bot):
     if not message.text:
         return await message.answer(f"❌В твоем сообщении нет текста. Напиши что-нибудь другое.")
     state_data = await state.get_data()
@@ -65,14 +63,13 @@ async def send_santa_message(call: types.CallbackQuery, state: FSMContext, db: A
 
 
 @messages_router.message(SendAnonymousMessageFromReceiver.waiting_for_message)
-async def send_message_to_receiver(message: types.Message, state: FSMContext, db: AsyncSession):
+async def send_message_to_receiver(message: types.Message, state: FSMContext, db: AsyncSession, bot: Bot):
     if not message.text:
         return await message.answer(f"❌В твоем сообщении нет текста. Напиши что-нибудь другое.")
     state_data = await state.get_data()
     box = await db.execute(select(Box).filter_by(id=int(state_data["box_id"])))
     box = box.scalars().first()
-    user_room = await db.execute(select(UserRoom).filter_by(box_id=box.id, user_id=int(state_data["send_to"])))
-    user_room = user_room.scalars().first()
+    user_room = await UserRoom.get_by_kwargs(db, profile="receiver", box_id=box.id, user_id=int(state_data["send_to"]))
 
     kb = [[
         types.InlineKeyboardButton(text="✉️Ответить анонимно", callback_data=f"send_santa_message:{box.id}")
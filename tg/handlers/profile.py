@@ -19,10 +19,7 @@ async def show_receiver_profile(call: types.CallbackQuery, db: AsyncSession):
     box_id = int(call.data.split(":")[1])
 
     # Получаем информацию о подопечном
-    user_room_query = await db.execute(
-        select(UserRoom).filter_by(user_id=call.from_user.id, box_id=box_id)
-    )
-    user_room = user_room_query.scalars().first()
+    user_room = await UserRoom.get_by_kwargs(db, profile="receiver_dossier", user_id=call.from_user.id, box_id=box_id)
 
     if not user_room or not user_room.receiver:
         await call.message.edit_text(
@@ -76,7 +73,7 @@ async def show_user_profile(call: types.CallbackQuery, db: AsyncSession):
     user_room = user_room_query.scalars().first()
 
     user_room_query = await db.execute(
-        select(UserRoom).filter_by(user_id=user_room.receiver.id, box_id=box_id)
+        select(UserRoom).filter_by(user_id=user_room.user_gift_to_id, box_id=box_id)
     )
     user_room = user_room_query.scalars().first()
 
@@ -123,10 +120,7 @@ async def show_user_gift_wishes(call: types.CallbackQuery, db: AsyncSession):
     box_id = int(call.data.split(":")[1])
 
     # Получаем профиль подопечного
-    user_room_query = await db.execute(
-        select(UserRoom).filter_by(user_id=call.from_user.id, box_id=box_id)
-    )
-    user_room = user_room_query.scalars().first()
+    user_room = await UserRoom.get_by_kwargs(db, profile="receiver_dossier", user_id=call.from_user.id, box_id=box_id)
 
     if len(user_room.receiver.gifts) == 0:
         await call.message.edit_text(
@@ -5,9 +5,9 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import User, Box, UserRoom
+from db.user_cache import LazyUser
 from tg.handlers.survey import QUESTIONS
 from tg.states import SurveyState
-from tg.loader import bot
 
 register_router = Router(name="Роутер регистрации и главного меню")
 
@@ -15,7 +15,7 @@ register_router = Router(name="Роутер регистрации и главн
 @register_router.callback_query(F.data == "main_menu")
 @register_router.message(Command("start"))
 async def start_command(event: types.Message | types.CallbackQuery,
-                        user: User,
+                        user: LazyUser,
                         db: AsyncSession,
                         state: FSMContext,
                         command: CommandObject = None,
@@ -26,45 +26,34 @@ async def start_command(event: types.Message | types.CallbackQuery,
     :param db: Объект сессии
     :param event: Сообщение
     :param command: Объект команды. Может содержать аргументы
-    :param user: Объект пользователя из базы
+    :param user: Пользователь (данные загружаются из кэша по запросу)
     :return:
     """
     if isinstance(event, types.Message):
         # Обработка команды /start
-        if not user:
-            user = User(
+        cached_user = await user.get()
+        if not cached_user or cached_user.username != event.from_user.username:
+            # Регистрация или смена username одним запросом, без гонки при повторном /start
+            await User.upsert(db, dict(
                 id=event.from_user.id,
                 username=event.from_user.username,
                 full_name=event.from_user.full_name,
-            )
-            db.add(user)
-            await db.commit()
-            user = await db.execute(select(User).filter_by(id=event.from_user.id))
-            user = user.scalars().first()
-        elif user.username != event.from_user.username:
-            user.username = event.from_user.username
-            db.add(user)
-            await db.commit()
-            user = await db.execute(select(User).filter_by(id=event.from_user.id))
-            user = user.scalars().first()
-
-        user_id = event.from_user.id
-    elif isinstance(event, types.CallbackQuery):
-        # Обработка нажатия на inline-кнопку
-        user_id = event.from_user.id
-    else:
+            ), update=["username"])
+            await user.invalidate()
+    elif not isinstance(event, types.CallbackQuery):
         raise Exception("Обработка других типов событий не поддерживается")
+    cached_user = await user.get()
 
     kb = []
 
     hello_text = "🎄Добро пожаловать в бота Тайный Санта 2025!\n\n"
-    if len(user.rooms) == 0:
+    if len(cached_user.rooms) == 0:
         hello_text += ("🫙Вы пока не состоите ни в одной коробке. Создайте её или используйте ссылку-приглашение "
                        "от администратора.")
     else:
         hello_text += f"🌟Вы состоите в следующих коробках:\n"
-        for room in user.rooms:
-            hello_text += f"⭐︎ {room.name}\n"
+        for _, room_name in cached_user.rooms:
+            hello_text += f"⭐︎ {room_name}\n"
         kb.append([
             types.InlineKeyboardButton(text="🎁Мои коробки", callback_data="my_boxes")
         ])
@@ -77,24 +66,16 @@ async def start_command(event: types.Message | types.CallbackQuery,
         box = await db.execute(select(Box).filter_by(join_code=str(command.args)))
         box = box.scalars().first()
         if box:
-            user_room = await db.execute(select(UserRoom).filter_by(box_id=box.id))
-            user_room = user_room.scalars().first()
-            if user_room and user_room.receiver:
+            if box.drawn_at:
                 return await event.answer(f"❌Эта коробка закрыта для новых участников. Ты не можешь "
                                           f"к ней присоединиться!")
-            # Проверяем есть ли пользователь в коробке
-            user_room = await db.execute(select(UserRoom).filter_by(user_id=user.id, box_id=box.id))
-            if user_room.scalars().first():
+            # Вступление в коробку; если пользователь уже участник, запись не вставляется
+            joined = await UserRoom.upsert(db, dict(user_id=user.id, box_id=box.id, profile={}), update=[])
+            if joined is None:
                 return await event.answer(f"🫷Притормози, ты уже состоишь в этой коробке как участник. "
                                           f"Если хочешь посмотреть "
                                           f"информацию о ней, напиши /start.")
-
-            # Create a UserRoom instance
-            user_room = UserRoom(user_id=user.id, box_id=box.id, profile={})
-            # Add the UserRoom instance to the session
-            db.add(user_room)
-            # Commit the transaction
-            await db.commit()
+            await user.invalidate()
             await event.answer(
                 f"🎁Вы успешно вступили в коробку <strong>{box.name}</strong>. Пожалуйста, ответьте на несколько "
                 f"вопросов, чтобы Ваш санта мог подарить вам лучший подарок!")
@@ -4,7 +4,8 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.models import User, UserRoom, Gift
+from db.models import UserRoom, Gift
+from db.user_cache import LazyUser
 from tg.states import FillGiftsState, SurveyState
 
 survey_router = Router(name="Анкета")
@@ -28,7 +29,7 @@ QUESTIONS = [
 
 
 @survey_router.message(SurveyState.waiting_for_answer)
-async def handle_survey_answer(message: types.Message, state: FSMContext, db: AsyncSession, user: User):
+async def handle_survey_answer(message: types.Message, state: FSMContext, db: AsyncSession, user: LazyUser):
     """
     Обработка ответа на текущий вопрос.
     """
@@ -51,11 +52,7 @@ async def handle_survey_answer(message: types.Message, state: FSMContext, db: As
         await state.set_state(SurveyState.finished)
         await state.update_data(answers=answers)
 
-        user_room = await db.execute(select(UserRoom).filter_by(user_id=user.id, box_id=int(user_data.get("box_id"))))
-        user_room = user_room.scalars().first()
-        user_room.profile = answers
-        db.add(user_room)
-        await db.commit()
+        await UserRoom.update_where(db, {"profile": answers}, user_id=user.id, box_id=int(user_data.get("box_id")))
 
         result_text = "🎉 Спасибо за ответы!\n\n"
 
@@ -66,7 +63,7 @@ async def handle_survey_answer(message: types.Message, state: FSMContext, db: As
         )
         await message.answer(result_text, reply_markup=kb)
 
-        user_box_gifts = await db.execute(select(Gift).filter_by(box_id=int(user_data.get("box_id")), user_id=user_room.user_id))
+        user_box_gifts = await db.execute(select(Gift).filter_by(box_id=int(user_data.get("box_id")), user_id=user.id))
         user_box_gifts = user_box_gifts.scalars().all()
         if len(user_box_gifts) == 0:
             await message.answer("💡Давай заполним подарки, которые ты хотел бы получить. Ты сможешь внести сразу "
@@ -1,30 +1,60 @@
 import logging
 
+from aiogram import Bot, Dispatcher
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Update, ErrorEvent, BufferedInputFile
-from fastapi import APIRouter, Depends
+from aiogram.fsm.storage.memory import DisabledEventIsolation
+from aiogram.types import Update, ErrorEvent
+from fastapi import APIRouter, Request
+from fastapi.responses import ORJSONResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import ADMIN_CHAT_ID, THREAD_ID, ADMIN_ID
+from config import ADMIN_CHAT_ID, THREAD_ID, ADMIN_ID, DB_QUERY_BUDGET, DB_QUERY_BUDGET_STRICT, WEBHOOK_FAST_ACK, \
+    UPDATE_WORKERS, UPDATE_QUEUE_SIZE, LOG_PAYLOAD_SAMPLE_RATE
+from tg.handlers.admin import admin_router
 from tg.handlers.box import box_router
 from tg.handlers.messages import messages_router
 from tg.handlers.profile import profile_router
 from tg.handlers.survey import survey_router
-from tg.loader import bot, dp
-from db.db_config import get_db
-from db.models import User
+from tg.loader import get_bot
+from db.db_config import sessionmanager
+from db.redis_client import redis_client
+from db.user_cache import LazyUser
 from tg.handlers.common import common_router
 from tg.handlers.register import register_router
-from tg.middlewares import LoggingMiddleware
+from tg.middlewares import LoggingMiddleware, QueryBudgetMiddleware
+from tg.pipeline import UpdatePipeline
+from tg.errors import ErrorReporter
+from tg.fsm import FSMStorage, BufferedFSMContextMiddleware
+from tg.metrics import UpdateMetricsMiddleware, HandlerLabelMiddleware
+
+# Хранилище FSM и диспатчер живут только в веб-процессе. Хранилище работает
+# через пул соединений общего клиента redis
+storage = FSMStorage(redis=redis_client.redis)
+dp = Dispatcher(storage=storage, disable_fsm=True)
+# Метрики подключаются раньше FSM, чтобы учесть и его запросы к redis
+dp.update.outer_middleware(UpdateMetricsMiddleware())
+# Стандартный FSM-middleware заменён на вариант с одним чтением и одной записью за апдейт (см. tg/fsm.py)
+dp.fsm = BufferedFSMContextMiddleware(storage=storage, events_isolation=DisabledEventIsolation())
+dp.update.outer_middleware(dp.fsm)
+
+# Сводки об ошибках для администратора
+error_reporter = ErrorReporter(ADMIN_ID)
 
 # FastAPI-роутер для приёма входящих от телеграм запросов
 bot_router = APIRouter(prefix="/bot", tags=["Telegram"])
 
 # Подключение логгера к диспатчеру
-dp.message.middleware(LoggingMiddleware())
-dp.callback_query.middleware(LoggingMiddleware())
+dp.message.middleware(LoggingMiddleware(LOG_PAYLOAD_SAMPLE_RATE))
+dp.callback_query.middleware(LoggingMiddleware(LOG_PAYLOAD_SAMPLE_RATE))
+# Имя хэндлера для метрик
+dp.message.middleware(HandlerLabelMiddleware())
+dp.callback_query.middleware(HandlerLabelMiddleware())
+# Контроль количества SQL-запросов на апдейт
+dp.update.outer_middleware(QueryBudgetMiddleware(DB_QUERY_BUDGET, DB_QUERY_BUDGET_STRICT))
 # Подключения роутов бота к диспатчеру
 dp.include_router(common_router)
+dp.include_router(admin_router)
 dp.include_router(register_router)
 dp.include_router(box_router)
 dp.include_router(survey_router)
@@ -32,30 +62,74 @@ dp.include_router(profile_router)
 dp.include_router(messages_router)
 
 
-@bot_router.post("/webhook")
-async def bot_webhook(update: dict,
-                      db: AsyncSession = Depends(get_db)):
+async def process_update(db: AsyncSession, update: Update, from_id: int | None):
     """
-    Обработчик вебхука от телеграма
+    Передача апдейта в диспатчер вместе с сессией и пользователем.
+    Пользователь загружается из кэша только если хэндлер его запросит (см. LazyUser).
     """
-    user = None
-    update_object: Update = Update.model_validate(update, context={"bot": bot})
-    if from_id := (update.get("message", {}).get("from", {}).get("id", None)
-                   or update.get("callback_query", {}).get("from", {}).get("id", None)):
-        user = await User.get_by_kwargs(db, id=int(from_id))
-
-    await dp.feed_update(bot,
-                         update_object,
+    user = LazyUser(from_id, db) if from_id else None
+
+    await dp.feed_update(get_bot(),
+                         update,
                          db=db,
                          user=user)
+
+
+async def process_update_in_session(update: Update, from_id: int | None):
+    """
+    Обработка апдейта в собственной сессии БД: для воркеров очереди и для вебхука без WEBHOOK_FAST_ACK.
+    """
+    async with sessionmanager.session() as db:
+        await process_update(db, update, from_id)
+
+
+# Фоновая обработка апдейтов для режима WEBHOOK_FAST_ACK
+pipeline = UpdatePipeline(process_update_in_session, workers=UPDATE_WORKERS, queue_size=UPDATE_QUEUE_SIZE)
+
+
+def get_sender_id(update: Update) -> int | None:
+    """
+    ID отправителя сообщения или нажавшего на inline-кнопку
+    """
+    event = update.message or update.callback_query
+    if event and event.from_user:
+        return event.from_user.id
+    return None
+
+
+@bot_router.post("/webhook")
+async def bot_webhook(request: Request):
+    """
+    Обработчик вебхука от телеграма.
+    Тело запроса валидируется один раз прямо из байтов, без промежуточного dict.
+    Сессия БД открывается только при обработке апдейта в самом запросе: в режиме
+    WEBHOOK_FAST_ACK её откроет воркер очереди.
+    """
+    try:
+        update_object: Update = Update.model_validate_json(await request.body(), context={"bot": get_bot()})
+    except ValidationError as e:
+        # Ответ не из 2xx телеграм повторяет бесконечно, и битый апдейт задержит все следующие
+        logging.warning(f"Invalid update received: {e}")
+        return {"status": "invalid update"}
+    from_id = get_sender_id(update_object)
+
+    if WEBHOOK_FAST_ACK:
+        if not pipeline.submit(update_object, from_id):
+            # Очередь переполнена: телеграм повторит доставку позже
+            return ORJSONResponse({"status": "busy"}, status_code=503, headers={"Retry-After": "1"})
+        return {"status": "ok"}
+
+    await process_update_in_session(update_object, from_id)
     return {"status": "ok"}
 
 
 @dp.errors()
-async def error_handler(exception: ErrorEvent, state: FSMContext):
+async def error_handler(exception: ErrorEvent, state: FSMContext, bot: Bot):
     data = await state.get_data()
     # Логирование ошибки
     logging.exception(f"Exception: {exception}")
+    # Ошибка попадёт администратору в ближайшей сводке
+    error_reporter.capture(exception.exception, data)
 
     if exception.update.callback_query:
         chat_id = exception.update.callback_query.message.chat.id
@@ -63,23 +137,11 @@ async def error_handler(exception: ErrorEvent, state: FSMContext):
     else:
         message_thread_id = exception.update.message.message_thread_id
         chat_id = exception.update.message.chat.id
-    # Запись данных об ошибке в файл
-    with open("error.txt", "w") as file:
-        # Write the variable to the file
-        file.write(str(exception) + "\n\n" + str(data))
 
-    # Отправка файла с логом ошибки в указанный чат
     try:
-        with open('error.txt', 'rb') as f:
-            # Создаем объект InputFile для передачи в send_document()
-            await bot.send_document(
-                chat_id=ADMIN_ID,
-                document=BufferedInputFile(f.read(), "error.txt"),
-                caption="Мне очень стыдно, но произошла ошибка, подробности в файле.",
-            )
         await bot.send_message(chat_id=chat_id,
                                message_thread_id=message_thread_id,
                                text=f"Кажется что-то пошло не так, попробуйте повторить позже.")
         await state.clear()
     except Exception as e:
-        logging.error(f"Failed to send error log: {e}")
+        logging.error(f"Failed to notify user about error: {e}")
@@ -1,11 +1,52 @@
-from aiogram import Bot, Dispatcher
+from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.redis import RedisStorage
 
-from config import BOT_TOKEN, REDIS_HOST, REDIS_PORT, REDIS_DB
+from config import BOT_TOKEN, TG_API_URL, TG_GLOBAL_RATE, TG_CHAT_RATE, TG_CHAT_BURST, TG_CONCURRENCY, \
+    TG_BULK_RESERVE
+from db.redis_client import AsyncRedisClient, redis_client as default_redis_client
+from tg.metrics import TelegramCallMetrics, track_outbound
+from tg.outbound import OutboundScheduler, RedisRateLimiter
 
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-storage = RedisStorage.from_url(
-    f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}")
-dp = Dispatcher(bot=bot, storage=storage)
+_bot: Bot | None = None
+
+
+def create_bot(redis_client: AsyncRedisClient | None = None) -> Bot:
+    """
+    Бот, все запросы которого проходят через планировщик исходящих сообщений.
+    Планировщик доступен как bot.outbound, его состояние отдаётся в /metrics.
+    :param redis_client: клиент для общих лимитов отправки; процессу, который живёт
+        в своём event loop (задача celery), нужен свой клиент
+    """
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TG_API_URL)) if TG_API_URL else None
+    bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    limiter = RedisRateLimiter(redis_client or default_redis_client,
+                               global_rate=TG_GLOBAL_RATE,
+                               chat_rate=TG_CHAT_RATE,
+                               chat_burst=TG_CHAT_BURST,
+                               bulk_reserve=TG_BULK_RESERVE)
+    bot.outbound = OutboundScheduler(limiter, concurrency=TG_CONCURRENCY)
+    bot.session.middleware(bot.outbound)
+    bot.session.middleware(TelegramCallMetrics())
+    track_outbound(bot.outbound)
+    return bot
+
+
+def get_bot() -> Bot:
+    """
+    Бот веб-процесса. Создаётся при первом обращении, а не при импорте, чтобы модули,
+    которым бот не нужен (celery, alembic), его не создавали.
+    """
+    global _bot
+    if _bot is None:
+        _bot = create_bot()
+    return _bot
+
+
+async def close_bot():
+    global _bot
+    if _bot is not None:
+        await _bot.session.close()
+        _bot = None
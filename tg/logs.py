@@ -0,0 +1,109 @@
+"""
+Структурированное логирование.
+
+Записи из event loop только кладутся в очередь (QueueHandler), а форматирование в JSON
+и запись в поток выполняет отдельный поток QueueListener. Поля апдейта извлекаются
+лениво — уже в потоке логирования, полный payload апдейта пишется только для выборки.
+"""
+import copy
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+
+update_logger = logging.getLogger("tg.updates")
+
+_listener: QueueListener | None = None
+_stream_handler: logging.Handler | None = None
+
+
+class UpdateLogFields:
+    """
+    Поля записи об обработанном апдейте. Вычисляются только при форматировании.
+    """
+    __slots__ = ("event", "handler", "latency", "sampled")
+
+    def __init__(self, event, handler, latency: float, sampled: bool):
+        self.event = event
+        self.handler = handler
+        self.latency = latency
+        self.sampled = sampled
+
+    def as_dict(self) -> dict:
+        from_user = getattr(self.event, "from_user", None)
+        fields = {
+            "user_id": from_user.id if from_user else None,
+            "update_type": type(self.event).__name__,
+            "handler": self.handler.callback.__name__ if self.handler else None,
+            "latency_ms": round(self.latency * 1000, 2),
+        }
+        if self.sampled:
+            fields["payload"] = self.event.model_dump(mode="json", exclude_none=True)
+        return fields
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields is not None:
+            data.update(fields.as_dict() if hasattr(fields, "as_dict") else fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return orjson.dumps(data).decode()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке. Стандартный prepare() вызывает
+    format(): трейсбек форматировался бы в event loop и попадал бы в message.
+    Здесь подставляются только аргументы сообщения, exc_info передаётся как есть.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # Аргументы могут измениться, пока запись ждёт в очереди
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level: int | str = logging.INFO):
+    """
+    Переводит корневой логгер на очередь и запускает поток, который пишет JSON в stderr.
+    """
+    global _listener, _stream_handler
+    if _listener is not None:
+        return
+
+    records = queue.SimpleQueue()
+    _stream_handler = logging.StreamHandler()
+    _stream_handler.setFormatter(JsonFormatter())
+    _listener = QueueListener(records, _stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(records)]
+    root.setLevel(level)
+
+
+def stop_logging():
+    """
+    Дописывает оставшиеся записи и останавливает поток логирования. Дальнейшие записи
+    пишутся в stderr напрямую, иначе они остались бы в очереди без обработчика.
+    """
+    global _listener
+    if _listener is not None:
+        # Сначала переключаем логгер, потом дописываем очередь: так не теряется ни одна запись
+        logging.getLogger().handlers = [_stream_handler]
+        _listener.stop()
+        _listener = None
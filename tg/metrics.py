@@ -0,0 +1,189 @@
+"""
+Метрики Prometheus по хэндлерам бота.
+
+На каждый апдейт записываются время обработки, число SQL-запросов, команд redis и
+вызовов Bot API. Метка handler — модуль и имя функции хэндлера ("box.select_box_root"),
+а не данные апдейта, поэтому число рядов ограничено числом хэндлеров. Метрики отдаются
+эндпоинтом /metrics (см. main.py).
+
+Там же отдаётся состояние планировщика исходящих запросов (tg/outbound.py): глубина
+очередей, запросы в полёте, повторы и ответы 429. Эти значения планировщик считает сам,
+и они снимаются с него в момент запроса /metrics (см. OutboundCollector).
+
+При нескольких воркерах uvicorn нужно задать PROMETHEUS_MULTIPROC_DIR — тогда
+/metrics собирает значения всех процессов. Метрики планировщика в этом режиме
+отдаёт только процесс, ответивший на запрос, с меткой pid.
+"""
+import os
+import time
+import weakref
+from collections import Counter as CallCounter
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.methods import TelegramMethod, Response
+from aiogram.methods.base import TelegramType
+from prometheus_client import Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest
+from prometheus_client import multiprocess, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from prometheus_client.registry import Collector
+
+from db.db_config import track_queries
+from db.redis_client import track_commands
+from db.slow_queries import query_source
+from tg.outbound import OutboundScheduler
+
+# Апдейт, для которого не нашлось хэндлера
+UNHANDLED = "unhandled"
+# Вызовы Bot API вне обработки апдейта: сводки об ошибках, рассылки
+BACKGROUND = "background"
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Update processing time by handler", ["handler"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Updates whose processing raised an exception", ["handler"])
+HANDLER_SQL_QUERIES = Counter("bot_handler_sql_queries_total", "SQL statements executed by handler", ["handler"])
+HANDLER_REDIS_COMMANDS = Counter("bot_handler_redis_commands_total", "Redis commands sent by handler", ["handler"])
+TELEGRAM_CALLS = Counter("bot_telegram_calls_total", "Bot API requests by handler and method", ["handler", "method"])
+
+
+class UpdateMetrics:
+    """
+    Хэндлер и вызовы Bot API текущего апдейта.
+    """
+    __slots__ = ("handler", "telegram_calls")
+
+    def __init__(self):
+        self.handler = UNHANDLED
+        self.telegram_calls: CallCounter[str] = CallCounter()
+
+
+_current: ContextVar[UpdateMetrics | None] = ContextVar("update_metrics", default=None)
+
+
+def handler_label(handler: HandlerObject) -> str:
+    callback = handler.callback
+    return f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Outer-middleware апдейта: измеряет обработку целиком, включая загрузку и запись FSM,
+    поэтому подключается раньше FSM-middleware.
+    """
+
+    async def __call__(self, handler, event, data):
+        metrics = UpdateMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with track_queries() as queries, track_commands() as commands:
+                return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(metrics.handler).inc()
+            raise
+        finally:
+            _current.reset(token)
+            label = metrics.handler
+            HANDLER_LATENCY.labels(label).observe(time.perf_counter() - started)
+            HANDLER_SQL_QUERIES.labels(label).inc(queries.count)
+            HANDLER_REDIS_COMMANDS.labels(label).inc(commands.count)
+            for method, count in metrics.telegram_calls.items():
+                TELEGRAM_CALLS.labels(label, method).inc(count)
+
+
+class HandlerLabelMiddleware(BaseMiddleware):
+    """
+    Inner-middleware событий: сообщает UpdateMetricsMiddleware и журналу медленных
+    запросов, какой хэндлер выбран.
+    """
+
+    async def __call__(self, handler, event, data):
+        if data.get("handler") is None:
+            return await handler(event, data)
+        label = handler_label(data["handler"])
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.handler = label
+        with query_source(label):
+            return await handler(event, data)
+
+
+class TelegramCallMetrics(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: считает запросы к Bot API по методам. Подключается после
+    OutboundScheduler, поэтому повторы после RetryAfter тоже засчитываются.
+    """
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.telegram_calls[method.__api_method__] += 1
+        else:
+            TELEGRAM_CALLS.labels(BACKGROUND, method.__api_method__).inc()
+        return await make_request(bot, method)
+
+
+class OutboundCollector(Collector):
+    """
+    Снимает OutboundScheduler.metrics() со всех живых планировщиков процесса и суммирует.
+    Планировщики хранятся по слабым ссылкам: бот celery-задачи живёт одну задачу.
+    """
+
+    def __init__(self, pid_label: bool = False):
+        self.pid_label = pid_label
+
+    def collect(self):
+        labels = ["pid"] if self.pid_label else []
+        values = [str(os.getpid())] if self.pid_label else []
+        queue_depth = GaugeMetricFamily("bot_outbound_queue_depth", "Requests waiting for a rate limit token",
+                                        labels=[*labels, "priority"])
+        in_flight = GaugeMetricFamily("bot_outbound_in_flight", "Bot API requests in progress", labels=labels)
+        counters = {
+            "sent": CounterMetricFamily("bot_outbound_sent", "Bot API requests sent", labels=labels),
+            "retried": CounterMetricFamily("bot_outbound_retries", "Bot API requests retried", labels=labels),
+            "failed": CounterMetricFamily("bot_outbound_failed", "Bot API requests failed after retries",
+                                          labels=labels),
+            "rate_limited": CounterMetricFamily("bot_outbound_rate_limited", "Bot API 429 (RetryAfter) responses",
+                                                labels=labels),
+            "queue_wait_seconds_total": CounterMetricFamily("bot_outbound_queue_wait_seconds",
+                                                            "Time requests spent waiting in the queue",
+                                                            labels=labels),
+        }
+
+        snapshots = [scheduler.metrics() for scheduler in list(_schedulers)]
+        for priority in dict.fromkeys(name for snapshot in snapshots for name in snapshot["queue_depth"]):
+            queue_depth.add_metric([*values, priority],
+                                   sum(snapshot["queue_depth"][priority] for snapshot in snapshots))
+        in_flight.add_metric(values, sum(snapshot["in_flight"] for snapshot in snapshots))
+        for key, family in counters.items():
+            family.add_metric(values, sum(snapshot[key] for snapshot in snapshots))
+        yield from (queue_depth, in_flight, *counters.values())
+
+
+_schedulers: weakref.WeakSet[OutboundScheduler] = weakref.WeakSet()
+REGISTRY.register(OutboundCollector())
+
+
+def track_outbound(scheduler: OutboundScheduler):
+    """
+    Добавляет планировщик бота в метрики /metrics.
+    """
+    _schedulers.add(scheduler)
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Метрики в текстовом формате Prometheus и их content-type.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(OutboundCollector(pid_label=True))
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
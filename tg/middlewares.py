@@ -1,5 +1,7 @@
 import logging
 import asyncio
+import random
+import time
 from typing import List, Union, Callable, Any, Awaitable
 
 from aiogram import types
@@ -9,13 +11,47 @@ from aiogram import BaseMiddleware
 from aiogram.dispatcher.event.bases import CancelHandler
 from aiogram.types import Message
 
+from db.db_config import track_queries
+from tg.logs import UpdateLogFields, update_logger
+
 
 class LoggingMiddleware(BaseMiddleware):
+    """
+    Структурированная запись об обработке сообщения или нажатия кнопки: пользователь, тип,
+    хэндлер и время обработки. Полный апдейт пишется только для доли sample_rate событий.
+    Поля вычисляются в потоке логирования (см. tg/logs.py), а не в event loop.
+    """
+
+    def __init__(self, sample_rate: float = 0.0):
+        self.sample_rate = sample_rate
+
     async def __call__(self, handler, event, data):
-        # Проверяем, что событие является сообщением
-        if isinstance(event, types.Message | types.CallbackQuery):
-            # Логируем событие
-            logging.info(f"Event from {event.from_user.id}: {event}")
+        if not update_logger.isEnabledFor(logging.INFO):
+            return await handler(event, data)
+
+        started = time.perf_counter()
+        try:
+            # Вызываем следующий обработчик в цепочке
+            return await handler(event, data)
+        finally:
+            fields = UpdateLogFields(event, data.get("handler"), time.perf_counter() - started,
+                                     sampled=random.random() < self.sample_rate)
+            update_logger.info("update handled", extra={"fields": fields})
+
+
+class QueryBudgetMiddleware(BaseMiddleware):
+    """
+    Следит, чтобы обработка одного апдейта не выходила за бюджет SQL-запросов.
+    """
+
+    def __init__(self, budget: int, strict: bool = False):
+        self.budget = budget
+        self.strict = strict
 
-        # Вызываем следующий обработчик в цепочке
-        await handler(event, data)
+    async def __call__(self, handler, event: types.Update, data):
+        with track_queries(self.budget, self.strict) as stats:
+            result = await handler(event, data)
+        if stats.exceeded:
+            logging.warning(f"Update {event.update_id} ({event.event_type}) executed {stats.count} SQL queries, "
+                            f"budget is {self.budget}")
+        return result
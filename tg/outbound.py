@@ -0,0 +1,318 @@
+"""
+Планировщик исходящих запросов к Bot API.
+
+Подключается как middleware сессии бота, поэтому через него проходят все вызовы:
+bot.send_message, message.answer, edit_text и т.д. Ограничения:
+- общий token bucket (~30 сообщений в секунду на бота);
+- token bucket на каждый чат (~1 сообщение в секунду с небольшим запасом);
+- не больше concurrency одновременных запросов.
+
+Корзины хранятся в redis и списываются Lua-скриптом атомарно (см. RedisRateLimiter),
+поэтому лимит общий для всех воркеров uvicorn и задач celery. Очереди и concurrency —
+свои у каждого процесса. Интерактивные ответы обслуживаются раньше массовых рассылок
+(см. bulk_priority): внутри процесса — порядком очередей, между процессами — резервом
+общей корзины, который рассылки не трогают, пока где-то идут интерактивные ответы.
+"""
+import asyncio
+import contextlib
+import itertools
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from enum import IntEnum
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError, TelegramEntityTooLarge
+from aiogram.methods import TelegramMethod, Response
+from aiogram.methods.base import TelegramType
+from redis.exceptions import RedisError
+
+from db.redis_client import AsyncRedisClient
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+
+_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.INTERACTIVE)
+
+
+@contextlib.contextmanager
+def bulk_priority():
+    """
+    Запросы внутри блока (и в запущенных из него задачах) обслуживаются после интерактивных.
+    """
+    token = _priority.set(Priority.BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# Корзина — хэш {tokens, updated, blocked_until, interactive}, время в миллисекундах по часам redis.
+# KEYS: общая корзина, корзина чата (необязательна).
+# ARGV: скорость и ёмкость общей корзины, скорость и ёмкость корзины чата, 1 для рассылки,
+# резерв общей корзины для интерактивных ответов, сколько мс после интерактивного ответа действует резерв.
+# Возвращает {0, 0}, если токены списаны из обеих корзин, иначе {ожидание в мс, 1 — общая корзина | 2 — чат}.
+_ACQUIRE = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local function load(key, rate, capacity)
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated', 'blocked_until', 'interactive')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate / 1000)
+    return tokens, tonumber(bucket[3]) or 0, tonumber(bucket[4]) or 0
+end
+
+local function wait(tokens, need, rate, blocked_until)
+    local delay = 0
+    if tokens < need then
+        delay = math.ceil((need - tokens) * 1000 / rate)
+    end
+    return math.max(delay, blocked_until - now)
+end
+
+local function store(key, tokens, rate, capacity, blocked_until)
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', now)
+    local ttl = math.max(math.ceil((capacity - tokens) * 1000 / rate), blocked_until - now) + 1000
+    redis.call('PEXPIRE', key, ttl)
+end
+
+local global_rate, global_capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+local chat_rate, chat_capacity = tonumber(ARGV[3]), tonumber(ARGV[4])
+local bulk, reserve, window = ARGV[5] == '1', tonumber(ARGV[6]), tonumber(ARGV[7])
+
+local tokens, blocked_until, interactive = load(KEYS[1], global_rate, global_capacity)
+local need = 1
+if bulk and now - interactive < window then
+    need = 1 + reserve
+end
+local delay = wait(tokens, need, global_rate, blocked_until)
+if delay > 0 then
+    return {delay, 1}
+end
+
+local chat_tokens, chat_blocked_until
+if KEYS[2] then
+    chat_tokens, chat_blocked_until = load(KEYS[2], chat_rate, chat_capacity)
+    delay = wait(chat_tokens, 1, chat_rate, chat_blocked_until)
+    if delay > 0 then
+        return {delay, 2}
+    end
+    store(KEYS[2], chat_tokens - 1, chat_rate, chat_capacity, chat_blocked_until)
+end
+store(KEYS[1], tokens - 1, global_rate, global_capacity, blocked_until)
+if not bulk then
+    redis.call('HSET', KEYS[1], 'interactive', now)
+end
+return {0, 0}
+"""
+
+# KEYS: корзина. ARGV: на сколько мс запретить отправку.
+_BLOCK = """
+local time = redis.call('TIME')
+local blocked_until = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000) + tonumber(ARGV[1])
+if blocked_until > (tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0) then
+    redis.call('HSET', KEYS[1], 'blocked_until', blocked_until)
+end
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) + 1000 then
+    redis.call('PEXPIRE', KEYS[1], tonumber(ARGV[1]) + 1000)
+end
+"""
+
+
+class RedisRateLimiter:
+    """
+    Общие для всех процессов корзины токенов в redis: одна на бота и по одной на чат.
+    """
+
+    def __init__(self,
+                 redis_client: AsyncRedisClient,
+                 global_rate: float = 30,
+                 chat_rate: float = 1,
+                 chat_burst: float = 3,
+                 bulk_reserve: float = 10,
+                 interactive_window: float = 1,
+                 prefix: str = "outbound"):
+        """
+        :param bulk_reserve: сколько токенов общей корзины рассылки оставляют интерактивным ответам
+        :param interactive_window: сколько секунд после интерактивного ответа действует резерв
+        """
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        # Резерв меньше ёмкости, иначе рассылка не получила бы токен никогда
+        self.bulk_reserve = max(0.0, min(bulk_reserve, global_rate - 1))
+        self.interactive_window = interactive_window
+        self.global_key = f"{prefix}:global"
+        self.chat_prefix = f"{prefix}:chat:"
+        self._acquire_script = redis_client.redis.register_script(_ACQUIRE)
+        self._block_script = redis_client.redis.register_script(_BLOCK)
+
+    async def acquire(self, chat_id: int | str | None, priority: Priority) -> tuple[float, bool]:
+        """
+        Пытается списать токены общей корзины и корзины чата.
+        :return: 0, если отправлять можно; иначе сколько секунд ждать и упёрлись ли в лимит чата
+        """
+        keys = [self.global_key] if chat_id is None else [self.global_key, f"{self.chat_prefix}{chat_id}"]
+        delay, limited_by = await self._acquire_script(keys=keys, args=[
+            self.global_rate, self.global_rate, self.chat_rate, self.chat_burst,
+            int(priority == Priority.BULK), self.bulk_reserve, int(self.interactive_window * 1000),
+        ])
+        return delay / 1000, limited_by == 2
+
+    async def block(self, chat_id: int | str | None, seconds: float):
+        """
+        Запрещает отправку в чат (или всю отправку бота) на seconds секунд — после ответа 429.
+        """
+        key = self.global_key if chat_id is None else f"{self.chat_prefix}{chat_id}"
+        await self._block_script(keys=[key], args=[int(seconds * 1000)])
+
+
+class _Waiter:
+    __slots__ = ("chat_id", "future", "enqueued")
+
+    def __init__(self, chat_id: int | str | None, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    # Сколько ожидающих запросов просматривается в поисках чата со свободным токеном
+    SCAN_LIMIT = 50
+
+    def __init__(self,
+                 limiter: RedisRateLimiter,
+                 concurrency: int = 20,
+                 max_retries: int = 3):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._queues: dict[Priority, deque[_Waiter]] = {priority: deque() for priority in Priority}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._pump_task: asyncio.Task | None = None
+        self._in_flight = 0
+        self._counters = {"sent": 0, "retried": 0, "failed": 0, "rate_limited": 0}
+        self._wait_seconds = 0.0
+
+    def metrics(self) -> dict:
+        """
+        Текущая глубина очередей по приоритетам и счётчики запросов.
+        """
+        return {
+            "queue_depth": {priority.name.lower(): len(queue) for priority, queue in self._queues.items()},
+            "in_flight": self._in_flight,
+            "queue_wait_seconds_total": self._wait_seconds,
+            **self._counters,
+        }
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        priority = _priority.get()
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, priority)
+            try:
+                async with self._semaphore:
+                    self._in_flight += 1
+                    try:
+                        response = await make_request(bot, method)
+                    finally:
+                        self._in_flight -= 1
+                self._counters["sent"] += 1
+                return response
+            except TelegramRetryAfter as e:
+                # Telegram сам сообщает, сколько ждать: блокируем чат (или всю отправку) во всех процессах
+                self._counters["rate_limited"] += 1
+                with contextlib.suppress(RedisError):
+                    await self.limiter.block(chat_id, e.retry_after)
+                delay = 0
+                error = e
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if isinstance(e, TelegramEntityTooLarge):
+                    raise
+                delay = 2 ** attempt
+                error = e
+
+            attempt += 1
+            if attempt > self.max_retries:
+                self._counters["failed"] += 1
+                raise error
+            self._counters["retried"] += 1
+            logging.warning(f"Retrying {type(method).__name__} to {chat_id} ({attempt}/{self.max_retries}): {error}")
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def _acquire(self, chat_id: int | str | None, priority: Priority):
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(chat_id, future)
+        self._queues[priority].append(waiter)
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            with contextlib.suppress(ValueError):
+                self._queues[priority].remove(waiter)
+            raise
+        self._wait_seconds += time.monotonic() - waiter.enqueued
+
+    async def _take(self, waiter: _Waiter, priority: Priority) -> tuple[float, bool]:
+        try:
+            return await self.limiter.acquire(waiter.chat_id, priority)
+        except RedisError as e:
+            # Без redis лимиты не проверить; не держим ответы — от флуда защищает обработка 429
+            logging.warning(f"Outbound rate limiter is unavailable, sending without a limit: {e!r}")
+            return 0.0, False
+
+    async def _next_ready(self) -> tuple[tuple[_Waiter, Priority] | None, float]:
+        """
+        Первый по приоритету запрос, для которого удалось списать токены,
+        и минимальное ожидание, если таких нет.
+        """
+        min_delay = 1.0
+        for priority, queue in self._queues.items():
+            limited_chats = set()
+            # Копия: пока идёт запрос к redis, очередь пополняется
+            for waiter in list(itertools.islice(queue, self.SCAN_LIMIT)):
+                if waiter.future.done() or waiter.chat_id in limited_chats:
+                    continue
+                delay, chat_limited = await self._take(waiter, priority)
+                if delay <= 0:
+                    return (waiter, priority), 0.0
+                if not chat_limited:
+                    # Кончилась общая корзина: более низкий приоритет тоже ждёт
+                    return None, delay
+                limited_chats.add(waiter.chat_id)
+                min_delay = min(min_delay, delay)
+        return None, min_delay
+
+    async def _pump(self):
+        while True:
+            if not any(self._queues.values()):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            ready, delay = await self._next_ready()
+            if ready is None:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                continue
+
+            waiter, priority = ready
+            with contextlib.suppress(ValueError):
+                self._queues[priority].remove(waiter)
+            if not waiter.future.done():
+                waiter.future.set_result(None)
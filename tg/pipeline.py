@@ -0,0 +1,73 @@
+"""
+Фоновая обработка апдейтов для режима быстрого ответа вебхука.
+
+Вебхук кладёт апдейт в очередь и сразу отвечает телеграму. Очереди разбиты на шарды
+по id отправителя, каждый шард обслуживает один воркер: апдейты одного пользователя
+обрабатываются строго по порядку, разных пользователей — параллельно.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from aiogram.types import Update
+
+UpdateHandler = Callable[[Update, int | None], Awaitable[None]]
+
+
+class UpdatePipeline:
+    def __init__(self, handler: UpdateHandler, workers: int = 16, queue_size: int = 1000):
+        self.handler = handler
+        self.workers = workers
+        self.shard_size = max(1, queue_size // workers)
+        self._queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def submit(self, update: Update, from_id: int | None) -> bool:
+        """
+        Ставит апдейт в очередь. Возвращает False, если очередь шарда заполнена
+        и апдейт нужно отклонить (телеграм доставит его повторно).
+        """
+        key = from_id if from_id is not None else update.update_id
+        try:
+            self._queues[key % self.workers].put_nowait((update, from_id))
+        except asyncio.QueueFull:
+            logging.warning(f"Update queue is full, shedding update {update.update_id}")
+            return False
+        return True
+
+    async def start(self):
+        self._queues = [asyncio.Queue(maxsize=self.shard_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def join(self):
+        """
+        Дожидается обработки всех уже принятых апдейтов.
+        """
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def stop(self, timeout: float = 10):
+        """
+        Дожидается обработки уже принятых апдейтов (не дольше timeout) и останавливает воркеры.
+        """
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Update pipeline stopped with {self.depth} unprocessed updates")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update, from_id = await queue.get()
+            try:
+                await self.handler(update, from_id)
+            except Exception:
+                logging.exception(f"Failed to process update {update.update_id}")
+            finally:
+                queue.task_done()
@@ -0,0 +1,182 @@
+"""
+Профилирование живого веб-процесса по команде администратора (см. tg/handlers/admin.py).
+
+Режим cpu — статистический сэмплер: отдельный поток несколько десятков раз в секунду
+снимает стек потока event loop через sys._current_frames(). Код приложения не
+инструментируется, поэтому накладные расходы малы и не зависят от нагрузки. Стеки
+группируются по хэндлеру aiogram, в котором находился event loop в момент снимка,
+и сохраняются в формате collapsed stacks (flamegraph.pl, speedscope.app).
+
+Режим memory — разница двух снимков tracemalloc в начале и в конце интервала:
+места, где выделенная память выросла сильнее всего.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from aiogram import Router
+
+from tg.metrics import handler_label
+
+# Стек без хэндлера: event loop ждёт ввода-вывода
+IDLE = "[idle]"
+# Стек без хэндлера: код вне апдейтов (фоновые задачи, ответы FastAPI и т.д.)
+OTHER = "[other]"
+_IDLE_FUNCTIONS = {"select", "poll", "run_forever", "run_until_complete", "_run_once"}
+
+
+def handler_codes(router: Router) -> dict:
+    """
+    Объекты кода всех хэндлеров диспатчера и их метки (как в метриках).
+    """
+    root = list(router.chain_head)[-1]
+    codes = {}
+    for child in root.chain_tail:
+        for observer in child.observers.values():
+            for handler in observer.handlers:
+                # Методы самих роутеров (Dispatcher._listen_update) — обвязка, а не хэндлеры
+                if isinstance(getattr(handler.callback, "__self__", None), Router):
+                    continue
+                code = getattr(handler.callback, "__code__", None)
+                if code is not None:
+                    codes[code] = handler_label(handler)
+    return codes
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    if "site-packages" + os.sep in path:
+        path = path.rsplit("site-packages" + os.sep, 1)[1]
+    elif os.path.isabs(path):
+        path = os.path.relpath(path)
+    return f"{path}:{code.co_qualname}"
+
+
+class SamplingProfiler:
+    def __init__(self, handlers: dict, interval: float = 0.01):
+        """
+        :param handlers: объекты кода хэндлеров и их метки, см. handler_codes
+        :param interval: период снимков, в секундах
+        """
+        self.handlers = handlers
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._thread_id: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        """
+        Запускает сэмплер для текущего потока (вызывается из event loop).
+        """
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+                self.samples += 1
+
+    def _collapse(self, frame) -> str:
+        innermost = frame.f_code
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+
+        # Внешний фрейм хэндлера: всё, что выше него, — обвязка asyncio и aiogram
+        for index, code in enumerate(codes):
+            if code in self.handlers:
+                return ";".join([self.handlers[code], *map(_frame_label, codes[index:])])
+        if innermost.co_name in _IDLE_FUNCTIONS:
+            return IDLE
+        return ";".join([OTHER, *map(_frame_label, codes)])
+
+    def collapsed(self) -> str:
+        """
+        Стеки в формате collapsed stacks: "хэндлер;фрейм;фрейм количество".
+        """
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def summary(self, limit: int = 10) -> str:
+        """
+        Доля снимков по хэндлерам.
+        """
+        by_handler = Counter()
+        for stack, count in self.stacks.items():
+            by_handler[stack.split(";", 1)[0]] += count
+        total = self.samples or 1
+        return "\n".join(f"{count * 100 / total:5.1f}% {handler}" for handler, count in by_handler.most_common(limit))
+
+
+async def profile_cpu(router: Router, seconds: float, interval: float = 0.01) -> tuple[str, str]:
+    """
+    Сэмплирует event loop в течение seconds секунд. Возвращает collapsed stacks и сводку.
+    """
+    profiler = SamplingProfiler(handler_codes(router), interval)
+    profiler.start()
+    started = time.monotonic()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.to_thread(profiler.stop)
+    summary = (f"Снимков: {profiler.samples} за {time.monotonic() - started:.0f} с\n"
+               f"{profiler.summary()}")
+    return profiler.collapsed(), summary
+
+
+async def profile_memory(seconds: float, frames: int = 10, limit: int = 50) -> tuple[str, str]:
+    """
+    Разница снимков tracemalloc за seconds секунд. Возвращает отчёт и сводку.
+    Если tracemalloc был выключен, он включается только на время замера.
+    """
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(frames)
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    return await asyncio.to_thread(_memory_report, before, after, limit)
+
+
+def _memory_report(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int) -> tuple[str, str]:
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ]
+    before, after = before.filter_traces(filters), after.filter_traces(filters)
+    diff = after.compare_to(before, "traceback")
+    growth = sum(stat.size_diff for stat in diff)
+
+    lines = [f"Прирост памяти: {growth / 1024:.1f} KiB", ""]
+    for stat in diff[:limit]:
+        lines.append(f"{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} блоков), "
+                     f"всего {stat.size / 1024:.1f} KiB")
+        lines += [f"    {line}" for line in stat.traceback.format()]
+        lines.append("")
+    top = diff[0].traceback[0] if diff else None
+    summary = f"Прирост памяти: {growth / 1024:.1f} KiB"
+    if top is not None:
+        summary += f"\nБольше всего: {top.filename}:{top.lineno} ({diff[0].size_diff / 1024:+.1f} KiB)"
+    return "\n".join(lines), summary